@@ -0,0 +1,93 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Runs the native PDF mode (analyzedoc: start, check until done, collect) against the
+# asynchronous Textract stub and an in-memory S3, checks every page's output against parsing
+# that page on its own, and compares the API calls made with the per-page mode.
+#
+#   python benchmarks/bench_async_textract.py [pages] [blocks_per_page]
+
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEPLOY_CODE = os.path.join(HERE, "..", "deploy_code")
+sys.path.insert(0, os.path.join(DEPLOY_CODE, "multipagepdfa2i_layer", "python"))
+
+from textract_blocks import extract_key_values
+from fake_textract import FakeAsyncTextract
+
+def load_handler(name):
+    # every lambda's module is called lambda_function, so load it under its own name
+    path = os.path.join(DEPLOY_CODE, "multipagepdfa2i_" + name, "lambda_function.py")
+    spec = importlib.util.spec_from_file_location(name + "_lambda_function", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class MemoryS3:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.objects = {}
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        with self.lock:
+            self.objects[(Bucket, Key)] = Body
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    blocks_per_page = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    analyzedoc = load_handler("analyzedoc")
+    textract = FakeAsyncTextract(pages, blocks_per_page)
+    s3 = MemoryS3()
+    event = {"id": "0123456789abcdef", "bucket": "bucket", "key": "uploads/document.pdf"}
+
+    start = time.perf_counter()
+    job = analyzedoc.start(textract, event)
+    # a retried start must not start a second job
+    assert analyzedoc.start(textract, event) == job
+    checks = 1
+    while analyzedoc.check(textract, job)["status"] == "IN_PROGRESS":
+        checks += 1
+    image_keys = analyzedoc.collect(textract, s3, dict(event, **job))
+    seconds = time.perf_counter() - start
+
+    assert image_keys == [str(page) for page in range(pages)]
+    for page, response in enumerate(textract.page_responses):
+        key = analyzedoc.get_page_key(event["id"], page + 1)
+        assert json.loads(s3.objects[("bucket", key)]) == extract_key_values(response), key
+
+    print(json.dumps({
+        "pages": pages,
+        "blocks": len(textract.blocks),
+        "seconds": round(seconds, 3),
+        "status_checks": checks,
+        "get_document_analysis": textract.gets,
+        "outputs_written": len(s3.objects),
+        # the page mode makes one SQS message, lambda invocation and AnalyzeDocument call per page
+        "page_mode_analyze_document": pages
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Cold start report for the python lambdas.
+#
+# Each handler is imported in a fresh interpreter, like a new execution environment, and the
+# time to import it and to get each client it uses is measured: the first (cold) call builds
+# the client, later (warm) calls reuse it. The per-call cost of building a new boto3 client,
+# which the handlers paid on every call before the shared clients module, is shown alongside.
+#
+# Then, in another fresh interpreter, the handlers run two small documents through the
+# simulator (simulator.py) with one execution environment per lambda and the local stand-ins
+# for every client, answering without latency, and the first (cold) call of each handler is
+# timed against its second (warm) call: what is left is the handler's own first call work.
+#
+#   python benchmarks/bench_cold_start.py
+
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEPLOY_CODE = os.path.join(HERE, "..", "deploy_code")
+
+HANDLERS = {
+    "kickoff": ["stepfunctions", "sqs"],
+    "analyzepdf": ["textract", "s3", "dynamodb", "stepfunctions", "sqs"],
+    "humancomplete": ["s3", "stepfunctions"],
+    "wrapup": ["s3"]
+}
+
+PROBE = """
+import json, sys, time
+sys.path[:0] = [sys.argv[1], sys.argv[2]]
+start = time.perf_counter()
+import lambda_function
+import_time = time.perf_counter() - start
+import boto3, clients
+services = {}
+for name in sys.argv[3:]:
+    start = time.perf_counter()
+    clients.client(name)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    clients.client(name)
+    warm = time.perf_counter() - start
+    start = time.perf_counter()
+    boto3.client(name)
+    fresh = time.perf_counter() - start
+    services[name] = {"cold": cold, "warm": warm, "fresh": fresh}
+print(json.dumps({"import": import_time, "services": services}))
+"""
+
+# one environment per lambda, every call instant and no Textract pacing, two documents so
+# wrapup runs twice
+CALLS_PROBE = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+import simulator
+calls = {}
+load_handler = simulator.load_handler
+def timed_load(name, instance=0):
+    module = load_handler(name, instance)
+    handler = module.lambda_handler
+    def timed_handler(event, context):
+        start = time.perf_counter()
+        try:
+            return handler(event, context)
+        finally:
+            calls.setdefault(name, []).append(time.perf_counter() - start)
+    module.lambda_handler = timed_handler
+    return module
+simulator.load_handler = timed_load
+latencies = ["s3_latency", "sqs_latency", "dynamodb_latency", "stepfunctions_latency", "textract_latency",
+    "pagecount_seconds", "render_seconds_per_page"]
+config = dict({name: 0.0 for name in latencies}, kickoff_concurrency=1, analyzepdf_concurrency=1,
+    human_review_rate=0.5, review_latency=0.05, textract_limit_tps=1000,
+    environment={"textract_tps": "1000", "textract_max_tps": "1000"})
+report = simulator.Simulator(config).run([(0.0, "cold-1.pdf", 10, 1), (2.0, "cold-2.pdf", 10, 2)])
+print(json.dumps({"succeeded": report["succeeded"], "calls": calls}))
+"""
+
+def probe(handler, services):
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    output = subprocess.check_output([
+        sys.executable, "-c", PROBE,
+        os.path.join(DEPLOY_CODE, "multipagepdfa2i_layer", "python"),
+        os.path.join(DEPLOY_CODE, "multipagepdfa2i_" + handler)
+    ] + services, env=env)
+    return json.loads(output)
+
+def probe_calls():
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    return json.loads(subprocess.check_output([sys.executable, "-c", CALLS_PROBE, HERE], env=env))
+
+def main():
+    print("%-14s %-14s %10s %10s %10s %12s" % ("handler", "client", "import ms", "cold ms", "warm ms", "new client ms"))
+    for handler, services in HANDLERS.items():
+        report = probe(handler, services)
+        print("%-14s %-14s %10.1f" % (handler, "-", report["import"] * 1000))
+        for name, timing in report["services"].items():
+            print("%-14s %-14s %10s %10.2f %10.4f %12.2f" % (
+                "", name, "", timing["cold"] * 1000, timing["warm"] * 1000, timing["fresh"] * 1000))
+
+    report = probe_calls()
+    print()
+    print("handler calls against stubbed clients, %d documents succeeded" % report["succeeded"])
+    print("%-14s %8s %14s %15s" % ("handler", "calls", "first call ms", "second call ms"))
+    for handler in HANDLERS:
+        calls = report["calls"].get(handler, [])
+        first = "%.2f" % (calls[0] * 1000) if calls else "-"
+        second = "%.2f" % (calls[1] * 1000) if len(calls) > 1 else "-"
+        print("%-14s %8d %14s %15s" % (handler, len(calls), first, second))
+
+if __name__ == "__main__":
+    main()
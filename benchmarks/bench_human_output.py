@@ -0,0 +1,76 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Peak memory and time of reading an A2I human loop output: the whole-object
+# read + json.loads path against the streaming path used by humancomplete.
+#
+#   python benchmarks/bench_human_output.py [block_count ...]
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "deploy_code", "multipagepdfa2i_layer", "python"))
+sys.path.insert(0, os.path.join(HERE, "..", "deploy_code", "multipagepdfa2i_humancomplete"))
+
+import synthetic
+from stream_data import read_human_output
+from textract_blocks import extract_key_values
+
+def full_read(path):
+    with open(path, "rb") as body:
+        response = json.loads(body.read())
+    data = response["humanAnswers"][0]["answerContent"]["AWS/Textract/AnalyzeDocument/Forms/V1"]
+    name = response["inputContent"]["aiServiceRequest"]["document"]["s3Object"]["name"]
+    return response["humanLoopName"], name, extract_key_values(data)
+
+def streamed_read(path):
+    with open(path, "rb") as body:
+        return read_human_output(body)
+
+def measure(fn, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main(sizes):
+    print("%-8s %10s %14s %14s %10s %10s" % ("blocks", "object MB", "full peak MB", "stream peak MB", "full s", "stream s"))
+    for size in sizes:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as out:
+            json.dump(synthetic.a2i_output(size, kv_density=0.8), out)
+        try:
+            full, full_time, full_peak = measure(full_read, out.name)
+            streamed, stream_time, stream_peak = measure(streamed_read, out.name)
+            if full != streamed:
+                raise AssertionError("streamed output differs at " + str(size) + " blocks")
+            print("%-8d %10.1f %14.1f %14.1f %10.3f %10.3f" % (
+                size, os.path.getsize(out.name) / 1e6, full_peak / 1e6, stream_peak / 1e6, full_time, stream_time))
+        finally:
+            os.remove(out.name)
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000, 50000])
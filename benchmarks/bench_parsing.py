@@ -0,0 +1,77 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Compares the shared single-pass parser against the old per-lambda clean_data modules.
+#
+#   python benchmarks/bench_parsing.py [block_count ...]
+
+import gc
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "deploy_code", "multipagepdfa2i_layer", "python"))
+
+import synthetic
+from legacy import analyzepdf_clean_data, humancomplete_clean_data
+from textract_blocks import extract_key_values
+
+def best_of(fn, arg, repeat):
+    best = None
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(arg)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        gc.enable()
+    return best
+
+def human_kv_list(payload):
+    return extract_key_values(payload["response"]["humanAnswers"][0]["answerContent"]["AWS/Textract/AnalyzeDocument/Forms/V1"])
+
+def pairs(kv_list):
+    # the legacy parsers only return key and value
+    return [(item["key"], item["value"]) for item in kv_list]
+
+def main(sizes):
+    print("%-8s %-22s %12s %12s %8s" % ("blocks", "parser", "legacy ms", "shared ms", "speedup"))
+    for size in sizes:
+        repeat = max(3, 200000 // size)
+        ai = synthetic.textract_response(size, kv_density=0.8)
+        human = {"response": synthetic.a2i_output(size, kv_density=0.8)}
+
+        cases = [
+            ("extract_data", analyzepdf_clean_data.extract_data, extract_key_values, ai),
+            ("create_human_kv_list", humancomplete_clean_data.create_human_kv_list, human_kv_list, human)
+        ]
+        for name, legacy, shared, arg in cases:
+            if pairs(legacy(arg)) != pairs(shared(arg)):
+                raise AssertionError(name + " output differs at " + str(size) + " blocks")
+            before = best_of(legacy, arg, repeat)
+            after = best_of(shared, arg, repeat)
+            print("%-8d %-22s %12.3f %12.3f %7.2fx" % (size, name, before * 1000, after * 1000, before / after))
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000, 20000, 50000])
@@ -0,0 +1,193 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Time and peak memory per page of the result parsers on the per-page hot path, over
+# synthetic Textract responses and A2I outputs of 100 to 50,000 blocks at several KEY/VALUE
+# densities:
+#
+# - extract_data: analyzepdf's parse of an AnalyzeDocument response (extract_key_values)
+# - create_human_kv_list: humancomplete's parse of a loaded A2I output
+# - read_human_output: humancomplete's streaming read of the A2I output object
+#
+# Results are written as JSON with --output and compared against a stored baseline with
+# --baseline (benchmarks/baselines/parsing.json when no file is given); cases slower than
+# the baseline by more than --time-tolerance, or using more memory by more than
+# --memory-tolerance, are listed and make the exit status 1. Timings only compare on the
+# machine that made the baseline, regenerate benchmarks/baselines/parsing.json there with
+# --output.
+#
+#   python benchmarks/bench_parsing_suite.py [--sizes 100 1000 ...] [--densities 0.2 0.5 ...]
+#       [--output results.json] [--baseline [results.json]]
+#       [--time-tolerance 0.5] [--memory-tolerance 0.1]
+
+import argparse
+import gc
+import importlib.util
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEPLOY_CODE = os.path.join(HERE, "..", "deploy_code")
+sys.path.insert(0, os.path.join(DEPLOY_CODE, "multipagepdfa2i_layer", "python"))
+sys.path.insert(0, os.path.join(DEPLOY_CODE, "multipagepdfa2i_humancomplete"))
+
+import synthetic
+from stream_data import read_human_output
+from textract_blocks import extract_key_values
+
+SIZES = [100, 1000, 5000, 20000, 50000]
+DENSITIES = [0.2, 0.5, 0.8]
+BASELINE = os.path.join(HERE, "baselines", "parsing.json")
+
+def load_handler(name):
+    # every lambda's module is called lambda_function, so load it under its own name
+    path = os.path.join(DEPLOY_CODE, "multipagepdfa2i_" + name, "lambda_function.py")
+    spec = importlib.util.spec_from_file_location(name + "_lambda_function", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def get_parsers():
+    # name -> (parse, payload for a page of block_count blocks at kv_density)
+    humancomplete = load_handler("humancomplete")
+    return {
+        "extract_data": (
+            extract_key_values,
+            lambda block_count, kv_density: synthetic.textract_response(block_count, kv_density)
+        ),
+        "create_human_kv_list": (
+            humancomplete.create_human_kv_list,
+            lambda block_count, kv_density: synthetic.a2i_output(block_count, kv_density)
+        ),
+        "read_human_output": (
+            lambda body: read_human_output(io.BytesIO(body))[2],
+            lambda block_count, kv_density: json.dumps(synthetic.a2i_output(block_count, kv_density)).encode("utf-8")
+        )
+    }
+
+def best_time(parse, payload, repeat, budget=2.0):
+    # best of repeat runs, fewer once budget seconds are spent (at least 3)
+    best = None
+    gc.collect()
+    gc.disable()
+    deadline = time.perf_counter() + budget
+    try:
+        for n in range(repeat):
+            if n >= 3 and time.perf_counter() > deadline:
+                break
+            start = time.perf_counter()
+            parse(payload)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        gc.enable()
+    return best
+
+def peak_memory(parse, payload):
+    # allocated while parsing, on top of the payload itself
+    gc.collect()
+    tracemalloc.start()
+    try:
+        parse(payload)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run(sizes, densities):
+    results = []
+    for name, (parse, make_payload) in get_parsers().items():
+        for block_count in sizes:
+            for kv_density in densities:
+                payload = make_payload(block_count, kv_density)
+                results.append({
+                    "parser": name,
+                    "blocks": block_count,
+                    "kv_density": kv_density,
+                    "pairs": len(parse(payload)),
+                    "seconds": best_time(parse, payload, max(3, 200000 // block_count)),
+                    "peak_bytes": peak_memory(parse, payload)
+                })
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": results
+    }
+
+def case_key(result):
+    return (result["parser"], result["blocks"], result["kv_density"])
+
+def compare(report, baseline, tolerances):
+    # (case, metric, baseline, current) for every metric above baseline * (1 + its tolerance)
+    stored = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = stored.get(case_key(result))
+        if before is None:
+            continue
+        result["baseline_seconds"] = before["seconds"]
+        result["baseline_peak_bytes"] = before["peak_bytes"]
+        for metric, tolerance in tolerances.items():
+            if result[metric] > before[metric] * (1 + tolerance):
+                regressions.append((case_key(result), metric, before[metric], result[metric]))
+    return regressions
+
+def print_table(report):
+    print("%-22s %8s %8s %7s %11s %11s %11s %11s" % (
+        "parser", "blocks", "density", "pairs", "ms/page", "base ms", "peak MB", "base MB"))
+    for result in report["results"]:
+        base_ms = "%11.3f" % (result["baseline_seconds"] * 1000) if "baseline_seconds" in result else "%11s" % "-"
+        base_mb = "%11.2f" % (result["baseline_peak_bytes"] / 1e6) if "baseline_peak_bytes" in result else "%11s" % "-"
+        print("%-22s %8d %8.2f %7d %11.3f %s %11.2f %s" % (
+            result["parser"], result["blocks"], result["kv_density"], result["pairs"],
+            result["seconds"] * 1000, base_ms, result["peak_bytes"] / 1e6, base_mb))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Textract/A2I result parsers.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--densities", type=float, nargs="+", default=DENSITIES)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE, help="compare against results written with --output, by default " + BASELINE)
+    # timings are noisy, peak memory is close to deterministic
+    parser.add_argument("--time-tolerance", type=float, default=0.5)
+    parser.add_argument("--memory-tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.densities)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), {"seconds": args.time_tolerance, "peak_bytes": args.memory_tolerance})
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print_table(report)
+    for (name, blocks, kv_density), metric, before, after in regressions:
+        print("regression: %s %d blocks density %.2f %s %.6g -> %.6g" % (name, blocks, kv_density, metric, before, after))
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Runs the local pipeline simulator (simulator.py) on Sampledoc.pdf sized documents and
+# prints its report as JSON: documents and pages per minute, latency percentiles per stage
+# (kickoff, rasterize, page_ai, page_human, process_map, review_map, wrapup, end_to_end),
+# lambda invocations and durations, and API calls per operation.
+#
+#   python benchmarks/bench_pipeline.py [scenario] [documents] [textract_mode]
+#
+# scenario "sampledoc": documents uploads of Sampledoc.pdf, one every 0.2 seconds, a quarter
+#   of them repeating earlier content (result cache hits)
+# scenario "mixed": the same, next to one 200 page document uploaded first
+
+import json
+import os
+import re
+import sys
+
+from simulator import Simulator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLEDOC = os.path.join(HERE, "..", "Sampledoc.pdf")
+
+def count_pages(pdf_bytes):
+    # /Count of the page tree root, the largest one in the file
+    counts = [int(count) for count in re.findall(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)", pdf_bytes)]
+    counts += [int(count) for count in re.findall(rb"/Count\s+(\d+)[^>]*?/Type\s*/Pages\b", pdf_bytes)]
+    return max(counts) if counts else 1
+
+def workload(scenario, documents, pages):
+    uploads = []
+    if scenario == "mixed":
+        uploads.append((0.0, "uploads/large.pdf", 200, "large"))
+    for n in range(documents):
+        seed = "sampledoc-%d" % (n - n % 4 if n % 4 == 3 else n)
+        uploads.append((0.2 * n, "uploads/sampledoc-%d.pdf" % n, pages, seed))
+    return uploads
+
+def main():
+    scenario = sys.argv[1] if len(sys.argv) > 1 else "sampledoc"
+    documents = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    textract_mode = sys.argv[3] if len(sys.argv) > 3 else "pages"
+    if scenario not in ("sampledoc", "mixed"):
+        sys.exit("unknown scenario " + scenario)
+
+    with open(SAMPLEDOC, "rb") as f:
+        pdf_bytes = f.read()
+    pages = count_pages(pdf_bytes)
+    simulator = Simulator({"environment": {"textract_mode": textract_mode}})
+    report = simulator.run(workload(scenario, documents, pages), pdf_bytes)
+    report = dict({"scenario": scenario, "textract_mode": textract_mode, "pages_per_document": pages}, **report)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Runs several "invocations" (each with its own limiter and worker threads, as separate
+# lambda execution environments would) against a fake Textract that throttles above a fixed
+# rate, and compares retry-only, per invocation AIMD, and AIMD with a shared rate store.
+#
+#   python benchmarks/bench_rate_limiter.py [limit_tps]
+
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "deploy_code", "multipagepdfa2i_layer", "python"))
+
+import rate_limiter
+from fake_textract import FakeTextract
+
+INVOCATIONS = 4
+WORKERS = 3
+CALLS_PER_INVOCATION = 60
+
+def run(name, limit_tps, make_limiter):
+    textract = FakeTextract(limit_tps)
+    limiters = [make_limiter() for _ in range(INVOCATIONS)]
+    failures = []
+
+    def worker(limiter, calls):
+        for _ in range(calls):
+            try:
+                rate_limiter.call(limiter, textract.analyze_document, Document={}, FeatureTypes=["FORMS"], max_attempts=10)
+            except Exception as e:
+                failures.append(e)
+
+    threads = []
+    for limiter in limiters:
+        for _ in range(WORKERS):
+            threads.append(threading.Thread(target=worker, args=(limiter, CALLS_PER_INVOCATION // WORKERS)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print("%-18s %8.1f %8.1f %10d %9d %s" % (
+        name, elapsed, textract.calls / elapsed, textract.throttles, len(failures),
+        " ".join("%.1f" % limiter.rate for limiter in limiters)))
+
+def main(limit_tps):
+    print("fake textract limit: %d tps, %d invocations x %d workers, %d calls" % (
+        limit_tps, INVOCATIONS, WORKERS, INVOCATIONS * CALLS_PER_INVOCATION))
+    print("%-18s %8s %8s %10s %9s %s" % ("mode", "seconds", "tps", "throttles", "failures", "final rates"))
+    run("retry only", limit_tps, lambda: rate_limiter.AdaptiveRateLimiter(1000, min_rate=1000, max_rate=1000, burst=1000))
+    run("aimd", limit_tps, lambda: rate_limiter.AdaptiveRateLimiter(limit_tps))
+    store = rate_limiter.LocalRateStore()
+    run("aimd shared", limit_tps, lambda: rate_limiter.AdaptiveRateLimiter(limit_tps, store=store, sync_interval=0.5))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,88 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Simulates the textract queue with one large document and a stream of single page documents,
+# and compares page scheduling without caps (every page of a document queued at once, the
+# old Process_Map) against a per-document window of pages in flight (Process_Map
+# max_concurrency) with a global cap on pages analyzed at once (analyzepdf concurrency x
+# page_workers). Time is in page service times.
+#
+#   python benchmarks/bench_scheduling.py [large_pages] [window] [global_cap]
+
+import heapq
+import json
+import sys
+from collections import deque
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def simulate(documents, global_cap, window=None):
+    # documents: (arrival time, page count). Returns each document's completion time - arrival.
+    queue = deque()
+    remaining = {}      # document -> pages not yet queued
+    unfinished = {}     # document -> pages not yet analyzed
+    finished = {}
+    events = []         # (time, kind, document), kind 0 = page done, 1 = arrival
+    for document, (arrival, pages) in enumerate(documents):
+        heapq.heappush(events, (arrival, 1, document))
+    busy = 0
+    while events:
+        now, kind, document = heapq.heappop(events)
+        if kind == 1:
+            pages = documents[document][1]
+            queued = pages if window is None else min(window, pages)
+            queue.extend([document] * queued)
+            remaining[document] = pages - queued
+            unfinished[document] = pages
+        else:
+            busy -= 1
+            unfinished[document] -= 1
+            if unfinished[document] == 0:
+                finished[document] = now - documents[document][0]
+            elif remaining[document] > 0:
+                # a slot of the document's window freed up, its next page joins the back of the queue
+                queue.append(document)
+                remaining[document] -= 1
+        while queue and busy < global_cap:
+            busy += 1
+            heapq.heappush(events, (now + 1.0, 0, queue.popleft()))
+    return finished
+
+def main():
+    large_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    global_cap = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    # the large document first, then a single page document every tenth of a page time
+    documents = [(0.0, large_pages)] + [(0.1 * i, 1) for i in range(1, 200)]
+
+    report = {}
+    for name, cap in (("unbounded", None), ("window", window)):
+        finished = simulate(documents, global_cap, cap)
+        small = [finished[document] for document in range(1, len(documents))]
+        report[name] = {
+            "small_p50": round(percentile(small, 0.5), 2),
+            "small_p99": round(percentile(small, 0.99), 2),
+            "large": round(finished[0], 2)
+        }
+    print(json.dumps({"large_pages": large_pages, "window": window, "global_cap": global_cap, "results": report}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Runs the deployed java lambdas (pagecount, then pngextract on each chunk) on a PDF in each
+# PDF loading mode and with embedded images passed through or rendered, and checks that every
+# page image was written, with content matching its content type. The functions' environment
+# is changed for each run and put back at the end. The PDF goes under check_rasterizer/, out
+# of the uploads/ prefix, so the pipeline isn't started.
+#
+#   python benchmarks/check_rasterizer.py <bucket> [pdf]
+
+import json
+import os
+import sys
+import time
+import boto3
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLEDOC = os.path.join(HERE, "..", "Sampledoc.pdf")
+
+PAGECOUNT = "multipagepdfa2i_pagecount"
+PNGEXTRACT = "multipagepdfa2i_pngextract"
+
+# (pdf_load_mode, embedded_images)
+RUNS = [("disk", "passthrough"), ("memory", "passthrough"), ("disk", "render")]
+
+MAGIC = {"image/png": b"\x89PNG", "image/jpeg": b"\xff\xd8"}
+
+def get_environment(lambda_client, name):
+    configuration = lambda_client.get_function_configuration(FunctionName=name)
+    return configuration.get("Environment", {}).get("Variables", {})
+
+def set_environment(lambda_client, name, variables):
+    lambda_client.update_function_configuration(FunctionName=name, Environment={"Variables": variables})
+    while lambda_client.get_function_configuration(FunctionName=name).get("LastUpdateStatus") == "InProgress":
+        time.sleep(1)
+
+def invoke(lambda_client, name, event):
+    start = time.time()
+    response = lambda_client.invoke(FunctionName=name, Payload=json.dumps(event).encode("utf-8"))
+    payload = json.loads(response["Payload"].read())
+    if response.get("FunctionError"):
+        raise RuntimeError("%s failed: %s" % (name, json.dumps(payload)))
+    return payload, time.time() - start
+
+def check_pages(s3, bucket, id, page_count):
+    # content type and size of each page image, any problem raises
+    found = {}
+    for page in range(page_count):
+        key = "wip/%s/%d.png" % (id, page)
+        head = s3.head_object(Bucket=bucket, Key=key)
+        content_type = head["ContentType"]
+        start = s3.get_object(Bucket=bucket, Key=key, Range="bytes=0-3")["Body"].read()
+        if not start.startswith(MAGIC.get(content_type, b"?")):
+            raise RuntimeError("%s is %s but starts with %r" % (key, content_type, start))
+        found[content_type] = found.get(content_type, 0) + 1
+        found["bytes"] = found.get("bytes", 0) + head["ContentLength"]
+    return found
+
+def run(lambda_client, s3, bucket, key, load_mode, embedded_images):
+    id = "check-rasterizer-%s-%s" % (load_mode, embedded_images)
+    event = {"id": id, "bucket": bucket, "key": key}
+    pages, pagecount_seconds = invoke(lambda_client, PAGECOUNT, event)
+    image_keys = []
+    render_seconds = 0.0
+    for chunk in pages["chunks"]:
+        keys, seconds = invoke(lambda_client, PNGEXTRACT, dict(event, **chunk))
+        image_keys += keys
+        render_seconds += seconds
+    if image_keys != pages["image_keys"]:
+        raise RuntimeError("pngextract returned %s, pagecount listed %s" % (image_keys, pages["image_keys"]))
+    found = check_pages(s3, bucket, id, pages["page_count"])
+    for page in range(pages["page_count"]):
+        s3.delete_object(Bucket=bucket, Key="wip/%s/%d.png" % (id, page))
+    return dict({
+        "pdf_load_mode": load_mode,
+        "embedded_images": embedded_images,
+        "page_count": pages["page_count"],
+        "chunks": len(pages["chunks"]),
+        "pagecount_seconds": round(pagecount_seconds, 2),
+        "render_seconds": round(render_seconds, 2)
+    }, **found)
+
+def main():
+    bucket = sys.argv[1]
+    path = sys.argv[2] if len(sys.argv) > 2 else SAMPLEDOC
+    key = "check_rasterizer/" + os.path.basename(path)
+    lambda_client = boto3.client("lambda")
+    s3 = boto3.client("s3")
+    with open(path, "rb") as pdf:
+        s3.put_object(Bucket=bucket, Key=key, Body=pdf.read())
+
+    saved = {name: get_environment(lambda_client, name) for name in (PAGECOUNT, PNGEXTRACT)}
+    results = []
+    try:
+        for load_mode, embedded_images in RUNS:
+            set_environment(lambda_client, PAGECOUNT, dict(saved[PAGECOUNT], pdf_load_mode=load_mode))
+            set_environment(lambda_client, PNGEXTRACT, dict(saved[PNGEXTRACT], pdf_load_mode=load_mode, embedded_images=embedded_images))
+            results.append(run(lambda_client, s3, bucket, key, load_mode, embedded_images))
+            print(json.dumps(results[-1]))
+    finally:
+        for name, variables in saved.items():
+            set_environment(lambda_client, name, variables)
+        s3.delete_object(Bucket=bucket, Key=key)
+
+    page_counts = set(result["page_count"] for result in results)
+    if len(page_counts) != 1:
+        raise RuntimeError("page counts differ between runs: %s" % sorted(page_counts))
+    print("ok: %d pages in every mode" % page_counts.pop())
+
+if __name__ == "__main__":
+    main()
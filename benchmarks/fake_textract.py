@@ -0,0 +1,116 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Local stand-ins for the Textract API. FakeTextract throttles like the real service: more
+# than `limit_tps` calls within any one second raise ThrottlingException. FakeAsyncTextract
+# implements StartDocumentAnalysis / GetDocumentAnalysis for a synthetic multi-page document.
+
+import threading
+import time
+import uuid
+from collections import deque
+
+from botocore.exceptions import ClientError
+
+import synthetic
+
+class FakeTextract:
+
+    def __init__(self, limit_tps, latency=0.05, block_count=200, clock=time.monotonic, sleep=time.sleep):
+        self.limit_tps = limit_tps
+        self.latency = latency
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.calls = 0
+        self.throttles = 0
+        self.response = synthetic.textract_response(block_count)
+
+    def admit(self, operation):
+        with self.lock:
+            now = self.clock()
+            while self.window and now - self.window[0] >= 1.0:
+                self.window.popleft()
+            if len(self.window) >= self.limit_tps:
+                self.throttles += 1
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, operation)
+            self.window.append(now)
+            self.calls += 1
+
+    def analyze_document(self, **kwargs):
+        self.admit("AnalyzeDocument")
+        self.sleep(self.latency)
+        return self.response
+
+class FakeAsyncTextract:
+    # A job stays IN_PROGRESS for the first `polls` status requests, then returns `pages`
+    # synthetic pages (block ids made unique per page, "Page" set on every block) in responses
+    # of at most MaxResults blocks. A repeated ClientRequestToken returns the same job.
+
+    def __init__(self, pages, blocks_per_page=200, polls=2):
+        self.lock = threading.Lock()
+        self.polls = polls
+        self.jobs = {}
+        self.tokens = {}
+        self.starts = 0
+        self.gets = 0
+        self.page_responses = [self.page_response(page, blocks_per_page) for page in range(1, pages + 1)]
+        self.blocks = [block for response in self.page_responses for block in response["Blocks"]]
+
+    @staticmethod
+    def page_response(page, block_count):
+        # one page as AnalyzeDocument would return it, ids prefixed with the page number
+        response = synthetic.textract_response(block_count, seed=page)
+        for block in response["Blocks"]:
+            block["Id"] = "%d-%s" % (page, block["Id"])
+            block["Page"] = page
+            for relation in block.get("Relationships", []):
+                relation["Ids"] = ["%d-%s" % (page, id) for id in relation["Ids"]]
+        return response
+
+    def start_document_analysis(self, DocumentLocation, FeatureTypes, ClientRequestToken=None, JobTag=None, **kwargs):
+        with self.lock:
+            self.starts += 1
+            if ClientRequestToken in self.tokens:
+                return {"JobId": self.tokens[ClientRequestToken]}
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = self.polls
+            if ClientRequestToken:
+                self.tokens[ClientRequestToken] = job_id
+            return {"JobId": job_id}
+
+    def get_document_analysis(self, JobId, MaxResults=1000, NextToken=None):
+        with self.lock:
+            self.gets += 1
+            if JobId not in self.jobs:
+                raise ClientError({"Error": {"Code": "InvalidJobIdException", "Message": "unknown job"}}, "GetDocumentAnalysis")
+            if self.jobs[JobId] > 0:
+                self.jobs[JobId] -= 1
+                return {"JobStatus": "IN_PROGRESS"}
+        start = int(NextToken or 0)
+        end = start + MaxResults
+        response = {
+            "JobStatus": "SUCCEEDED",
+            "DocumentMetadata": {"Pages": len(self.page_responses)},
+            "Blocks": self.blocks[start:end]
+        }
+        if end < len(self.blocks):
+            response["NextToken"] = str(end)
+        return response
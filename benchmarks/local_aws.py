@@ -0,0 +1,679 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# In-process stand-ins for the AWS APIs the lambdas call, used by simulator.py. Only the
+# operations and parameters the handlers use are implemented. Every call is counted as
+# "<service>.<Operation>" and services can be given a per call latency.
+
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+import synthetic
+from fake_textract import FakeAsyncTextract
+
+def client_error(code, operation, message=None):
+    return ClientError({"Error": {"Code": code, "Message": message or code}}, operation)
+
+class ApiCalls:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def add(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(sorted(self.counts.items()))
+
+class LocalService:
+    service_name = None
+
+    def __init__(self, calls, latency=0.0, sleep=time.sleep):
+        self.calls = calls
+        self.latency = latency
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    def call(self, operation, latency=None):
+        self.calls.add(self.service_name + "." + operation)
+        latency = self.latency if latency is None else latency
+        if latency > 0:
+            self.sleep(latency)
+
+# S3
+
+class StreamingBody(io.BytesIO):
+
+    def iter_chunks(self, chunk_size=1024):
+        return iter(lambda: self.read(chunk_size), b"")
+
+def iso_time():
+    # the timestamp format of S3 and EventBridge events
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def to_bytes(body):
+    if hasattr(body, "read"):
+        body = body.read()
+    if isinstance(body, str):
+        return body.encode("utf-8")
+    return bytes(body)
+
+class LocalS3(LocalService):
+    service_name = "s3"
+
+    # S3 rejects multipart parts smaller than this, except for the last one
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, calls, latency=0.0, sleep=time.sleep):
+        super().__init__(calls, latency, sleep)
+        self.objects = {}
+        self.uploads = {}
+
+    def store(self, bucket, key, data, etag=None):
+        etag = etag or '"%s"' % hashlib.md5(data).hexdigest()
+        with self.lock:
+            self.objects[(bucket, key)] = (data, etag)
+        return etag
+
+    def find(self, bucket, key, operation):
+        with self.lock:
+            found = self.objects.get((bucket, key))
+        if found is None:
+            raise client_error("NoSuchKey", operation, "no such key: " + key)
+        return found
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        self.call("PutObject")
+        return {"ETag": self.store(Bucket, Key, to_bytes(Body))}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.call("GetObject")
+        data, etag = self.find(Bucket, Key, "GetObject")
+        return {"Body": StreamingBody(data), "ContentLength": len(data), "ETag": etag}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.call("HeadObject")
+        data, etag = self.find(Bucket, Key, "HeadObject")
+        return {"ContentLength": len(data), "ETag": etag}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000):
+        self.call("ListObjectsV2")
+        with self.lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+            start = int(ContinuationToken or 0)
+            page = [{"Key": key, "Size": len(self.objects[(Bucket, key)][0])} for key in keys[start:start + MaxKeys]]
+        response = {"KeyCount": len(page), "IsTruncated": start + MaxKeys < len(keys)}
+        if page:
+            response["Contents"] = page
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + MaxKeys)
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise NotImplementedError(operation_name)
+        s3 = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                while True:
+                    response = s3.list_objects_v2(**kwargs)
+                    yield response
+                    if not response["IsTruncated"]:
+                        return
+                    kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+        return Paginator()
+
+    def delete_objects(self, Bucket, Delete):
+        self.call("DeleteObjects")
+        with self.lock:
+            for item in Delete["Objects"]:
+                self.objects.pop((Bucket, item["Key"]), None)
+        if Delete.get("Quiet"):
+            return {}
+        return {"Deleted": [{"Key": item["Key"]} for item in Delete["Objects"]]}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.call("CreateMultipartUpload")
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def add_part(self, upload_id, part_number, data):
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        with self.lock:
+            self.uploads[upload_id][part_number] = (data, etag)
+        return etag
+
+    def upload_part(self, Body, Bucket, Key, PartNumber, UploadId):
+        self.call("UploadPart")
+        return {"ETag": self.add_part(UploadId, PartNumber, to_bytes(Body))}
+
+    def upload_part_copy(self, Bucket, Key, CopySource, PartNumber, UploadId):
+        self.call("UploadPartCopy")
+        data, _ = self.find(CopySource["Bucket"], CopySource["Key"], "UploadPartCopy")
+        return {"CopyPartResult": {"ETag": self.add_part(UploadId, PartNumber, data)}}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.call("CompleteMultipartUpload")
+        with self.lock:
+            stored = self.uploads.pop(UploadId)
+        parts = [stored[part["PartNumber"]][0] for part in MultipartUpload["Parts"]]
+        if any(len(part) < self.MIN_PART_SIZE for part in parts[:-1]):
+            raise client_error("EntityTooSmall", "CompleteMultipartUpload")
+        etag = self.store(Bucket, Key, b"".join(parts), '"%s-%d"' % (uuid.uuid4().hex, len(parts)))
+        return {"ETag": etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.call("AbortMultipartUpload")
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+class LocalS3Resource:
+
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def Object(self, bucket, key):
+        s3 = self.s3
+        return SimpleNamespace(
+            get=lambda **kwargs: s3.get_object(Bucket=bucket, Key=key),
+            put=lambda Body, **kwargs: s3.put_object(Body=Body, Bucket=bucket, Key=key)
+        )
+
+# SQS
+
+class LocalSQS(LocalService):
+    # Receipt handles are unique across queues, so deletes work whatever QueueUrl they name.
+    # The simulated lambdas share one process environment, where the two queue urls the
+    # stack gives kickoff and analyzepdf can't both be set.
+    service_name = "sqs"
+
+    def __init__(self, calls, visibility_timeout=30.0, latency=0.0, clock=time.monotonic, sleep=time.sleep):
+        super().__init__(calls, latency, sleep)
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_counts = {}
+        self.clock = clock
+        self.queues = {}
+        self.in_flight = {}
+        self.dead_letters = []
+
+    def create_queue(self, name, max_receive_count=None):
+        # messages received max_receive_count times go to dead_letters instead of coming back
+        url = "local://sqs/" + name
+        self.queues[url] = deque()
+        self.max_receive_counts[url] = max_receive_count
+        return url
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.call("SendMessage")
+        message_id = uuid.uuid4().hex
+        with self.lock:
+            self.queues[QueueUrl].append({"messageId": message_id, "body": MessageBody, "receives": 0, "sent": time.time()})
+        return {"MessageId": message_id}
+
+    def receive(self, queue_url, max_messages):
+        # what the lambda event source mapping does, returns records in the lambda event format
+        now = self.clock()
+        records = []
+        with self.lock:
+            for receipt, (url, message, visible_at) in list(self.in_flight.items()):
+                if visible_at <= now:
+                    # not deleted within the visibility timeout, back on the queue
+                    del self.in_flight[receipt]
+                    max_receive_count = self.max_receive_counts.get(url)
+                    if max_receive_count and message["receives"] >= max_receive_count:
+                        self.dead_letters.append(message)
+                    else:
+                        self.queues[url].append(message)
+            queue = self.queues[queue_url]
+            while queue and len(records) < max_messages:
+                message = queue.popleft()
+                message["receives"] += 1
+                receipt = uuid.uuid4().hex
+                self.in_flight[receipt] = (queue_url, message, now + self.visibility_timeout)
+                records.append({
+                    "messageId": message["messageId"],
+                    "receiptHandle": receipt,
+                    "body": message["body"],
+                    "attributes": {
+                        "ApproximateReceiveCount": str(message["receives"]),
+                        "SentTimestamp": str(int(message["sent"] * 1000))
+                    },
+                    "eventSource": "aws:sqs"
+                })
+        if records:
+            self.call("ReceiveMessage")
+        return records
+
+    def depth(self, queue_url):
+        with self.lock:
+            return len(self.queues[queue_url]) + sum(1 for url, _, _ in self.in_flight.values() if url == queue_url)
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        self.call("DeleteMessageBatch")
+        successful = []
+        failed = []
+        with self.lock:
+            for entry in Entries:
+                if self.in_flight.pop(entry["ReceiptHandle"], None) is None:
+                    failed.append({"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True})
+                else:
+                    successful.append({"Id": entry["Id"]})
+        return {"Successful": successful, "Failed": failed}
+
+# Step Functions (executions and task tokens, the state machine itself is run by the simulator)
+
+class ExecutionAlreadyExists(ClientError):
+    pass
+
+class TaskFailed(Exception):
+    pass
+
+class LocalStepFunctions(LocalService):
+    service_name = "stepfunctions"
+
+    def __init__(self, calls, run_execution, latency=0.0, sleep=time.sleep):
+        super().__init__(calls, latency, sleep)
+        self.run_execution = run_execution
+        self.executions = {}
+        self.tokens = {}
+        self.exceptions = SimpleNamespace(ExecutionAlreadyExists=ExecutionAlreadyExists)
+
+    def start_execution(self, stateMachineArn, name, input):
+        self.call("StartExecution")
+        with self.lock:
+            found = self.executions.get(name)
+            if found is not None and found["status"] == "RUNNING" and found["input"] == json.loads(input):
+                # the same request again: success, nothing new is started
+                return {"executionArn": stateMachineArn.replace(":stateMachine:", ":execution:") + ":" + name, "startDate": found["started"]}
+            if found is not None:
+                raise ExecutionAlreadyExists({"Error": {"Code": "ExecutionAlreadyExists", "Message": "execution already exists: " + name}}, "StartExecution")
+            execution = self.executions[name] = {"name": name, "input": json.loads(input), "status": "RUNNING", "started": time.time()}
+        thread = threading.Thread(target=self.run_execution, args=(execution,), daemon=True)
+        execution["thread"] = thread
+        thread.start()
+        return {"executionArn": stateMachineArn.replace(":stateMachine:", ":execution:") + ":" + name, "startDate": execution["started"]}
+
+    def describe_execution(self, executionArn):
+        self.call("DescribeExecution")
+        with self.lock:
+            execution = self.executions[executionArn[executionArn.rfind(":")+1:]]
+            return {"executionArn": executionArn, "status": execution["status"], "input": json.dumps(execution["input"])}
+
+    def list_executions(self, stateMachineArn, statusFilter=None, **kwargs):
+        self.call("ListExecutions")
+        with self.lock:
+            return {"executions": [{"name": name, "status": execution["status"]}
+                for name, execution in self.executions.items() if statusFilter in (None, execution["status"])]}
+
+    def new_task_token(self):
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens[token] = SimpleNamespace(done=threading.Event(), output=None, error=None)
+        return token
+
+    def wait_for_task(self, token, timeout=None):
+        # the output sent with the token, None on timeout, TaskFailed when the task was failed
+        task = self.tokens[token]
+        if not task.done.wait(timeout):
+            return None
+        with self.lock:
+            del self.tokens[token]
+        if task.error is not None:
+            raise TaskFailed(task.error)
+        return task.output
+
+    def send_task_failure(self, taskToken, error=None, cause=None):
+        self.call("SendTaskFailure")
+        with self.lock:
+            task = self.tokens.get(taskToken)
+            if task is None or task.done.is_set():
+                raise client_error("TaskTimedOut", "SendTaskFailure", "task token is not waiting")
+            task.error = "%s: %s" % (error, cause)
+            task.done.set()
+        return {}
+
+    def send_task_success(self, taskToken, output):
+        self.call("SendTaskSuccess")
+        with self.lock:
+            task = self.tokens.get(taskToken)
+            if task is None or task.done.is_set():
+                raise client_error("TaskTimedOut", "SendTaskSuccess", "task token is not waiting")
+            task.output = json.loads(output)
+            task.done.set()
+        return {}
+
+# DynamoDB
+
+class ConditionalCheckFailedException(ClientError):
+    pass
+
+def resolve_name(name, names):
+    return (names or {}).get(name, name)
+
+def check_term(item, term, names, values):
+    exists = re.fullmatch(r"attribute_(not_)?exists\((\S+)\)", term)
+    compare = re.fullmatch(r"(\S+) (=|<|<=) (:\S+)", term)
+    if exists:
+        return (resolve_name(exists.group(2), names) in item) != bool(exists.group(1))
+    if compare:
+        found = item.get(resolve_name(compare.group(1), names))
+        value = values[compare.group(3)]
+        if compare.group(2) == "=":
+            return found == value
+        if found is None:
+            return False
+        if compare.group(2) == "<":
+            return float(found["N"]) < float(value["N"])
+        return float(found["N"]) <= float(value["N"])
+    raise NotImplementedError("condition " + term)
+
+def check_condition(item, expression, names, values):
+    # only the condition forms the handlers use: OR'ed terms of AND'ed attribute_exists /
+    # attribute_not_exists / =, < and <= comparisons
+    if not expression:
+        return True
+    return any(all(check_term(item, term.strip(), names, values) for term in alternative.split(" AND "))
+        for alternative in expression.split(" OR "))
+
+def apply_update(item, expression, names, values):
+    if not expression.startswith("SET "):
+        raise NotImplementedError("update " + expression)
+    for assignment in expression[len("SET "):].split(","):
+        name, value = [part.strip() for part in assignment.split("=")]
+        item[resolve_name(name, names)] = values[value]
+
+class LocalDynamoDB(LocalService):
+    service_name = "dynamodb"
+
+    def __init__(self, calls, tables, latency=0.0, sleep=time.sleep):
+        # tables is table name -> partition key attribute
+        super().__init__(calls, latency, sleep)
+        self.tables = tables
+        self.items = {name: {} for name in tables}
+        self.exceptions = SimpleNamespace(ConditionalCheckFailedException=ConditionalCheckFailedException)
+
+    def item_key(self, table_name, item):
+        return json.dumps(item[self.tables[table_name]], sort_keys=True)
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None):
+        self.call("PutItem")
+        with self.lock:
+            key = self.item_key(TableName, Item)
+            if not check_condition(self.items[TableName].get(key, {}), ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+                raise ConditionalCheckFailedException({"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem")
+            self.items[TableName][key] = json.loads(json.dumps(Item))
+        return {}
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        self.call("GetItem")
+        with self.lock:
+            item = self.items[TableName].get(self.item_key(TableName, Key))
+            return {"Item": json.loads(json.dumps(item))} if item is not None else {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression=None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        self.call("UpdateItem")
+        with self.lock:
+            key = self.item_key(TableName, Key)
+            item = self.items[TableName].get(key, {})
+            if not check_condition(item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+                raise ConditionalCheckFailedException({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+            item = dict(item, **Key)
+            apply_update(item, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues or {})
+            self.items[TableName][key] = item
+        return {}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, ExpressionAttributeNames=None, **kwargs):
+        # only "<partition key> = :value", typed values as the client returns them
+        name, value = [part.strip() for part in KeyConditionExpression.split("=")]
+        if resolve_name(name, ExpressionAttributeNames) != self.tables[TableName]:
+            raise NotImplementedError("query " + KeyConditionExpression)
+        self.call("Query")
+        with self.lock:
+            item = self.items[TableName].get(json.dumps(ExpressionAttributeValues[value], sort_keys=True))
+            items = [json.loads(json.dumps(item))] if item is not None else []
+        return {"Items": items, "Count": len(items)}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        # typed Key, the item only goes when all of the key's attributes match
+        self.call("DeleteItem")
+        with self.lock:
+            stored_key = self.item_key(TableName, Key)
+            item = self.items[TableName].get(stored_key)
+            if item is not None and all(item.get(name) == value for name, value in Key.items()):
+                del self.items[TableName][stored_key]
+        return {}
+
+    def query_equal(self, table_name, value):
+        # Query on the partition key with plain (not typed) values, what Table.query returns
+        self.call("Query")
+        deserializer = TypeDeserializer()
+        with self.lock:
+            item = self.items[table_name].get(json.dumps(self.serialize(value), sort_keys=True))
+            if item is None:
+                return []
+            return [{name: deserializer.deserialize(typed) for name, typed in item.items()}]
+
+    def delete_equal(self, table_name, key):
+        # DeleteItem with plain values, the item only goes when all of the key's attributes match
+        self.call("DeleteItem")
+        deserializer = TypeDeserializer()
+        with self.lock:
+            stored_key = json.dumps(self.serialize(key[self.tables[table_name]]), sort_keys=True)
+            item = self.items[table_name].get(stored_key)
+            if item is not None and all(name in item and deserializer.deserialize(item[name]) == value for name, value in key.items()):
+                del self.items[table_name][stored_key]
+        return {}
+
+    @staticmethod
+    def serialize(value):
+        return {"S": value} if isinstance(value, str) else {"N": str(value)}
+
+class LocalDynamoDBResource:
+
+    def __init__(self, dynamodb):
+        self.dynamodb = dynamodb
+
+    def Table(self, name):
+        dynamodb = self.dynamodb
+
+        def query(KeyConditionExpression, **kwargs):
+            # only Key(<partition key>).eq(value)
+            _, value = KeyConditionExpression.get_expression()["values"]
+            items = dynamodb.query_equal(name, value)
+            return {"Items": items, "Count": len(items)}
+
+        def delete_item(Key, **kwargs):
+            return dynamodb.delete_equal(name, Key)
+
+        return SimpleNamespace(query=query, delete_item=delete_item)
+
+# Lambda (functions invoked directly, the java pagecount)
+
+class LocalLambda(LocalService):
+    service_name = "lambda"
+
+    def __init__(self, calls, functions, latency=0.0, sleep=time.sleep):
+        # functions is function name -> callable taking and returning the payload
+        super().__init__(calls, latency, sleep)
+        self.functions = functions
+
+    def invoke(self, FunctionName, Payload=b"", **kwargs):
+        self.call("Invoke")
+        try:
+            result, error = self.functions[FunctionName](json.loads(Payload or "{}")), None
+        except Exception as e:
+            result, error = {"errorMessage": str(e), "errorType": type(e).__name__}, "Unhandled"
+        response = {"StatusCode": 200, "Payload": StreamingBody(json.dumps(result).encode("utf-8"))}
+        if error:
+            response["FunctionError"] = error
+        return response
+
+# Textract and A2I
+
+class LocalTextract(LocalService):
+    # AnalyzeDocument returns one of `variants` synthetic pages of `blocks_per_page` blocks
+    # (chosen by the document name) after `latency`, raises ThrottlingException above
+    # `limit_tps` calls per second, and starts a human loop for `human_review_rate` of the
+    # calls that ask for one. The asynchronous API analyzes a document in `latency` per page.
+
+    service_name = "textract"
+
+    def __init__(self, calls, latency=0.3, limit_tps=None, human_review_rate=0.0, blocks_per_page=400,
+                 variants=8, start_human_loop=None, page_count=None, seed=0, clock=time.monotonic, sleep=time.sleep):
+        super().__init__(calls, latency, sleep)
+        self.limit_tps = limit_tps
+        self.human_review_rate = human_review_rate
+        self.start_human_loop = start_human_loop
+        self.page_count = page_count
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.window = deque()
+        self.throttles = 0
+        self.human_loops = 0
+        self.responses = [synthetic.textract_response(blocks_per_page, seed=n) for n in range(variants)]
+        self.blocks_per_page = blocks_per_page
+        self.jobs = {}
+
+    def admit(self, operation):
+        if self.limit_tps is None:
+            return
+        with self.lock:
+            now = self.clock()
+            while self.window and now - self.window[0] >= 1.0:
+                self.window.popleft()
+            if len(self.window) >= self.limit_tps:
+                self.throttles += 1
+                raise client_error("ThrottlingException", operation, "Rate exceeded")
+            self.window.append(now)
+
+    def analyze_document(self, Document, FeatureTypes, HumanLoopConfig=None, **kwargs):
+        self.calls.add("textract.AnalyzeDocument")
+        self.admit("AnalyzeDocument")
+        self.sleep(self.latency)
+        name = Document["S3Object"]["Name"]
+        response = self.responses[zlib.crc32(name.encode("utf-8")) % len(self.responses)]
+        reasons = []
+        if HumanLoopConfig is not None:
+            with self.lock:
+                review = self.rng.random() < self.human_review_rate
+            if review:
+                reasons = [{"ConditionsMatched": [{"ConditionType": "Simulated"}]}]
+                self.human_loops += 1
+                if self.start_human_loop is not None:
+                    self.start_human_loop(HumanLoopConfig["HumanLoopName"], Document["S3Object"], response)
+        return dict(response, HumanLoopActivationOutput={"HumanLoopActivationReasons": reasons})
+
+    def start_document_analysis(self, DocumentLocation, FeatureTypes, ClientRequestToken=None, JobTag=None, **kwargs):
+        self.call("StartDocumentAnalysis", 0)
+        location = DocumentLocation["S3Object"]
+        with self.lock:
+            for job_id, job in self.jobs.items():
+                if ClientRequestToken and job["token"] == ClientRequestToken:
+                    return {"JobId": job_id}
+            pages = self.page_count(location["Bucket"], location["Name"]) if self.page_count else 1
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {"token": ClientRequestToken, "pages": pages, "ready_at": self.clock() + self.latency * pages}
+        return {"JobId": job_id}
+
+    def get_document_analysis(self, JobId, MaxResults=1000, NextToken=None):
+        self.call("GetDocumentAnalysis", 0)
+        job = self.jobs[JobId]
+        if self.clock() < job["ready_at"]:
+            return {"JobStatus": "IN_PROGRESS"}
+        if "blocks" not in job:
+            job["blocks"] = [block for page in range(1, job["pages"] + 1)
+                for block in FakeAsyncTextract.page_response(page, self.blocks_per_page)["Blocks"]]
+        start = int(NextToken or 0)
+        response = {
+            "JobStatus": "SUCCEEDED",
+            "DocumentMetadata": {"Pages": job["pages"]},
+            "Blocks": job["blocks"][start:start + MaxResults]
+        }
+        if start + MaxResults < len(job["blocks"]):
+            response["NextToken"] = str(start + MaxResults)
+        return response
+
+class LocalA2I:
+    # A human loop finishes `review_latency` seconds after it starts: its output is written to
+    # S3 like A2I does and `deliver` gets the EventBridge status change event.
+
+    def __init__(self, calls, s3, deliver, review_latency=5.0, bucket="simulated"):
+        self.calls = calls
+        self.s3 = s3
+        self.deliver = deliver
+        self.review_latency = review_latency
+        self.bucket = bucket
+
+    def start_human_loop(self, name, s3_object, response):
+        self.calls.add("a2i.StartHumanLoop")
+        timer = threading.Timer(self.review_latency, self.complete, args=(name, s3_object, response, iso_time()))
+        timer.daemon = True
+        timer.start()
+
+    def complete(self, name, s3_object, response, created):
+        forms = synthetic.to_camel_case(response)
+        output = {
+            "humanLoopName": name,
+            "inputContent": {
+                "aiServiceRequest": {
+                    "document": {"s3Object": {"bucket": s3_object["Bucket"], "name": s3_object["Name"]}},
+                    "featureTypes": ["FORMS"]
+                },
+                "aiServiceResponse": forms
+            },
+            "humanAnswers": [{
+                "answerContent": {"AWS/Textract/AnalyzeDocument/Forms/V1": {"blocks": forms["blocks"]}},
+                "workerId": "simulated"
+            }]
+        }
+        key = "a2i/" + name + "/output.json"
+        self.s3.store(self.bucket, key, json.dumps(output).encode("utf-8"))
+        self.deliver({
+            "source": "aws.sagemaker",
+            "detail-type": "SageMaker A2I HumanLoop Status Change",
+            "time": iso_time(),
+            "detail": {
+                "creationTime": created,
+                "humanLoopName": name,
+                "humanLoopStatus": "Completed",
+                "humanLoopOutput": {"outputS3Uri": "s3://" + self.bucket + "/" + key}
+            }
+        })
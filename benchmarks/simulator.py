@@ -0,0 +1,445 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# In-process simulation of the whole pipeline, without deploying the stack. It follows the
+# state machine built in create_state_machine (kickoff -> PDF or Image? -> PageCount /
+# Render_Map -> Process_Map -> Review_Map -> Wrapup and Clean, or the native PDF mode) and
+# runs the real python lambda handlers against the local stand-ins in local_aws.py:
+#
+# - kickoff and analyzepdf are fed by SQS pollers, one per unit of lambda concurrency, each
+#   with its own copy of the handler module like separate execution environments
+# - Process_Map sends each page with a task token and waits for SendTaskSuccess
+# - human loops complete after a review latency and reach humancomplete as EventBridge events
+# - the java rasterizer (pagecount, pngextract) is simulated with a per page render time
+# - Simulator.resume(id) is kickoff's resume entry point for a failed execution
+#
+# Time is real time, latencies are configured in seconds (see DEFAULT_CONFIG). Handler output
+# goes to config["log_path"]. See bench_pipeline.py for the scenarios.
+
+import contextlib
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEPLOY_CODE = os.path.join(HERE, "..", "deploy_code")
+LAMBDAS = ["kickoff", "analyzepdf", "analyzedoc", "humancomplete", "wrapup"]
+sys.path[:0] = [os.path.join(DEPLOY_CODE, "multipagepdfa2i_layer", "python")] + \
+    [os.path.join(DEPLOY_CODE, "multipagepdfa2i_" + name) for name in LAMBDAS]
+
+import clients
+import spans
+from local_aws import (ApiCalls, LocalS3, LocalS3Resource, LocalSQS, LocalStepFunctions,
+    LocalDynamoDB, LocalDynamoDBResource, LocalLambda, LocalTextract, LocalA2I, iso_time)
+
+BUCKET = "multipagepdfa2i"
+STATE_MACHINE_ARN = "arn:aws:states:local:000000000000:stateMachine:multipagepdfa2i_stepfunction"
+
+DEFAULT_CONFIG = {
+    # as in multipagepdfa2i_stack.py
+    "pages_in_flight_per_document": 40,
+    "review_map_concurrency": 40,
+    "analyzepdf_concurrency": 10,
+    "kickoff_concurrency": 2,
+    "batch_size": 10,
+    "pages_per_chunk": 50,
+    "render_concurrency": 20,
+    # simulated service behaviour, seconds
+    "s3_latency": 0.01,
+    "sqs_latency": 0.005,
+    "dynamodb_latency": 0.005,
+    "stepfunctions_latency": 0.01,
+    "textract_latency": 0.3,
+    "textract_limit_tps": 20,
+    "human_review_rate": 0.1,
+    "review_latency": 3.0,
+    "pagecount_seconds": 0.1,
+    "render_seconds_per_page": 0.2,
+    "analyzedoc_wait": 0.5,
+    "visibility_timeout": 30.0,
+    # the textract queue's dead letter queue, as TEXTRACT_MAX_RECEIVE_COUNT in the stack
+    "max_receive_count": 5,
+    "eventbridge_retries": 3,
+    "blocks_per_page": 400,
+    "page_bytes": 64 * 1024,
+    # the whole run is given up after this long
+    "timeout": 600.0,
+    "log_path": os.devnull,
+    # lambda environment, on top of ENVIRONMENT
+    "environment": {}
+}
+
+# The environment the stack gives the lambdas, merged: every simulated lambda shares this
+# process's environment. sqs_url differs per lambda in the stack, the local SQS doesn't need it.
+ENVIRONMENT = {
+    "sqs_url": "local://sqs",
+    "max_receive_count": "5",
+    "state_machine_arn": STATE_MACHINE_ARN,
+    "start_workers": "10",
+    "textract_mode": "pages",
+    "human_workflow_arn": "arn:aws:sagemaker:local:000000000000:flow-definition/simulated",
+    "page_workers": "10",
+    "textract_tps": "5",
+    "textract_max_tps": "50",
+    "coordination_table": "multia2ipdf_coordination",
+    "result_cache": "true",
+    "result_cache_ttl_days": "30",
+    "result_cache_entries": "256",
+    "stream_human_output": "true",
+    "fetch_workers": "16",
+    "cleanup_workers": "8",
+    "output_formats": "",
+    "write_workers": "16",
+    "textract_get_tps": "5",
+    "textract_get_max_tps": "10",
+    "pagecount_function": "multipagepdfa2i_pagecount",
+    "pages_per_chunk": "50"
+}
+
+def load_handler(name, instance=0):
+    # every lambda's module is called lambda_function, each copy gets its own module globals
+    path = os.path.join(DEPLOY_CODE, "multipagepdfa2i_" + name, "lambda_function.py")
+    spec = importlib.util.spec_from_file_location("%s_lambda_function_%d" % (name, instance), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    pick = lambda share: round(values[min(len(values) - 1, int(len(values) * share))], 3)
+    return {"count": len(values), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(values[-1], 3)}
+
+class LockedWriter:
+    # text files aren't safe to write from many threads, the handlers' output goes through this
+
+    def __init__(self, out):
+        self.out = out
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            return self.out.write(text)
+
+    def flush(self):
+        with self.lock:
+            self.out.flush()
+
+def page_image(seed, page, size):
+    # stands in for a rendered page, the same document content renders the same bytes
+    return random.Random("%s-%d" % (seed, page)).randbytes(size)
+
+class Simulator:
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.clock = time.monotonic
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.stages = {}
+        self.lambdas = {}
+        self.documents = {}
+        self.finished = threading.Condition(self.lock)
+
+        config = self.config
+        self.calls = ApiCalls()
+        self.s3 = LocalS3(self.calls, config["s3_latency"])
+        self.sqs = LocalSQS(self.calls, config["visibility_timeout"], config["sqs_latency"])
+        self.stepfunctions = LocalStepFunctions(self.calls, self.run_execution, config["stepfunctions_latency"])
+        self.dynamodb = LocalDynamoDB(self.calls, {"multia2ipdf_callback": "jobid", "multia2ipdf_coordination": "pk"}, config["dynamodb_latency"])
+        self.a2i = LocalA2I(self.calls, self.s3, self.deliver_human_loop_event, config["review_latency"], BUCKET)
+        self.textract = LocalTextract(
+            self.calls, config["textract_latency"], config["textract_limit_tps"], config["human_review_rate"],
+            config["blocks_per_page"], start_human_loop=self.a2i.start_human_loop, page_count=self.page_count
+        )
+        self.sf_queue = self.sqs.create_queue("multipagepdfa2i_sf_sqs")
+        self.textract_queue = self.sqs.create_queue("multipagepdfa2i_textract_sqs", config["max_receive_count"])
+
+        self.lambda_ = LocalLambda(self.calls, {"multipagepdfa2i_pagecount": self.count_pages})
+        self.services = {"s3": self.s3, "sqs": self.sqs, "stepfunctions": self.stepfunctions, "dynamodb": self.dynamodb,
+            "textract": self.textract, "lambda": self.lambda_}
+        self.resources = {"s3": LocalS3Resource(self.s3), "dynamodb": LocalDynamoDBResource(self.dynamodb)}
+        os.environ.update(ENVIRONMENT)
+        os.environ.update(config["environment"])
+        clients.reset()
+        clients.client = lambda service_name, **kwargs: self.services[service_name]
+        clients.resource = lambda service_name: self.resources[service_name]
+
+        self.handlers = {name: load_handler(name) for name in ["kickoff", "analyzedoc", "humancomplete", "wrapup"]}
+
+    # bookkeeping
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.stages.setdefault(stage, []).append(seconds)
+
+    def timed(self, stage, fn, *args):
+        start = self.clock()
+        try:
+            return fn(*args)
+        finally:
+            self.record(stage, self.clock() - start)
+
+    def lambda_ran(self, name, seconds, error=False):
+        with self.lock:
+            stats = self.lambdas.setdefault(name, {"invocations": 0, "errors": 0, "durations": []})
+            stats["invocations"] += 1
+            stats["errors"] += int(error)
+            stats["durations"].append(seconds)
+
+    def invoke(self, name, handler, event):
+        start = self.clock()
+        try:
+            result = handler.lambda_handler(event, None)
+        except Exception:
+            self.lambda_ran(name, self.clock() - start, True)
+            raise
+        self.lambda_ran(name, self.clock() - start)
+        return result
+
+    def page_count(self, bucket, key):
+        return self.documents[key]["pages"]
+
+    # event sources
+
+    def poll(self, name, queue_url, instance):
+        handler = load_handler(name, instance)
+        while not self.stopping.is_set():
+            records = self.sqs.receive(queue_url, self.config["batch_size"])
+            if not records:
+                time.sleep(0.01)
+                continue
+            try:
+                self.invoke(name, handler, {"Records": records})
+            except Exception:
+                # messages that weren't deleted come back after the visibility timeout
+                pass
+
+    def deliver_human_loop_event(self, event):
+        # EventBridge invokes asynchronously and retries failed invocations
+        def deliver():
+            for attempt in range(self.config["eventbridge_retries"] + 1):
+                try:
+                    self.invoke("humancomplete", self.handlers["humancomplete"], event)
+                    return
+                except Exception:
+                    time.sleep(0.5 * (attempt + 1))
+        threading.Thread(target=deliver, daemon=True).start()
+
+    # the state machine
+
+    def run_execution(self, execution):
+        state = dict(execution["input"])
+        document = self.documents[state["key"]]
+        self.record("kickoff", self.clock() - document["uploaded_at"])
+        try:
+            if state["extension"] == "pdf" and state.get("textract_mode") == "async":
+                state["image_keys"] = self.timed("native_pdf", self.analyze_document_async, state, execution["name"])
+            elif state.get("textract_mode") == "resume":
+                # kickoff's resume plan: only the missing chunks and the remaining pages
+                self.timed("rasterize", self.render_map, state, document, state["resume"]["chunks"])
+                results = self.timed("process_map", self.process_map, state, state["resume"]["pages"])
+                self.timed("review_map", self.review_map, state, results)
+            else:
+                if state["extension"] == "pdf":
+                    state["image_keys"] = self.timed("rasterize", self.rasterize, state, document)
+                else:
+                    state["image_keys"] = ["single_image"]
+                results = self.timed("process_map", self.process_map, state, [{"wip_key": wip_key} for wip_key in state["image_keys"]])
+                self.timed("review_map", self.review_map, state, results)
+            self.timed("wrapup", self.invoke, "wrapup", self.handlers["wrapup"], state)
+            execution["status"] = "SUCCEEDED"
+        except Exception as e:
+            execution["status"] = "FAILED"
+            execution["error"] = repr(e)
+        with self.lock:
+            document["finished_at"] = self.clock()
+            document["status"] = execution["status"]
+            self.finished.notify_all()
+        self.record("end_to_end", document["finished_at"] - document["uploaded_at"])
+
+    def count_pages(self, event):
+        # the pagecount lambda, with the span it logs
+        with spans.span("pagecount", event["id"]) as fields:
+            time.sleep(self.config["pagecount_seconds"])
+            pages = self.documents[event["key"]]["pages"]
+            fields["page_count"] = pages
+        self.lambda_ran("pagecount", self.config["pagecount_seconds"])
+        chunk_size = self.config["pages_per_chunk"]
+        return {
+            "page_count": pages,
+            "chunks": [{"first_page": str(first), "last_page": str(min(pages, first + chunk_size) - 1)}
+                for first in range(0, pages, chunk_size)],
+            "image_keys": [str(page) for page in range(pages)]
+        }
+
+    def rasterize(self, state, document):
+        # PageCount, then Render_Map
+        pages = self.count_pages(state)
+        self.render_map(state, document, pages["chunks"])
+        return pages["image_keys"]
+
+    def render_map(self, state, document, chunks):
+        # one pngextract invocation per chunk of pages, logging the spans the java lambda logs
+        def render(chunk):
+            start = self.clock()
+            first_page, last_page = int(chunk["first_page"]), int(chunk["last_page"])
+            with spans.span("render", state["id"], first_page=first_page, last_page=last_page) as fields:
+                for page in range(first_page, last_page + 1):
+                    time.sleep(self.config["render_seconds_per_page"])
+                    self.s3.put_object(
+                        Body=page_image(document["seed"], page, self.config["page_bytes"]),
+                        Bucket=state["bucket"],
+                        Key="wip/" + state["id"] + "/" + str(page) + ".png"
+                    )
+                fields["pages"] = last_page - first_page + 1
+            self.lambda_ran("pngextract", self.clock() - start)
+
+        with ThreadPoolExecutor(max_workers=self.config["render_concurrency"]) as executor:
+            list(executor.map(render, chunks))
+
+    def send_page(self, state, item):
+        # SqsSendMessage with a task token, returns the output sent back with the token
+        token = self.stepfunctions.new_task_token()
+        self.sqs.send_message(QueueUrl=self.textract_queue, MessageBody=json.dumps(dict({
+            "token": token,
+            "id": state["id"],
+            "bucket": state["bucket"],
+            "key": state["key"]
+        }, **item)))
+        output = self.stepfunctions.wait_for_task(token, self.config["timeout"])
+        if output is None:
+            raise TimeoutError("page " + item["wip_key"] + " of " + state["id"])
+        return output
+
+    def process_map(self, state, items):
+        # items are the page's fields sent on with it: wip_key, and stage when resuming. Returns
+        # each page's answer and when it was sent, for review_map.
+        def iteration(item):
+            sent = self.clock()
+            output = self.send_page(state, item)
+            if not output["review"]:
+                self.record("page_ai", self.clock() - sent)
+            return output, sent
+
+        with ThreadPoolExecutor(max_workers=self.config["pages_in_flight_per_document"]) as executor:
+            return list(executor.map(iteration, items))
+
+    def review_map(self, state, results):
+        # the pages in human review wait for humancomplete, outside of the document's window;
+        # the state machine only passes those pages to Review_Map
+        def iteration(result):
+            output, sent = result
+            self.send_page(state, {"wip_key": output["wip_key"], "stage": "await_human"})
+            self.record("page_human", self.clock() - sent)
+
+        reviews = [result for result in results if result[0]["review"]]
+        with ThreadPoolExecutor(max_workers=self.config["review_map_concurrency"]) as executor:
+            list(executor.map(iteration, reviews))
+
+    def analyze_document_async(self, state, execution_name):
+        handler = self.handlers["analyzedoc"]
+        analysis = self.invoke("analyzedoc", handler, {"action": "start", "id": state["id"], "execution": execution_name,
+            "bucket": state["bucket"], "key": state["key"]})
+        while True:
+            time.sleep(self.config["analyzedoc_wait"])
+            analysis = self.invoke("analyzedoc", handler, {"action": "check", "job_id": analysis["job_id"], "id": state["id"]})
+            if analysis["status"] in ("SUCCEEDED", "PARTIAL_SUCCESS"):
+                break
+            if analysis["status"] != "IN_PROGRESS":
+                raise RuntimeError("document analysis " + analysis["status"])
+        return self.invoke("analyzedoc", handler, {"action": "collect", "job_id": analysis["job_id"], "id": state["id"], "bucket": state["bucket"]})
+
+    # running a workload
+
+    def upload(self, key, pages, seed, pdf_bytes):
+        # the upload and the S3 notification the bucket sends to the kickoff queue
+        body = pdf_bytes if key.lower().endswith(".pdf") else page_image(seed, 0, self.config["page_bytes"])
+        etag = self.s3.store(BUCKET, key, body)
+        with self.lock:
+            # uploading a key again is the same document, kickoff doesn't start it twice
+            self.documents.setdefault(key, {"pages": pages, "seed": seed, "uploaded_at": self.clock()})
+        self.sqs.send_message(QueueUrl=self.sf_queue, MessageBody=json.dumps({"Records": [{
+            "eventName": "ObjectCreated:Put",
+            "eventTime": iso_time(),
+            "s3": {"bucket": {"name": BUCKET}, "object": {"key": quote_plus(key), "size": len(body), "eTag": etag.strip('"')}}
+        }]}))
+
+    def resume(self, id):
+        # kickoff's resume entry point, for a document whose execution named id failed. The
+        # resumed execution runs in the next run(), which can be given an empty workload.
+        key = self.stepfunctions.executions[id]["input"]["key"]
+        with self.lock:
+            self.documents[key].pop("finished_at", None)
+            self.documents[key].pop("status", None)
+        return self.invoke("kickoff", self.handlers["kickoff"], {"resume": id})
+
+    def run(self, workload, pdf_bytes=b"%PDF-1.4"):
+        # workload: (seconds after the start, upload key, pages, content seed) per document
+        self.stopping.clear()
+        pollers = [threading.Thread(target=self.poll, args=("kickoff", self.sf_queue, n), daemon=True)
+            for n in range(self.config["kickoff_concurrency"])]
+        pollers += [threading.Thread(target=self.poll, args=("analyzepdf", self.textract_queue, n), daemon=True)
+            for n in range(self.config["analyzepdf_concurrency"])]
+
+        with open(self.config["log_path"], "w") as log, contextlib.redirect_stdout(LockedWriter(log)):
+            for poller in pollers:
+                poller.start()
+            start = self.clock()
+            for offset, key, pages, seed in sorted(workload):
+                time.sleep(max(0.0, start + offset - self.clock()))
+                self.upload(key, pages, seed, pdf_bytes)
+            deadline = start + self.config["timeout"]
+            with self.lock:
+                while len(self.documents) > sum(1 for document in self.documents.values() if "finished_at" in document):
+                    if not self.finished.wait(max(0.0, deadline - self.clock())) and self.clock() >= deadline:
+                        break
+            end = self.clock()
+            self.stopping.set()
+            for poller in pollers:
+                poller.join()
+        return self.report(start, end)
+
+    def report(self, start, end):
+        documents = list(self.documents.values())
+        done = [document for document in documents if document.get("status") == "SUCCEEDED"]
+        seconds = end - start
+        return {
+            "documents": len(documents),
+            "succeeded": len(done),
+            "failed": sum(1 for document in documents if document.get("status") == "FAILED"),
+            "unfinished": sum(1 for document in documents if "status" not in document),
+            "pages": sum(document["pages"] for document in done),
+            "seconds": round(seconds, 2),
+            "documents_per_minute": round(len(done) / seconds * 60, 2),
+            "pages_per_minute": round(sum(document["pages"] for document in done) / seconds * 60, 2),
+            "stages": {stage: percentiles(values) for stage, values in sorted(self.stages.items())},
+            "lambdas": {name: dict({"invocations": stats["invocations"], "errors": stats["errors"]}, **{
+                "duration_" + k: v for k, v in percentiles(stats["durations"]).items() if k != "count"})
+                for name, stats in sorted(self.lambdas.items())},
+            "textract": {"throttles": self.textract.throttles, "human_loops": self.textract.human_loops},
+            "api_calls": self.calls.snapshot()
+        }
@@ -0,0 +1,153 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Synthetic Textract AnalyzeDocument responses and A2I answer payloads for benchmarking.
+
+import random
+import uuid
+
+CAMEL_CASE = {
+    "Blocks": "blocks",
+    "BlockType": "blockType",
+    "Id": "id",
+    "Text": "text",
+    "Relationships": "relationships",
+    "Type": "type",
+    "Ids": "ids",
+    "EntityTypes": "entityTypes",
+    "Confidence": "confidence",
+    "Page": "page",
+    "Geometry": "geometry",
+    "BoundingBox": "boundingBox",
+    "Polygon": "polygon",
+    "Width": "width",
+    "Height": "height",
+    "Left": "left",
+    "Top": "top"
+}
+
+WORDS = ["name", "date", "address", "total", "amount", "policy", "number", "city", "state", "signature", "phone", "zip"]
+
+def new_id(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+def geometry(rng):
+    left, top = rng.random(), rng.random()
+    width, height = rng.random() / 10, rng.random() / 50
+    return {
+        "BoundingBox": {"Width": width, "Height": height, "Left": left, "Top": top},
+        "Polygon": [
+            {"X": left, "Y": top},
+            {"X": left + width, "Y": top},
+            {"X": left + width, "Y": top + height},
+            {"X": left, "Y": top + height}
+        ]
+    }
+
+def word_blocks(rng, count):
+    blocks = []
+    for _ in range(count):
+        blocks.append({
+            "BlockType": "WORD",
+            "Id": new_id(rng),
+            "Text": rng.choice(WORDS),
+            "Confidence": round(rng.uniform(80, 100), 3)
+        })
+    return blocks
+
+def textract_response(block_count, kv_density=0.5, words_per_field=3, seed=0):
+    # kv_density is the share of blocks that belong to KEY/VALUE pairs, the rest are free text lines.
+    rng = random.Random(seed)
+    blocks = [{"BlockType": "PAGE", "Id": new_id(rng), "Page": 1}]
+    # a pair is 2 KEY_VALUE_SET blocks plus 2 * words_per_field WORD blocks
+    pair_size = 2 + 2 * words_per_field
+    pairs = max(1, int(block_count * kv_density) // pair_size)
+    line_size = 1 + words_per_field
+    lines = max(0, (block_count - pairs * pair_size - 1) // line_size)
+
+    for _ in range(lines):
+        words = word_blocks(rng, words_per_field)
+        blocks.append({
+            "BlockType": "LINE",
+            "Id": new_id(rng),
+            "Text": " ".join(word["Text"] for word in words),
+            "Relationships": [{"Type": "CHILD", "Ids": [word["Id"] for word in words]}]
+        })
+        blocks.extend(words)
+
+    for _ in range(pairs):
+        key_words = word_blocks(rng, words_per_field)
+        value_words = word_blocks(rng, words_per_field)
+        key_id = new_id(rng)
+        value_id = new_id(rng)
+        blocks.append({
+            "BlockType": "KEY_VALUE_SET",
+            "Id": key_id,
+            "EntityTypes": ["KEY"],
+            "Confidence": round(rng.uniform(50, 100), 3),
+            "Relationships": [
+                {"Type": "VALUE", "Ids": [value_id]},
+                {"Type": "CHILD", "Ids": [word["Id"] for word in key_words]}
+            ]
+        })
+        blocks.append({
+            "BlockType": "KEY_VALUE_SET",
+            "Id": value_id,
+            "EntityTypes": ["VALUE"],
+            "Confidence": round(rng.uniform(50, 100), 3),
+            "Relationships": [{"Type": "CHILD", "Ids": [word["Id"] for word in value_words]}]
+        })
+        blocks.extend(key_words)
+        blocks.extend(value_words)
+
+    for block in blocks:
+        block["Geometry"] = geometry(rng)
+
+    return {
+        "DocumentMetadata": {"Pages": 1},
+        "Blocks": blocks,
+        "HumanLoopActivationOutput": {"HumanLoopActivationReasons": []}
+    }
+
+def to_camel_case(value):
+    if isinstance(value, dict):
+        return {CAMEL_CASE.get(k, k): to_camel_case(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_camel_case(v) for v in value]
+    return value
+
+def a2i_output(block_count, kv_density=0.5, words_per_field=3, seed=0, human_loop_name="00000000000000000000000000000000i0"):
+    # Same shape as the object A2I writes to the human loop's output S3 uri.
+    # inputContent carries the original Textract response, like the real output does
+    response = textract_response(block_count, kv_density, words_per_field, seed)
+    forms = to_camel_case(response)
+    return {
+        "humanLoopName": human_loop_name,
+        "inputContent": {
+            "aiServiceRequest": {
+                "document": {"s3Object": {"bucket": "bucket", "name": "wip/" + human_loop_name.split("i")[0] + "/0.png"}},
+                "featureTypes": ["FORMS"]
+            },
+            "aiServiceResponse": forms
+        },
+        "humanAnswers": [{
+            "answerContent": {"AWS/Textract/AnalyzeDocument/Forms/V1": {"blocks": forms["blocks"]}},
+            "workerId": "worker"
+        }]
+    }
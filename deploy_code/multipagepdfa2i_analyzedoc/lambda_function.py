@@ -0,0 +1,134 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import clients
+import csv_fragments
+import metrics
+import rate_limiter
+import spans
+import textract_async
+
+# Native PDF mode: the whole PDF goes to asynchronous Textract document analysis instead of
+# one PNG, SQS message and AnalyzeDocument call per page. The state machine calls this
+# handler with action "start", then "check" until the job is done, then "collect", which
+# writes each page's key/values to wip/<id>/<n>.png/ai/output.json, and its csv fragment,
+# like analyzepdf does.
+
+METRICS = metrics.get("analyzedoc")
+
+get_limiter = None
+get_limiter_lock = threading.Lock()
+
+def get_textract_get_limiter():
+    # GetDocumentAnalysis has its own quota, paced separately from AnalyzeDocument
+    global get_limiter
+    with get_limiter_lock:
+        if get_limiter is None:
+            store = None
+            if os.environ.get("coordination_table"):
+                store = rate_limiter.DynamoDBRateStore(clients.client('dynamodb'), os.environ["coordination_table"], "textract_get")
+            get_limiter = rate_limiter.limiter_from_environment("textract_get", store)
+    return get_limiter
+
+def get_write_workers():
+    return int(os.environ.get("write_workers", "16"))
+
+def get_page_key(id, page):
+    # textract pages are 1 based, the png keys of the page mode are 0 based
+    return "wip/" + id + "/" + str(page - 1) + ".png/ai/output.json"
+
+def start(client, event):
+    # The execution name makes a retried start return the same job. A resumed document's
+    # execution has a name of its own (<id>-resume-<time>), so it gets a new job.
+    with METRICS.timer("textract_start_time"):
+        job_id = textract_async.start_analysis(
+            client, event["bucket"], event["key"], ["FORMS"],
+            request_token=event.get("execution", event["id"])[:64], job_tag="multipagepdfa2i"
+        )
+    print("started textract job", job_id, "for", event["key"])
+    return {"job_id": job_id}
+
+def check(client, event):
+    with METRICS.timer("textract_status_time"):
+        status, message = textract_async.get_job_status(client, event["job_id"])
+    print("textract job", event["job_id"], status, message)
+    return {"job_id": event["job_id"], "status": status, "message": message}
+
+def write_page(s3, bucket, key, kv_list):
+    body = json.dumps(kv_list)
+    with METRICS.timer("s3_write_time"):
+        s3.put_object(Body=body, Bucket=bucket, Key=key)
+    with METRICS.timer("s3_write_time"):
+        size = csv_fragments.write_fragment(s3, bucket, csv_fragments.get_base_key(key), {"ai": kv_list})
+    METRICS.add_bytes("bytes_written", len(body) + size)
+    METRICS.add("key_values", len(kv_list))
+
+def collect(client, s3, event, limiter=None):
+    # returns the page keys ("0", "1", ...) for wrapup, in page order
+    def call(fn, **kwargs):
+        # each GetDocumentAnalysis page, with the rate limiter's waits and retries
+        with METRICS.timer("textract_get_time"):
+            if limiter is None:
+                return fn(**kwargs)
+            return rate_limiter.call(limiter, fn, **kwargs)
+
+    # the blocks are parsed as the result pages come in, the time includes the gets
+    with METRICS.timer("read_parse_time"):
+        pages = textract_async.key_values_by_page(textract_async.iter_blocks(client, event["job_id"], call=call))
+    METRICS.add("pages", len(pages))
+    with ThreadPoolExecutor(max_workers=get_write_workers()) as executor:
+        futures = [
+            executor.submit(write_page, s3, event["bucket"], get_page_key(event["id"], page), kv_list)
+            for page, kv_list in pages.items()
+        ]
+        for future in futures:
+            future.result()
+    print("textract job", event["job_id"], "wrote", len(pages), "pages")
+    return [str(page - 1) for page in sorted(pages)]
+
+def lambda_handler(event, context):
+    try:
+        with spans.span("analyzedoc", event.get("id"), action=event["action"]) as fields:
+            result = handle_action(event)
+            if event["action"] == "check":
+                fields["status"] = result["status"]
+            elif event["action"] == "collect":
+                fields["pages"] = len(result)
+            return result
+    finally:
+        METRICS.flush({"action": event["action"]})
+
+def handle_action(event):
+    action = event["action"]
+    if action == "start":
+        return start(clients.client('textract'), event)
+    if action == "check":
+        return check(clients.client('textract'), event)
+    if action == "collect":
+        return collect(
+            clients.client('textract', max_attempts=1),
+            clients.client('s3', max_pool_connections=get_write_workers()),
+            event,
+            get_textract_get_limiter()
+        )
+    raise ValueError("unknown action " + action)
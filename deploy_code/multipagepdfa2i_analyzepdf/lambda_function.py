@@ -18,107 +18,328 @@
 
 
 import json
-import boto3
 import botocore
 import os
-from clean_data import extract_data
-
-def invoke_to_get_back_to_stepfunction(event):
-    client = boto3.client('stepfunctions')
-    response = client.send_task_success(
-        taskToken = event['token'],
-        output = json.dumps({"all": "done"})
-    )
-    return response
+import threading
+from textract_blocks import extract_key_values
+import clients
+import csv_fragments
+import metrics
+import rate_limiter
+import result_cache
+import spans
+from sqs_batch import process_records, complete_batch
+
+METRICS = metrics.get("analyzepdf")
+
+# callback_token of the item a page gets when it goes to human review, until the execution's
+# Review_Map waits for the answer with a token of its own
+PENDING_REVIEW = "pending"
+
+def invoke_to_get_back_to_stepfunction(event, review=False):
+    # the Process_Map result, Review_Map waits for the pages that went to human review. A
+    # token that isn't waiting any more (a redelivered page already answered, or an execution
+    # that ended) has nothing left to answer, the message is done rather than dead-lettered.
+    client = clients.client('stepfunctions')
+    try:
+        with METRICS.timer("send_task_success_time"):
+            return client.send_task_success(
+                taskToken = event['token'],
+                output = json.dumps({"wip_key": event["wip_key"], "review": review})
+            )
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] not in ("TaskTimedOut", "InvalidToken"):
+            raise
+        print("task token no longer waiting:", event["id"], event["wip_key"])
+        METRICS.add("stale_tokens")
+        return None
 
 def dump_task_token_in_dynamodb(event):
-    dynamodb = boto3.client('dynamodb')
-    response = dynamodb.put_item(
-        TableName='multia2ipdf_callback',
-        Item={
-            'jobid': {'S': event["human_loop_id"]},
-            'callback_token': {'S': event["token"]}
-        }
-    )
+    dynamodb = clients.client('dynamodb')
+    with METRICS.timer("token_write_time"):
+        response = dynamodb.put_item(
+            TableName='multia2ipdf_callback',
+            Item={
+                'jobid': {'S': event["human_loop_id"]},
+                'callback_token': {'S': event["token"]},
+                # lets humancomplete add the reviewed answer to the result cache
+                'cache_key': {'S': event.get("cache_key", "")}
+            }
+        )
     return response
 
-def write_ai_response_to_bucket(event, data):
-    client = boto3.client('s3')
-    response = client.put_object(
-        Body = json.dumps(data),
-        Bucket = event["bucket"],
-        Key = event["s3_location"]
-    )
+def output_exists(bucket, key):
+    try:
+        clients.client('s3').head_object(Bucket=bucket, Key=key)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+def await_human_review(event):
+    # Review_Map's wait for a page in human review: humancomplete sends its answer to this
+    # token, the pending item (or the tokens a failed execution left) are dropped. Runs on the
+    # record workers, so it uses the (thread safe) client rather than the table resource.
+    dynamodb = clients.client('dynamodb')
+    with METRICS.timer("token_read_time"):
+        items = dynamodb.query(
+            TableName='multia2ipdf_callback',
+            KeyConditionExpression="jobid = :jobid",
+            ExpressionAttributeValues={":jobid": {'S': event["human_loop_id"]}}
+        )["Items"]
+    stale = [item for item in items if item["callback_token"]['S'] != event["token"]]
+    event["cache_key"] = next((item["cache_key"]['S'] for item in items if item.get("cache_key", {}).get('S')), "")
+    dump_task_token_in_dynamodb(event)
+    for item in stale:
+        dynamodb.delete_item(
+            TableName='multia2ipdf_callback',
+            Key={"jobid": item["jobid"], "callback_token": item["callback_token"]}
+        )
+    # the loop may have completed before the token was replaced, its answer is already there
+    if not output_exists(event["bucket"], event["s3_location"].replace("/ai/output.json", "/human/output.json")):
+        return "human_review"
+    # humancomplete may get to the new token first
+    invoke_to_get_back_to_stepfunction(event)
+    return "done"
+
+def put_output(bucket, key, data):
+    client = clients.client('s3')
+    body = json.dumps(data)
+    with METRICS.timer("s3_write_time"):
+        response = client.put_object(
+            Body = body,
+            Bucket = bucket,
+            Key = key
+        )
+    METRICS.add_bytes("bytes_written", len(body))
     return response
 
+def write_ai_response_to_bucket(event, data):
+    return put_output(event["bucket"], event["s3_location"], data)
+
+def write_csv_fragment(event, outputs):
+    # the page's rows of the final csv, wrapup only stitches these together
+    with METRICS.timer("s3_write_time"):
+        size = csv_fragments.write_fragment(
+            clients.client('s3'),
+            event["bucket"],
+            csv_fragments.get_base_key(event["s3_location"]),
+            outputs
+        )
+    METRICS.add_bytes("bytes_written", size)
+    return size
+
+def write_cached_human_response_to_bucket(event, data):
+    return put_output(event["bucket"], event["s3_location"].replace("/ai/output.json", "/human/output.json"), data)
+
+page_cache = None
+page_cache_lock = threading.Lock()
+
+def get_page_cache():
+    # one cache per execution environment, None when the cache is turned off
+    global page_cache
+    with page_cache_lock:
+        if page_cache is None:
+            page_cache = result_cache.cache_from_environment(clients.client('dynamodb')) or False
+    return page_cache or None
+
+def get_cache_key(event):
+    # the result depends on the image and on the features and human review workflow asked for
+    image_hash = result_cache.content_hash(clients.client('s3'), event["bucket"], event["process_key"])
+    return result_cache.cache_key(image_hash, "FORMS", os.environ['human_workflow_arn'])
+
+def answer_from_cache(cache, event):
+    # Returns True when the page was answered from the cache. Pages that needed human review
+    # only count once the reviewed answer has been cached too. The cache never fails a page,
+    # a lookup that errors is a miss.
+    try:
+        with METRICS.timer("cache_lookup_time"):
+            event["cache_key"] = get_cache_key(event)
+            entry = cache.get(event["cache_key"])
+    except Exception as e:
+        print("result cache lookup failed:", repr(e))
+        METRICS.add("cache_read_errors")
+        return False
+    if entry is None or (entry["needs_review"] and "human_kv_list" not in entry):
+        METRICS.add("cache_misses")
+        return False
+    METRICS.add("cache_hits")
+    write_ai_response_to_bucket(event, entry["kv_list"])
+    outputs = {"ai": entry["kv_list"]}
+    if entry["needs_review"]:
+        write_cached_human_response_to_bucket(event, entry["human_kv_list"])
+        outputs["human"] = entry["human_kv_list"]
+    write_csv_fragment(event, outputs)
+    invoke_to_get_back_to_stepfunction(event)
+    return True
+
+def cache_answer(cache, event, kv_list, need_to_human_review):
+    # Best effort like the lookup: the page goes on to human review or completion whatever
+    # happens here, failing it would only analyze it again (and start its human loop again).
+    if not event.get("cache_key"):
+        return
+    try:
+        with METRICS.timer("cache_write_time"):
+            cache.put(event["cache_key"], kv_list, need_to_human_review)
+    except Exception as e:
+        print("result cache write failed:", event["cache_key"], repr(e))
+        METRICS.add("cache_write_errors")
+
+textract_limiter = None
+textract_limiter_lock = threading.Lock()
+
+def get_textract_limiter():
+    # one limiter per execution environment, shared by the page worker threads
+    global textract_limiter
+    with textract_limiter_lock:
+        if textract_limiter is None:
+            store = None
+            if os.environ.get("coordination_table"):
+                store = rate_limiter.DynamoDBRateStore(clients.client('dynamodb'), os.environ["coordination_table"], "textract")
+            textract_limiter = rate_limiter.limiter_from_environment("textract", store)
+    return textract_limiter
+
 def run_analyze_document(event):
-    client = boto3.client('textract')
+    # throttling is retried by the rate limiter, so botocore doesn't retry on its own
+    client = clients.client('textract', max_attempts=1)
     
-    response = client.analyze_document(
-        Document={
-            'S3Object': {
-                'Bucket': event["bucket"],
-                'Name': event["process_key"]
-            }
-        },
-        FeatureTypes=['FORMS'],
-        HumanLoopConfig={
-            'HumanLoopName': event["human_loop_id"],
-            'FlowDefinitionArn': os.environ['human_workflow_arn'],
-            'DataAttributes': {
-                'ContentClassifiers': [
-                    'FreeOfPersonallyIdentifiableInformation',
-                    'FreeOfAdultContent'
-                ]
+    # includes the rate limiter's waits and retries
+    with METRICS.timer("textract_time"):
+        response = rate_limiter.call(
+            get_textract_limiter(),
+            client.analyze_document,
+            Document={
+                'S3Object': {
+                    'Bucket': event["bucket"],
+                    'Name': event["process_key"]
+                }
+            },
+            FeatureTypes=['FORMS'],
+            HumanLoopConfig={
+                'HumanLoopName': event["human_loop_id"],
+                'FlowDefinitionArn': os.environ['human_workflow_arn'],
+                'DataAttributes': {
+                    'ContentClassifiers': [
+                        'FreeOfPersonallyIdentifiableInformation',
+                        'FreeOfAdultContent'
+                    ]
+                }
             }
-        }
-    )
+        )
     need_to_human_review = False
     if len(response["HumanLoopActivationOutput"]["HumanLoopActivationReasons"]) != 0:
         need_to_human_review = True
     return response, need_to_human_review
     
-def lambda_handler(event, context):
-    for record in event["Records"]:
-        
-        body = json.loads(record["body"])
-        
-        # body looks like:
-        # {
-        #     "bucket": "",
-        #     "wip_key": "",
-        #     "id": "",
-        #     "key": ""
-        # }
-
-        if body["wip_key"] == "single_image":
-            body["process_key"] = body["key"]
-            body["human_loop_id"] = body["id"] + "i0"
-            body["s3_location"] = "wip/" + body["id"] + "/0.png/ai/output.json"
-        else:
-            body["process_key"] = "wip/" + body["id"] + "/" + body["wip_key"] + ".png"
-            body["human_loop_id"] = body["id"] + "i" + body["wip_key"]
-            body["s3_location"] = body["process_key"] + "/ai/output.json"
-            
-        print("process_key:", body["process_key"])
-        print("human_loop_id:", body["human_loop_id"])
-        print("s3_location:", body["s3_location"])
-        
-
-        response, need_to_human_review = run_analyze_document(body)
-        kv_list = extract_data(response)
-
-        write_ai_response_to_bucket(body, kv_list)
-
-        if need_to_human_review is True:
-            response = dump_task_token_in_dynamodb(body)
-        if need_to_human_review is False:
-            response = invoke_to_get_back_to_stepfunction(body)
-        
-        client = boto3.client('sqs')
-        response = client.delete_message(
-            QueueUrl=os.environ['sqs_url'],
-            ReceiptHandle=record["receiptHandle"]
-        )
+def get_page_workers():
+    return int(os.environ.get("page_workers", "10"))
+
+def get_max_receive_count():
+    # the textract queue's maxReceiveCount, 0 when there is no dead letter queue
+    return int(os.environ.get("max_receive_count", "0"))
+
+def is_last_receive(record):
+    receives = int(record.get("attributes", {}).get("ApproximateReceiveCount", "1"))
+    return 0 < get_max_receive_count() <= receives
+
+def fail_task(body, error):
+    # the message is about to be dead-lettered, the execution fails instead of waiting for it
+    try:
+        with METRICS.timer("send_task_failure_time"):
+            clients.client('stepfunctions').send_task_failure(
+                taskToken=body["token"],
+                error="PageFailed",
+                cause=("page " + body["wip_key"] + " of " + body["id"] + ": " + repr(error))[:32768]
+            )
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] not in ("TaskTimedOut", "InvalidToken"):
+            raise
+    METRICS.add("pages_failed")
+
+def process_record(record):
+    body = json.loads(record["body"])
+    try:
+        handle_record(record, body)
+    except Exception as e:
+        if is_last_receive(record):
+            fail_task(body, e)
+        raise
 
-    return "all_done"
+def handle_record(record, body):
+    
+    # body looks like:
+    # {
+    #     "bucket": "",
+    #     "wip_key": "",
+    #     "id": "",
+    #     "key": "",
+    #     "stage": "analyze" | "review" (resuming a document) | "await_human" (Review_Map)
+    # }
+
+    if body["wip_key"] == "single_image":
+        body["process_key"] = body["key"]
+        body["human_loop_id"] = body["id"] + "i0"
+        body["s3_location"] = "wip/" + body["id"] + "/0.png/ai/output.json"
+        page = 0
+    else:
+        body["process_key"] = "wip/" + body["id"] + "/" + body["wip_key"] + ".png"
+        body["human_loop_id"] = body["id"] + "i" + body["wip_key"]
+        body["s3_location"] = body["process_key"] + "/ai/output.json"
+        page = int(body["wip_key"])
+
+    print("process_key:", body["process_key"])
+    print("human_loop_id:", body["human_loop_id"])
+    print("s3_location:", body["s3_location"])
+
+    if body.get("stage") == "await_human":
+        with spans.span("review_wait", body["id"], page, sent=spans.sqs_sent(record)) as fields:
+            fields["outcome"] = await_human_review(body)
+        return
+    with spans.span("page", body["id"], page, sent=spans.sqs_sent(record)) as fields:
+        fields["outcome"] = process_page(body)
+
+def process_page(body):
+    # "cache", "human_review" or "done"
+    METRICS.add("pages")
+    if body.get("stage") == "review":
+        # a resumed page already in human review, straight on to Review_Map
+        invoke_to_get_back_to_stepfunction(body, review=True)
+        return "human_review"
+    cache = get_page_cache()
+    if cache is not None and answer_from_cache(cache, body):
+        print("answered from cache:", body["cache_key"])
+        return "cache"
+
+    response, need_to_human_review = run_analyze_document(body)
+    with METRICS.timer("parse_time"):
+        kv_list = extract_key_values(response)
+    METRICS.add("blocks", len(response["Blocks"]))
+    METRICS.add("key_values", len(kv_list))
+
+    write_ai_response_to_bucket(body, kv_list)
+    if cache is not None:
+        cache_answer(cache, body, kv_list, need_to_human_review)
+
+    if need_to_human_review is True:
+        # the page leaves the document's window of pages in flight while it is reviewed
+        METRICS.add("human_reviews")
+        response = dump_task_token_in_dynamodb(dict(body, token=PENDING_REVIEW))
+        response = invoke_to_get_back_to_stepfunction(body, review=True)
+        return "human_review"
+    # reviewed pages get their fragment from humancomplete
+    write_csv_fragment(body, {"ai": kv_list})
+    response = invoke_to_get_back_to_stepfunction(body)
+    return "done"
+
+def lambda_handler(event, context):
+    # pages of the batch are analyzed concurrently, only failed ones go back to the queue
+    succeeded, failed = process_records(event["Records"], process_record, get_page_workers())
+    if get_page_cache() is not None:
+        print("result_cache:", json.dumps(get_page_cache().stats()))
+    METRICS.add("messages_failed", len(failed))
+    try:
+        with METRICS.timer("sqs_delete_time"):
+            return complete_batch(clients.client('sqs'), os.environ['sqs_url'], succeeded, failed)
+    finally:
+        METRICS.flush()
@@ -18,45 +18,116 @@
 
 
 import json
-import boto3
+import os
+import botocore
 from boto3.dynamodb.conditions import Key
-from clean_data import create_human_kv_list
+from textract_blocks import extract_key_values
+from stream_data import read_human_output
+import clients
+import csv_fragments
+import metrics
+import result_cache
+import spans
+
+METRICS = metrics.get("humancomplete")
 
 def return_to_stepfunctions(payload):
-    client = boto3.client('stepfunctions')
-    response = client.send_task_success(
-        taskToken = payload['token'],
-        output = json.dumps({ 
-            "includes_human": "yes",
-            "output_dest": payload["final_dest"],
-            "bucket": payload["bucket"],
-            "id": payload["id"],
-            "key": payload["key"]
-        })
-    )
-    return response
+    client = clients.client('stepfunctions')
+    try:
+        with METRICS.timer("send_task_success_time"):
+            return client.send_task_success(
+                taskToken = payload['token'],
+                output = json.dumps({ 
+                    "includes_human": "yes",
+                    "output_dest": payload["final_dest"],
+                    "bucket": payload["bucket"],
+                    "id": payload["id"],
+                    "key": payload["key"]
+                })
+            )
+    except botocore.exceptions.ClientError as e:
+        # the waiting Review_Map iteration found the answer first and finished the page
+        if e.response["Error"]["Code"] not in ("TaskTimedOut", "InvalidToken"):
+            raise
+        print("task already finished:", payload["human_loop_id"])
+        return None
 
 def write_to_s3_human_response(payload):
-    client = boto3.client('s3')
-    response = client.put_object(
-        Body = json.dumps(payload["kv_list"]),
-        Bucket = payload["bucket"],
-        Key = payload["final_dest"]
-    )
+    client = clients.client('s3')
+    body = json.dumps(payload["kv_list"])
+    with METRICS.timer("s3_write_time"):
+        response = client.put_object(
+            Body = body,
+            Bucket = payload["bucket"],
+            Key = payload["final_dest"]
+        )
+    METRICS.add_bytes("bytes_written", len(body))
     return response
 
+def write_csv_fragment(payload):
+    # the page's rows of the final csv: the ai answer analyzepdf wrote, then the reviewed one
+    client = clients.client('s3')
+    with METRICS.timer("s3_read_time"):
+        response = client.get_object(
+            Bucket = payload["bucket"],
+            Key = payload["final_dest"].replace("/human/output.json", "/ai/output.json")
+        )
+        outputs = {"ai": json.load(response["Body"]), "human": payload["kv_list"]}
+    METRICS.add_bytes("bytes_read", response["ContentLength"])
+    with METRICS.timer("s3_write_time"):
+        size = csv_fragments.write_fragment(client, payload["bucket"], csv_fragments.get_base_key(payload["final_dest"]), outputs)
+    METRICS.add_bytes("bytes_written", size)
+    return size
+
 def get_s3_data(payload):
-    s3 = boto3.resource('s3')
+    s3 = clients.resource('s3')
+    obj = s3.Object(payload["bucket"], payload["key"])
+    with METRICS.timer("s3_read_time"):
+        body = obj.get()['Body'].read()
+    METRICS.add_bytes("bytes_read", len(body))
+    with METRICS.timer("json_load_time"):
+        return json.loads(body)
+
+def stream_s3_data(payload):
+    s3 = clients.resource('s3')
     obj = s3.Object(payload["bucket"], payload["key"])
-    body = obj.get()['Body'].read()
-    return json.loads(body)
+    response = obj.get()
+    METRICS.add_bytes("bytes_read", response["ContentLength"])
+    body = response['Body']
+    try:
+        # reading and parsing are interleaved, the time covers both
+        with METRICS.timer("stream_parse_time"):
+            return read_human_output(body)
+    finally:
+        body.close()
 
-def get_token(payload):
-    dynamodb = boto3.resource('dynamodb')
+# analyzepdf's item for a page in human review that no Review_Map iteration waits for yet
+PENDING_REVIEW = "pending"
+
+def get_callback(payload):
+    # (task token or None, cache key). Read after the answer is written: a Review_Map
+    # iteration that registers its token later finds the answer and finishes the page itself.
+    dynamodb = clients.resource('dynamodb')
     table = dynamodb.Table('multia2ipdf_callback')
-    response = table.query( KeyConditionExpression=Key('jobid').eq(payload["human_loop_id"]) )
-    token = response['Items'][0]['callback_token']
-    return token
+    with METRICS.timer("token_read_time"):
+        response = table.query( KeyConditionExpression=Key('jobid').eq(payload["human_loop_id"]) )
+    tokens = [item['callback_token'] for item in response['Items'] if item['callback_token'] != PENDING_REVIEW]
+    cache_key = next((item['cache_key'] for item in response['Items'] if item.get('cache_key')), "")
+    return (tokens[0] if tokens else None), cache_key
+
+def update_result_cache(payload):
+    # The page's ai answer was cached by analyzepdf, add the reviewed answer next to it. Best
+    # effort: the page is already done, a failed cache write only costs a future hit.
+    cache = result_cache.cache_from_environment(clients.client('dynamodb'))
+    if cache is None or not payload["cache_key"]:
+        return False
+    try:
+        with METRICS.timer("cache_write_time"):
+            return cache.put_human(payload["cache_key"], payload["kv_list"])
+    except Exception as e:
+        print("result cache write failed:", payload["cache_key"], repr(e))
+        METRICS.add("cache_write_errors")
+        return False
 
 def create_final_dest(id, key):
     prefix = key[:3].lower()
@@ -74,19 +145,45 @@ def create_payload(event):
     payload["bucket"] = cur[:cur.find("/")]
     payload["key"] = cur[len(payload["bucket"])+1:]
 
-    payload["response"] = get_s3_data(payload)
-    payload["human_loop_id"] = payload["response"]["humanLoopName"]
+    if os.environ.get("stream_human_output", "false").lower() == "true":
+        human_loop_name, document_name, payload["kv_list"] = stream_s3_data(payload)
+    else:
+        response = get_s3_data(payload)
+        human_loop_name = response["humanLoopName"]
+        document_name = response["inputContent"]["aiServiceRequest"]["document"]["s3Object"]["name"]
+        payload["kv_list"] = create_human_kv_list(response)
+
+    METRICS.add("key_values", len(payload["kv_list"]))
+    payload["human_loop_id"] = human_loop_name
     payload["id"] = payload["human_loop_id"][:payload["human_loop_id"].rfind("i")]
-    payload["final_dest"] = create_final_dest(payload["id"], payload["response"]["inputContent"]["aiServiceRequest"]["document"]["s3Object"]["name"])
-    payload["token"] = get_token(payload)
+    payload["final_dest"] = create_final_dest(payload["id"], document_name)
     return payload
 
+def create_human_kv_list(response):
+    data = response["humanAnswers"][0]["answerContent"]["AWS/Textract/AnalyzeDocument/Forms/V1"]
+    with METRICS.timer("parse_time"):
+        return extract_key_values(data)
+
 def lambda_handler(event, context):
     if event["detail"]["humanLoopStatus"] == "Completed":
-        payload = create_payload(event)
-        payload["kv_list"] = create_human_kv_list(payload)
-        response = write_to_s3_human_response(payload)
-        response = return_to_stepfunctions(payload)
+        detail = event["detail"]
+        # the human loop name is <id>i<page>
+        name = detail["humanLoopName"]
+        try:
+            with spans.span("humancomplete", name[:name.rfind("i")], int(name[name.rfind("i")+1:]),
+                    loop_created=spans.parse_time(detail.get("creationTime")), loop_completed=spans.parse_time(event.get("time"))):
+                METRICS.add("pages")
+                payload = create_payload(event)
+                response = write_to_s3_human_response(payload)
+                write_csv_fragment(payload)
+                payload["token"], payload["cache_key"] = get_callback(payload)
+                if payload["token"] is None:
+                    print("no execution waiting for", payload["human_loop_id"], "yet")
+                else:
+                    response = return_to_stepfunctions(payload)
+                update_result_cache(payload)
+        finally:
+            METRICS.flush()
         return "all done"
     else:
         return "dont_care"
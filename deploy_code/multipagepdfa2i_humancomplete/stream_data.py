@@ -0,0 +1,82 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Streaming read of the A2I human loop output.
+#
+# The output object holds the original Textract response (inputContent.aiServiceResponse)
+# as well as the reviewed answer, so it can be large. Only humanLoopName, the input document
+# name and the reviewed blocks are pulled out; the blocks are indexed as they are read.
+
+from json_stream import JsonStream
+from textract_blocks import CAMEL_CASE_KEYS, new_index, add_block, key_values_from_index
+
+FORMS_ANSWER = "AWS/Textract/AnalyzeDocument/Forms/V1"
+
+def read_document_name(stream):
+    name = None
+    for key in stream.members():
+        if key == "aiServiceRequest":
+            for request_key in stream.members():
+                if request_key == "document":
+                    name = stream.value()["s3Object"]["name"]
+                else:
+                    stream.skip()
+        else:
+            stream.skip()
+    return name
+
+def read_blocks(stream, index):
+    for _ in stream.items():
+        add_block(index, stream.value(), CAMEL_CASE_KEYS)
+
+def read_answer(stream, index):
+    for key in stream.members():
+        if key != "answerContent":
+            stream.skip()
+            continue
+        for content_key in stream.members():
+            if content_key != FORMS_ANSWER:
+                stream.skip()
+                continue
+            for forms_key in stream.members():
+                if forms_key == "blocks":
+                    read_blocks(stream, index)
+                else:
+                    stream.skip()
+
+def read_human_output(body):
+    stream = JsonStream(body)
+    index = new_index()
+    human_loop_name = None
+    document_name = None
+    for key in stream.members():
+        if key == "humanLoopName":
+            human_loop_name = stream.value()
+        elif key == "inputContent":
+            document_name = read_document_name(stream)
+        elif key == "humanAnswers":
+            for position in stream.items():
+                # only the first answer is used, same as the non streaming path
+                if position == 0:
+                    read_answer(stream, index)
+                else:
+                    stream.skip()
+        else:
+            stream.skip()
+    return human_loop_name, document_name, key_values_from_index(index, CAMEL_CASE_KEYS)
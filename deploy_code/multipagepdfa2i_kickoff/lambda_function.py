@@ -17,59 +17,136 @@
 #  */
 
 
+import hashlib
 import json
-import boto3
-import uuid
 import os
+import time
+import uuid
 from urllib.parse import unquote, unquote_plus
+import clients
+import metrics
+import spans
+import resume
+from sqs_batch import process_records, complete_batch
 
-def start_step_function(payload):
-    client = boto3.client('stepfunctions')
-    response = client.start_execution(
-        stateMachineArn=os.environ['state_machine_arn'],
-        name = payload["id"],
-        input = json.dumps(payload, indent=3, default=str),
-    )
+def get_textract_mode():
+    return os.environ.get("textract_mode", "pages")
+
+def get_start_workers():
+    return int(os.environ.get("start_workers", "10"))
+
+def get_inflight_window():
+    # seconds identical content stays claimed by the first execution, 0 turns the claim off
+    return int(os.environ.get("inflight_window_seconds", "0"))
+
+METRICS = metrics.get("kickoff")
+
+def start_step_function(client, payload):
+    # None when the execution was already started, by a duplicate delivery of the event or an
+    # upload of the same content to the same key. StartExecution with the name and input of a
+    # running execution succeeds without starting anything, so each call's input has its own
+    # request id: a duplicate always gets ExecutionAlreadyExists, while botocore's retries of
+    # this same call still get the execution it started.
+    payload = dict(payload, request=uuid.uuid4().hex)
+    try:
+        with METRICS.timer("start_execution_time"):
+            response = client.start_execution(
+                stateMachineArn=os.environ['state_machine_arn'],
+                name = payload["id"],
+                input = json.dumps(payload, indent=3, default=str),
+            )
+    except client.exceptions.ExecutionAlreadyExists:
+        print("execution already exists:", payload["id"], payload["key"])
+        METRICS.add("duplicate_executions")
+        return None
+    METRICS.add("executions_started")
     return response
 
+def get_execution_id(bucket, key, s3_object):
+    # The same object always gets the same id, and so the same execution name. The ETag stands
+    # for the content, the version id (or the event's sequencer) is only used without one.
+    identity = s3_object.get("eTag") or s3_object.get("versionId") or s3_object.get("sequencer", "")
+    return hashlib.sha256("\n".join([bucket, key, identity]).encode("utf-8")).hexdigest()[:32]
+
+def claim_content(dynamodb, data, window):
+    # Claims the content (ETag and size) for `window` seconds. False when another execution
+    # holds the claim, e.g. the same file uploaded under another key a minute ago. The
+    # execution holding it may claim it again, so a retried event isn't locked out.
+    now = int(time.time())
+    try:
+        with METRICS.timer("claim_time"):
+            dynamodb.put_item(
+                TableName=os.environ["coordination_table"],
+                Item={
+                    "pk": {"S": "inflight#" + data["etag"] + "#" + str(data["size"])},
+                    "execution_id": {"S": data["id"]},
+                    "key": {"S": data["key"]},
+                    "expires_at": {"N": str(now + window)}
+                },
+                ConditionExpression="attribute_not_exists(pk) OR expires_at < :now OR execution_id = :id",
+                ExpressionAttributeValues={":now": {"N": str(now)}, ":id": {"S": data["id"]}}
+            )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
 def extract_event_data(record):
     s3 = record["s3"]
-    id = uuid.uuid4().hex
     bucket = s3["bucket"]["name"]
     key = unquote_plus(unquote(s3["object"]["key"]))
+    id = get_execution_id(bucket, key, s3["object"])
     pdf_name = key[key.rfind("/")+1:key.rfind(".")]
     
     data = {
         "id": id,
         "bucket": bucket,
         "key": key,
-        "pdf_name": pdf_name
+        "pdf_name": pdf_name,
+        "etag": s3["object"].get("eTag", ""),
+        "size": s3["object"].get("size", 0)
     }
     
     return data
 
+def process_record(client, record):
+    # this is the sqs payload, s3 test events have no Records and are simply acknowledged
+    for cur_record in json.loads(record["body"]).get("Records", []):
+        # these are the s3 payload
+        data = extract_event_data(cur_record)
+        extension = data["key"][-3:].lower()
+        if extension == "pdf" or extension == "png" or extension == "jpg":
+            payload = {
+                "id": data["id"],
+                "bucket": data["bucket"],
+                "key": data["key"],
+                "extension": extension,
+                "textract_mode": get_textract_mode()
+            }
+            window = get_inflight_window()
+            if window > 0 and data["etag"] and not claim_content(clients.client('dynamodb'), data, window):
+                print("identical content already in flight, skipping:", data["key"])
+                METRICS.add("duplicate_content")
+                continue
+            uploaded = spans.parse_time(cur_record.get("eventTime"))
+            with spans.span("kickoff", payload["id"], key=payload["key"], uploaded=uploaded, sent=spans.sqs_sent(record)) as fields:
+                fields["duplicate"] = start_step_function(client, payload) is None
+
 def lambda_handler(event, context):
+    client = clients.client('stepfunctions')
+    if "resume" in event:
+        # invoked directly to resume a failed document: {"resume": "<id>"}
+        try:
+            return resume.resume_document(client, event["resume"])
+        finally:
+            METRICS.flush()
+    succeeded, failed = process_records(
+        event["Records"],
+        lambda record: process_record(client, record),
+        get_start_workers()
+    )
+    METRICS.add("messages_failed", len(failed))
     try:
-        # this is the sqs payload
-        for record in event["Records"]:
-            # these are the s3 payload
-            for cur_record in json.loads(record["body"])["Records"]:
-                data = extract_event_data(cur_record)
-                extension = data["key"][-3:].lower()
-                if extension == "pdf" or extension == "png" or extension == "jpg":
-                    payload = {
-                        "id": data["id"],
-                        "bucket": data["bucket"],
-                        "key": data["key"],
-                        "extension": extension
-                    }
-                    response = start_step_function(payload)
-            # delete message from sqs
-            client = boto3.client('sqs')
-            response = client.delete_message(
-                QueueUrl=os.environ['sqs_url'],
-                ReceiptHandle=record["receiptHandle"]
-            )
-    except:
-        return "something didn't go right...."
-
+        with METRICS.timer("sqs_delete_time"):
+            return complete_batch(clients.client('sqs'), os.environ['sqs_url'], succeeded, failed)
+    finally:
+        METRICS.flush()
@@ -0,0 +1,161 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+# Resumes a document whose execution failed or timed out, from what that execution left under
+# wip/<id>/. Invoke kickoff with {"resume": "<id>"}, the id being the execution's name. The new
+# execution renders only the pages without an image, analyzes only the pages without an answer,
+# waits for the pages still in human review and then goes through wrapup as usual.
+
+import json
+import os
+import time
+import botocore
+from boto3.dynamodb.conditions import Key
+import clients
+import csv_fragments
+import metrics
+
+METRICS = metrics.get("kickoff")
+
+# statuses of the document's execution that can be resumed from
+RESUMABLE_STATUSES = ("FAILED", "TIMED_OUT", "ABORTED")
+
+def get_pages_per_chunk():
+    return max(1, int(os.environ.get("pages_per_chunk", "50")))
+
+def get_execution_arn(name):
+    # arn:aws:states:<region>:<account>:stateMachine:<machine> -> ...:execution:<machine>:<name>
+    return os.environ['state_machine_arn'].replace(":stateMachine:", ":execution:") + ":" + name
+
+def get_original_input(client, id):
+    response = client.describe_execution(executionArn=get_execution_arn(id))
+    if response["status"] not in RESUMABLE_STATUSES:
+        raise ValueError("execution " + id + " is " + response["status"] + ", only failed, timed out or aborted executions are resumed")
+    return json.loads(response["input"])
+
+def running_executions(client):
+    kwargs = {"stateMachineArn": os.environ['state_machine_arn'], "statusFilter": "RUNNING"}
+    while True:
+        response = client.list_executions(**kwargs)
+        yield from response["executions"]
+        if not response.get("nextToken"):
+            return
+        kwargs["nextToken"] = response["nextToken"]
+
+def output_exists(s3, payload):
+    # the csv wrapup writes once the document is done
+    key = "complete/" + payload["key"].replace("/", "-") + "-" + payload["id"] + "/output.csv"
+    try:
+        s3.head_object(Bucket=payload["bucket"], Key=key)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+def check_not_resumed(client, payload):
+    # an earlier resume of the document that is still running or already finished it
+    for execution in running_executions(client):
+        if execution["name"].startswith(payload["id"] + "-resume-"):
+            raise ValueError("document " + payload["id"] + " is being resumed by " + execution["name"])
+    if output_exists(clients.client('s3'), payload):
+        raise ValueError("document " + payload["id"] + " is already complete")
+
+def count_pages(payload):
+    # the pagecount lambda, as the state machine runs it
+    response = clients.client('lambda').invoke(
+        FunctionName=os.environ['pagecount_function'],
+        Payload=json.dumps({"id": payload["id"], "bucket": payload["bucket"], "key": payload["key"]})
+    )
+    result = json.loads(response["Payload"].read())
+    if "FunctionError" in response:
+        raise RuntimeError("pagecount failed: " + json.dumps(result))
+    return result
+
+def list_wip_keys(client, bucket, id):
+    keys = set()
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix="wip/" + id + "/"):
+        keys.update(item["Key"] for item in page.get("Contents", []))
+    return keys
+
+def in_human_review(human_loop_id):
+    # analyzepdf leaves an item for the page in the callback table when it starts a review
+    table = clients.resource('dynamodb').Table('multia2ipdf_callback')
+    return len(table.query(KeyConditionExpression=Key('jobid').eq(human_loop_id))["Items"]) > 0
+
+def page_stage(keys, id, wip_key):
+    # The first stage the page still needs: "render", "analyze" or "review" (its human loop is
+    # still open), None when it's done. wrapup serializes the pages without a csv fragment from their json outputs.
+    page = "0" if wip_key == "single_image" else wip_key
+    base_key = "wip/" + id + "/" + page + ".png"
+    if csv_fragments.get_fragment_key(base_key) in keys or base_key + "/human/output.json" in keys:
+        return None
+    if base_key + "/ai/output.json" in keys:
+        return "review" if in_human_review(id + "i" + page) else None
+    if wip_key != "single_image" and base_key not in keys:
+        return "render"
+    return "analyze"
+
+def render_chunks(pages):
+    # runs of consecutive pages, at most pages_per_chunk long, like PageCount's chunks
+    chunks = []
+    for page in sorted(pages):
+        if chunks and page == int(chunks[-1]["last_page"]) + 1 \
+                and page - int(chunks[-1]["first_page"]) < get_pages_per_chunk():
+            chunks[-1]["last_page"] = str(page)
+        else:
+            chunks.append({"first_page": str(page), "last_page": str(page)})
+    return chunks
+
+def create_plan(payload):
+    # {"chunks": [...], "pages": [{"wip_key": "3", "stage": "analyze"}, ...]}, and the
+    # document's image_keys for wrapup
+    if payload["extension"] == "pdf":
+        image_keys = count_pages(payload)["image_keys"]
+    else:
+        image_keys = ["single_image"]
+    keys = list_wip_keys(clients.client('s3'), payload["bucket"], payload["id"])
+    stages = [(wip_key, page_stage(keys, payload["id"], wip_key)) for wip_key in image_keys]
+    plan = {
+        "chunks": render_chunks(int(wip_key) for wip_key, stage in stages if stage == "render"),
+        # rendered pages go on to be analyzed
+        "pages": [{"wip_key": wip_key, "stage": "analyze" if stage == "render" else stage}
+            for wip_key, stage in stages if stage is not None]
+    }
+    return image_keys, plan
+
+def resume_document(client, id):
+    payload = get_original_input(client, id)
+    check_not_resumed(client, payload)
+    # the whole document is a single textract job in async mode, it simply starts over
+    if payload.get("textract_mode") != "async":
+        payload["image_keys"], payload["resume"] = create_plan(payload)
+        payload["textract_mode"] = "resume"
+        print("resume plan:", id, json.dumps({"pages": len(payload["image_keys"]),
+            "chunks": len(payload["resume"]["chunks"]), "remaining": len(payload["resume"]["pages"])}))
+    # the id stays the document's, wip/<id>/ and the human loop names depend on it
+    name = id + "-resume-" + str(int(time.time()))
+    with METRICS.timer("start_execution_time"):
+        response = client.start_execution(
+            stateMachineArn=os.environ['state_machine_arn'],
+            name=name,
+            input=json.dumps(payload, indent=3, default=str)
+        )
+    METRICS.add("executions_resumed")
+    return {"id": id, "execution": name, "plan": payload.get("resume")}
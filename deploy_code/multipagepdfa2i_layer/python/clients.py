@@ -0,0 +1,69 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# boto3 clients and resources shared across invocations.
+#
+# Building a client loads its service model and a new connection pool, and every new pool
+# pays its own TLS handshakes. They are built lazily on first use and then kept for the life
+# of the execution environment. Clients are thread safe and may be shared by worker threads;
+# resources are not, so resource() should only be used from the handler's own thread.
+
+import os
+import threading
+import boto3
+import botocore
+
+_clients = {}
+_resources = {}
+_lock = threading.Lock()
+
+def get_pool_size():
+    return int(os.environ.get("client_pool_size", "10"))
+
+def client(service_name, max_pool_connections=None, max_attempts=None):
+    # max_attempts caps botocore's own attempts (1 = no retries), e.g. to leave them to a rate limiter
+    pool_size = max(max_pool_connections or 0, get_pool_size())
+    key = (service_name, pool_size, max_attempts)
+    found = _clients.get(key)
+    if found is None:
+        with _lock:
+            found = _clients.get(key)
+            if found is None:
+                config = botocore.config.Config(max_pool_connections=pool_size)
+                if max_attempts is not None:
+                    config = config.merge(botocore.config.Config(retries={"total_max_attempts": max_attempts}))
+                found = boto3.client(service_name, config=config)
+                _clients[key] = found
+    return found
+
+def resource(service_name):
+    found = _resources.get(service_name)
+    if found is None:
+        with _lock:
+            found = _resources.get(service_name)
+            if found is None:
+                found = boto3.resource(service_name, config=botocore.config.Config(max_pool_connections=get_pool_size()))
+                _resources[service_name] = found
+    return found
+
+def reset():
+    # drops every cached client, e.g. after the credentials have changed
+    with _lock:
+        _clients.clear()
+        _resources.clear()
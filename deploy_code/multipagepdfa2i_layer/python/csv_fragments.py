@@ -0,0 +1,68 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Per-page CSV fragments of the final output.csv. The lambda that finishes a page (analyzepdf,
+# humancomplete or analyzedoc) writes the page's rows next to its json outputs, at
+# wip/<id>/<n>.png/output.csv, so wrapup only has to stitch the fragments in page order.
+
+import csv
+import io
+
+# order the outputs of a page are written to the csv in
+OUTPUT_TYPES = ["ai", "human"]
+
+FRAGMENT_SUFFIX = "/output.csv"
+
+def get_base_key(output_key):
+    # wip/<id>/<n>.png/ai/output.json -> wip/<id>/<n>.png
+    return output_key[:output_key.rfind("/", 0, output_key.rfind("/"))]
+
+def get_fragment_key(base_key):
+    return base_key + FRAGMENT_SUFFIX
+
+def get_page_number(base_key):
+    page_number = base_key[base_key.rfind("/")+1:]
+    return int(page_number[:page_number.find(".")])
+
+def create_rows(kv_list, give_type):
+    for item in kv_list:
+        yield [item["key"], item["value"], give_type]
+
+def page_rows(base_key, outputs):
+    # outputs is give type -> kv_list
+    yield ["page " + str(get_page_number(base_key) + 1), "-", "-"]
+    for give_type in OUTPUT_TYPES:
+        if give_type in outputs:
+            yield from create_rows(outputs[give_type], give_type)
+
+def render_fragment(base_key, outputs):
+    text = io.StringIO()
+    csv.writer(text, lineterminator="\n").writerows(page_rows(base_key, outputs))
+    return text.getvalue().encode("utf-8")
+
+def write_fragment(client, bucket, base_key, outputs):
+    # returns the size of the fragment written
+    body = render_fragment(base_key, outputs)
+    client.put_object(
+        Body=body,
+        Bucket=bucket,
+        Key=get_fragment_key(base_key),
+        ContentType="text/csv"
+    )
+    return len(body)
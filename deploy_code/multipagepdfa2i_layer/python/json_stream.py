@@ -0,0 +1,148 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Incremental JSON reading from a file-like object (e.g. an S3 StreamingBody).
+#
+# The caller walks the document with members() / items() and only materialises the values
+# it asks for with value(). Everything else is skipped one small piece at a time, so the
+# whole document and its parsed copy never have to be held at once.
+#
+#   stream = JsonStream(body)
+#   for key in stream.members():
+#       if key == "wanted":
+#           wanted = stream.value()
+#       else:
+#           stream.skip()
+
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+class JsonStream:
+
+    def __init__(self, readable, chunk_size=64 * 1024):
+        self.readable = readable
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self.readable.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            tail = self.utf8.decode(b"", final=True)
+        elif isinstance(chunk, bytes):
+            self.bytes_read += len(chunk)
+            tail = self.utf8.decode(chunk)
+        else:
+            self.bytes_read += len(chunk)
+            tail = chunk
+        self.buffer = self.buffer[self.pos:] + tail
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("unexpected end of JSON stream")
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError("expected '" + char + "' but found '" + found + "'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        # a value longer than the buffer is decoded again from its start after each read, so
+        # the reads double in size: a few attempts and copies, however long the value
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # most likely the value runs past the buffered data
+                if not self.fill(size):
+                    raise
+                size *= 2
+                continue
+            # a number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        # yields each key of an object, the caller must consume the value before the next key
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self.pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError("expected ',' or '}' but found '" + separator + "'")
+
+    def items(self):
+        # yields the position of each array item, the caller must consume the item
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        count = 0
+        while True:
+            yield count
+            count += 1
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError("expected ',' or ']' but found '" + separator + "'")
+
+    def skip(self, levels=2):
+        # Descends `levels` containers deep before decoding (and dropping) whole values, which
+        # keeps large arrays of small objects (e.g. Textract blocks) from being built at once.
+        char = self.peek()
+        if levels > 0 and char == "{":
+            for _ in self.members():
+                self.skip(levels - 1)
+        elif levels > 0 and char == "[":
+            for _ in self.items():
+                self.skip(levels - 1)
+        else:
+            self.value()
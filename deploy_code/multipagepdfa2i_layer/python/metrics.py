@@ -0,0 +1,140 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Per invocation metrics, logged in CloudWatch Embedded Metric Format (EMF).
+#
+# Each lambda keeps one Metrics per execution environment (get("analyzepdf")), times its
+# external calls and parse steps with timer(), adds up counts and bytes with add(), and calls
+# flush() at the end of the invocation. flush prints what was recorded since the last flush as
+# EMF log lines, which CloudWatch Logs turns into metrics in the metrics_namespace namespace
+# (default multipagepdfa2i) with a "function" dimension, without any API call. Every timing is
+# kept, so the metrics have percentiles; counts and bytes are one sum per invocation.
+#
+# Recording is a perf_counter call and a list append under a lock, cheap enough to leave on.
+# metrics=false in the environment turns it off.
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_NAMESPACE = "multipagepdfa2i"
+
+# most metrics and values per metric EMF accepts in one log line
+MAX_METRICS = 100
+MAX_VALUES = 100
+
+def is_enabled():
+    return os.environ.get("metrics", "true").lower() != "false"
+
+def get_namespace():
+    return os.environ.get("metrics_namespace", DEFAULT_NAMESPACE)
+
+class Metrics:
+
+    def __init__(self, function_name, enabled=True, namespace=DEFAULT_NAMESPACE):
+        self.function_name = function_name
+        self.enabled = enabled
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        # name -> (unit, values)
+        self.timings = {}
+        # name -> (unit, total)
+        self.totals = {}
+
+    def add(self, name, value=1, unit="Count"):
+        if not self.enabled:
+            return
+        with self.lock:
+            total = self.totals.get(name, (unit, 0))[1]
+            self.totals[name] = (unit, total + value)
+
+    def add_bytes(self, name, value):
+        self.add(name, value, "Bytes")
+
+    def record(self, name, value, unit="Milliseconds"):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.timings.setdefault(name, (unit, []))[1].append(value)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def timed(self, name, fn, *args, **kwargs):
+        with self.timer(name):
+            return fn(*args, **kwargs)
+
+    def take(self):
+        # [(name, unit, values)] recorded since the last take, recording starts over
+        with self.lock:
+            metrics = [(name, unit, values) for name, (unit, values) in self.timings.items()]
+            metrics += [(name, unit, [total]) for name, (unit, total) in self.totals.items()]
+            self.timings = {}
+            self.totals = {}
+        return metrics
+
+    def log_lines(self, metrics, properties=None):
+        # as many lines as the EMF limits need: at most MAX_METRICS metrics per line and
+        # MAX_VALUES values per metric, longer series continue on the next lines
+        timestamp = int(time.time() * 1000)
+        for start in range(0, len(metrics), MAX_METRICS):
+            group = metrics[start:start + MAX_METRICS]
+            longest = max(len(values) for _, _, values in group)
+            for offset in range(0, longest, MAX_VALUES):
+                chunk = [(name, unit, values[offset:offset + MAX_VALUES]) for name, unit, values in group if len(values) > offset]
+                line = dict(properties or {})
+                line["_aws"] = {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [["function"]],
+                        "Metrics": [{"Name": name, "Unit": unit} for name, unit, _ in chunk]
+                    }]
+                }
+                line["function"] = self.function_name
+                for name, _, values in chunk:
+                    line[name] = values[0] if len(values) == 1 else values
+                yield line
+
+    def flush(self, properties=None):
+        # properties (e.g. the execution id) are logged next to the metrics, not as dimensions
+        metrics = self.take()
+        for line in self.log_lines(metrics, properties):
+            # one write per line, so lines from other threads can't end up inside it
+            sys.stdout.write(json.dumps(line, default=str) + "\n")
+
+_metrics = {}
+_lock = threading.Lock()
+
+def get(function_name):
+    # one Metrics per function for the life of the execution environment
+    with _lock:
+        found = _metrics.get(function_name)
+        if found is None:
+            found = Metrics(function_name, is_enabled(), get_namespace())
+            _metrics[function_name] = found
+    return found
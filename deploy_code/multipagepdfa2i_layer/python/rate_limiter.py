@@ -0,0 +1,230 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Adaptive client side rate limiting for throttled APIs (Textract in particular).
+#
+# A token bucket paces the calls. Its rate follows AIMD: every success adds a little
+# (about `increase` calls per second per second), a throttle multiplies it by `decrease`.
+# Throttled calls are retried with full jitter exponential backoff, and so are transient
+# errors (5xx, connection failures), without touching the rate: clients given to the limiter
+# have botocore's own retries turned off.
+#
+# Optionally the rate is shared through a small store (DynamoDB in lambda) so concurrent
+# invocations learn from each other's throttles and new ones start at the learned rate
+# instead of the configured one. Decreases always win, increases are added to the shared
+# rate, and writes use a version number so a concurrent decrease is never overwritten.
+
+import os
+import random
+import threading
+import time
+from botocore.exceptions import ConnectionError as BotocoreConnectionError, HTTPClientError
+
+THROTTLING_ERROR_CODES = [
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded"
+]
+
+TRANSIENT_ERROR_CODES = [
+    "InternalServerError",
+    "InternalFailure",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "RequestTimeout",
+    "RequestTimeoutException"
+]
+
+def is_throttling_error(error):
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+def is_transient_error(error):
+    # what botocore's standard retry mode retries besides throttling
+    if isinstance(error, (BotocoreConnectionError, HTTPClientError)):
+        return True
+    response = getattr(error, "response", None) or {}
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+    return response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES or status >= 500
+
+class LocalRateStore:
+    # in process store, for a single process or local runs
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate = None
+        self.version = 0
+
+    def load(self):
+        with self.lock:
+            return self.rate, self.version
+
+    def save(self, rate, version):
+        with self.lock:
+            if version != self.version:
+                return False
+            self.rate = rate
+            self.version += 1
+            return True
+
+class DynamoDBRateStore:
+    # one item in the coordination table, {"pk": "rate#<name>", "rate": n, "version": n}
+
+    def __init__(self, client, table_name, name):
+        self.client = client
+        self.table_name = table_name
+        self.key = {"pk": {"S": "rate#" + name}}
+
+    def load(self):
+        item = self.client.get_item(TableName=self.table_name, Key=self.key, ConsistentRead=True).get("Item")
+        if item is None:
+            return None, 0
+        return float(item["rate"]["N"]), int(item["version"]["N"])
+
+    def save(self, rate, version):
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key=self.key,
+                UpdateExpression="SET #rate = :rate, #version = :next",
+                ConditionExpression="attribute_not_exists(#version) OR #version = :version",
+                ExpressionAttributeNames={"#rate": "rate", "#version": "version"},
+                ExpressionAttributeValues={
+                    ":rate": {"N": repr(rate)},
+                    ":version": {"N": str(version)},
+                    ":next": {"N": str(version + 1)}
+                }
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+class AdaptiveRateLimiter:
+
+    def __init__(self, rate, min_rate=0.1, max_rate=50.0, increase=1.0, decrease=0.7, burst=1.0,
+                 store=None, sync_interval=5.0, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.burst = float(burst)
+        self.store = store
+        self.sync_interval = sync_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = clock()
+        self.last_decrease = None
+        self.last_sync = None
+        self.synced_rate = None
+        self.throttled_since_sync = False
+        self.calls = 0
+        self.throttles = 0
+
+    def clamp(self, rate):
+        return max(self.min_rate, min(self.max_rate, rate))
+
+    def acquire(self):
+        if self.store is not None and (self.last_sync is None or self.clock() - self.last_sync >= self.sync_interval):
+            self.sync()
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = self.clamp(self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            self.throttles += 1
+            now = self.clock()
+            # calls already in flight when the limit was hit throttle together, count them once
+            if self.last_decrease is not None and now - self.last_decrease < 1.0 / self.rate:
+                return
+            self.last_decrease = now
+            self.rate = self.clamp(self.rate * self.decrease)
+            self.tokens = 0
+            self.throttled_since_sync = True
+        if self.store is not None:
+            self.sync()
+
+    def sync(self):
+        shared, version = self.store.load()
+        with self.lock:
+            self.last_sync = self.clock()
+            if shared is None:
+                target = self.rate
+            elif self.throttled_since_sync:
+                target = min(self.rate, shared)
+            else:
+                # add what this limiter gained since the last sync to the shared rate
+                target = self.clamp(shared + max(0.0, self.rate - (self.synced_rate or shared)))
+        if not self.store.save(target, version):
+            # Someone else wrote first: take the value just read until the next sync, instead
+            # of syncing again on every call. A throttle of ours is published with that sync.
+            if shared is not None:
+                with self.lock:
+                    self.rate = min(self.rate, shared) if self.throttled_since_sync else shared
+                    self.synced_rate = shared
+            return
+        with self.lock:
+            self.rate = target
+            self.synced_rate = target
+            self.throttled_since_sync = False
+
+def call(limiter, fn, *args, max_attempts=8, base_delay=0.2, max_delay=20.0, rng=random, **kwargs):
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_throttling_error(e):
+                limiter.on_throttle()
+            elif not is_transient_error(e):
+                raise
+            attempt += 1
+            if attempt >= max_attempts:
+                raise
+            limiter.sleep(rng.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+            continue
+        limiter.on_success()
+        return result
+
+def limiter_from_environment(prefix, store=None):
+    # e.g. prefix "textract" reads textract_tps, textract_min_tps, textract_max_tps
+    return AdaptiveRateLimiter(
+        rate=float(os.environ.get(prefix + "_tps", "5")),
+        min_rate=float(os.environ.get(prefix + "_min_tps", "0.1")),
+        max_rate=float(os.environ.get(prefix + "_max_tps", "50")),
+        store=store
+    )
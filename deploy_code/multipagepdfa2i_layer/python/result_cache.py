@@ -0,0 +1,160 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Content addressed cache of page results.
+#
+# Entries are keyed by a hash of the page image (plus whatever else changes the result) and
+# hold the parsed key/value list, whether the page needed human review and, once the review
+# is done, the reviewed key/value list. Two tiers: a small LRU in the execution environment
+# and the coordination table in DynamoDB, where items expire through the table's TTL.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# DynamoDB items are limited to 400 KB, leave room for the key and attributes. The limit is
+# for the whole item, the entry and the reviewed key/value list added to it later.
+MAX_ITEM_BYTES = 350 * 1024
+
+def content_hash(client, bucket, key):
+    # A single part upload without KMS has the MD5 of its bytes as ETag, so the hash comes
+    # from a HEAD request. Anything else is read and hashed.
+    head = client.head_object(Bucket=bucket, Key=key)
+    etag = head["ETag"].strip('"')
+    if "-" not in etag and head.get("ServerSideEncryption") != "aws:kms":
+        return "md5:" + etag
+    digest = hashlib.sha256()
+    body = client.get_object(Bucket=bucket, Key=key)["Body"]
+    for chunk in iter(lambda: body.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return "sha256:" + digest.hexdigest()
+
+def cache_key(*parts):
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+class ResultCache:
+
+    def __init__(self, client, table_name, ttl_seconds, max_entries, clock=time.time):
+        self.client = client
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def remember(self, key, entry, expires_at):
+        with self.lock:
+            self.entries[key] = (expires_at, entry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def lookup(self, key):
+        now = self.clock()
+        with self.lock:
+            found = self.entries.get(key)
+            if found is not None:
+                if found[0] > now:
+                    self.entries.move_to_end(key)
+                    return found[1]
+                del self.entries[key]
+        item = self.client.get_item(TableName=self.table_name, Key={"pk": {"S": "result#" + key}}).get("Item")
+        # TTL deletion runs in the background, so expired items can still be returned
+        if item is None or int(item["expires_at"]["N"]) <= now:
+            return None
+        entry = json.loads(item["entry"]["S"])
+        if "human" in item:
+            entry["human_kv_list"] = json.loads(item["human"]["S"])
+        self.remember(key, entry, int(item["expires_at"]["N"]))
+        return entry
+
+    def get(self, key):
+        entry = self.lookup(key)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key, kv_list, needs_review):
+        entry = {"kv_list": kv_list, "needs_review": needs_review}
+        body = json.dumps(entry)
+        size = len(body.encode("utf-8"))
+        if size > MAX_ITEM_BYTES:
+            return False
+        expires_at = int(self.clock() + self.ttl_seconds)
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "pk": {"S": "result#" + key},
+                "entry": {"S": body},
+                # lets put_human check that the reviewed list still fits in the item
+                "entry_bytes": {"N": str(size)},
+                "expires_at": {"N": str(expires_at)}
+            }
+        )
+        self.remember(key, entry, expires_at)
+        return True
+
+    def put_human(self, key, human_kv_list):
+        # False when the entry is gone or the item would grow past MAX_ITEM_BYTES
+        body = json.dumps(human_kv_list)
+        room = MAX_ITEM_BYTES - len(body.encode("utf-8"))
+        if room < 0:
+            return False
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"pk": {"S": "result#" + key}},
+                UpdateExpression="SET human = :human",
+                ConditionExpression="attribute_exists(pk) AND entry_bytes <= :room",
+                ExpressionAttributeValues={":human": {"S": body}, ":room": {"N": str(room)}}
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        with self.lock:
+            self.entries.pop(key, None)
+        return True
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+def cache_from_environment(client):
+    # None unless result_cache=true and a coordination table is configured
+    if os.environ.get("result_cache", "false").lower() != "true" or not os.environ.get("coordination_table"):
+        return None
+    return ResultCache(
+        client,
+        os.environ["coordination_table"],
+        ttl_seconds=int(float(os.environ.get("result_cache_ttl_days", "30")) * 24 * 3600),
+        max_entries=int(os.environ.get("result_cache_entries", "256"))
+    )
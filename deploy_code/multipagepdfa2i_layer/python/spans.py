@@ -0,0 +1,82 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Span records for the per-document trace.
+#
+# Every stage logs a start and an end record for the work it does on a document, carrying the
+# document id (the execution name) and, for page work, the page number (0 based, as in
+# wip/<id>/<n>.png):
+#
+#   {"trace": "page", "event": "start", "id": "...", "page": 3, "ts": 1600000000.123, ...}
+#   {"trace": "page", "event": "end", "id": "...", "page": 3, "ts": ..., "duration_ms": 812.5, ...}
+#
+# ts is epoch seconds. Other fields are stage specific, e.g. when the SQS message was sent
+# ("sent"), and error on spans that raised. The end record repeats the start record's fields. tools/trace_report.py rebuilds each document's
+# timeline from these lines in the lambdas' logs. The java lambdas log the same records
+# (Spans.java). spans=false in the environment turns them off.
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+def is_enabled():
+    return os.environ.get("spans", "true").lower() != "false"
+
+def log(name, event, id, page=None, **fields):
+    if not is_enabled():
+        return
+    record = {"trace": name, "event": event, "id": id}
+    if page is not None:
+        record["page"] = page
+    record["ts"] = round(time.time(), 3)
+    record.update(fields)
+    # one write, print's separate newline write can interleave with other threads' output
+    sys.stdout.write(json.dumps(record, default=str) + "\n")
+
+@contextmanager
+def span(name, id, page=None, **fields):
+    # yields a dict, fields put in it are added to the end record
+    start = time.perf_counter()
+    log(name, "start", id, page, **fields)
+    end_fields = dict(fields)
+    try:
+        yield end_fields
+    except Exception as e:
+        end_fields["error"] = repr(e)
+        raise
+    finally:
+        end_fields["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        log(name, "end", id, page, **end_fields)
+
+def sqs_sent(record):
+    # when the SQS message was sent, epoch seconds, None if the record doesn't say
+    sent = record.get("attributes", {}).get("SentTimestamp")
+    return int(sent) / 1000 if sent else None
+
+def parse_time(value):
+    # ISO 8601 timestamps of S3 and EventBridge events to epoch seconds, None if unparseable
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
@@ -0,0 +1,75 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Concurrent processing of an SQS batch with per message failure reporting.
+#
+# Each record is handled on its own worker thread. Successful messages are acknowledged with
+# DeleteMessageBatch and BatchItemFailures is raised for the rest, so lambda hands the batch
+# back to the queue with only the failed messages left on it. When the event source mapping
+# has ReportBatchItemFailures enabled (report_batch_item_failures=true) lambda deletes the
+# successes itself and the failed ids are returned instead.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# most entries a single DeleteMessageBatch request accepts
+DELETE_BATCH_SIZE = 10
+
+class BatchItemFailures(Exception):
+    def __init__(self, message_ids):
+        super().__init__("failed messages: " + ", ".join(message_ids))
+        self.message_ids = message_ids
+
+def process_records(records, process_record, workers):
+    # returns the records that succeeded and the message ids of the ones that raised
+    succeeded = []
+    failed = []
+    if not records:
+        return succeeded, failed
+    with ThreadPoolExecutor(max_workers=max(1, min(len(records), workers))) as executor:
+        futures = [(record, executor.submit(process_record, record)) for record in records]
+    for record, future in futures:
+        try:
+            future.result()
+            succeeded.append(record)
+        except Exception as e:
+            print("failed to process message", record["messageId"], repr(e))
+            failed.append(record["messageId"])
+    return succeeded, failed
+
+def delete_messages(client, queue_url, records):
+    failed = []
+    for i in range(0, len(records), DELETE_BATCH_SIZE):
+        batch = records[i:i + DELETE_BATCH_SIZE]
+        response = client.delete_message_batch(
+            QueueUrl=queue_url,
+            Entries=[{"Id": str(n), "ReceiptHandle": record["receiptHandle"]} for n, record in enumerate(batch)]
+        )
+        failed.extend(batch[int(entry["Id"])]["messageId"] for entry in response.get("Failed", []))
+    return failed
+
+def complete_batch(client, queue_url, succeeded, failed):
+    if os.environ.get("report_batch_item_failures", "false").lower() == "true":
+        return {"batchItemFailures": [{"itemIdentifier": id} for id in failed]}
+    failed_deletes = delete_messages(client, queue_url, succeeded)
+    if failed_deletes:
+        print("failed to delete messages", failed_deletes)
+    if failed:
+        raise BatchItemFailures(failed)
+    return {"batchItemFailures": []}
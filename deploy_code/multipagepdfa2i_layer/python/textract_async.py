@@ -0,0 +1,76 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Asynchronous Textract document analysis of a whole PDF (StartDocumentAnalysis /
+# GetDocumentAnalysis), with the result split back into one key/value list per page.
+
+from textract_blocks import PASCAL_CASE_KEYS, new_index, add_block, key_values_from_index
+
+# job states GetDocumentAnalysis reports
+IN_PROGRESS = "IN_PROGRESS"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+PARTIAL_SUCCESS = "PARTIAL_SUCCESS"
+
+# the most blocks GetDocumentAnalysis returns per call
+MAX_RESULTS = 1000
+
+def start_analysis(client, bucket, key, feature_types, request_token=None, job_tag=None):
+    # The same request_token within a few days returns the job already started for it instead
+    # of starting (and paying for) another one.
+    kwargs = {
+        "DocumentLocation": {"S3Object": {"Bucket": bucket, "Name": key}},
+        "FeatureTypes": feature_types
+    }
+    if request_token:
+        kwargs["ClientRequestToken"] = request_token
+    if job_tag:
+        kwargs["JobTag"] = job_tag
+    return client.start_document_analysis(**kwargs)["JobId"]
+
+def get_job_status(client, job_id):
+    # (status, status message), a one block request keeps the status check cheap
+    response = client.get_document_analysis(JobId=job_id, MaxResults=1)
+    return response["JobStatus"], response.get("StatusMessage", "")
+
+def iter_blocks(client, job_id, max_results=MAX_RESULTS, call=None):
+    # Every block of a finished job, following NextToken. `call(fn, **kwargs)` wraps the
+    # requests, e.g. to rate limit them.
+    call = call or (lambda fn, **kwargs: fn(**kwargs))
+    kwargs = {"JobId": job_id, "MaxResults": max_results}
+    while True:
+        response = call(client.get_document_analysis, **kwargs)
+        if response["JobStatus"] not in (SUCCEEDED, PARTIAL_SUCCESS):
+            raise RuntimeError("textract job %s is %s: %s" % (job_id, response["JobStatus"], response.get("StatusMessage", "")))
+        yield from response.get("Blocks", [])
+        if not response.get("NextToken"):
+            return
+        kwargs["NextToken"] = response["NextToken"]
+
+def key_values_by_page(blocks, keys=PASCAL_CASE_KEYS):
+    # page number (1 based) -> kv_list. Relationships never cross pages, so each page gets
+    # its own index and is parsed exactly as a single page AnalyzeDocument response would be.
+    indexes = {}
+    for block in blocks:
+        page = block.get("Page", 1)
+        index = indexes.get(page)
+        if index is None:
+            index = indexes[page] = new_index()
+        add_block(index, block, keys)
+    return {page: key_values_from_index(index, keys) for page, index in indexes.items()}
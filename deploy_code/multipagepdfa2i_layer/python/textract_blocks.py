@@ -0,0 +1,165 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Shared Textract / A2I block parsing.
+#
+# Textract's AnalyzeDocument response uses PascalCase keys ("Blocks", "BlockType", ...)
+# while the A2I human answer for the same form uses camelCase ("blocks", "blockType", ...).
+# Rather than normalising (copying) the document, the casing is detected once and the
+# matching set of key names is used while walking the blocks.
+
+PASCAL_CASE_KEYS = {
+    "blocks": "Blocks",
+    "block_type": "BlockType",
+    "id": "Id",
+    "text": "Text",
+    "relationships": "Relationships",
+    "type": "Type",
+    "ids": "Ids",
+    "entity_types": "EntityTypes",
+    "confidence": "Confidence"
+}
+
+CAMEL_CASE_KEYS = {
+    "blocks": "blocks",
+    "block_type": "blockType",
+    "id": "id",
+    "text": "text",
+    "relationships": "relationships",
+    "type": "type",
+    "ids": "ids",
+    "entity_types": "entityTypes",
+    "confidence": "confidence"
+}
+
+UNKNOWN = "UNKNOWN"
+
+def detect_keys(data):
+    if "Blocks" in data:
+        return PASCAL_CASE_KEYS
+    if "blocks" in data:
+        return CAMEL_CASE_KEYS
+    raise KeyError("document has neither 'Blocks' nor 'blocks'")
+
+def index_blocks(data, keys):
+    # One pass over the blocks, building id -> text for WORD and LINE blocks and
+    # id -> block for KEY_VALUE_SET blocks that have relationships (in document order).
+    k_block_type, k_id, k_text, k_relationships = keys["block_type"], keys["id"], keys["text"], keys["relationships"]
+    words = {}
+    lines = {}
+    kvs = {}
+    for block in data[keys["blocks"]]:
+        block_type = block[k_block_type]
+        if block_type == "WORD":
+            words[block[k_id]] = block[k_text]
+        elif block_type == "KEY_VALUE_SET":
+            if k_relationships in block:
+                kvs[block[k_id]] = block
+        elif block_type == "LINE":
+            lines[block[k_id]] = block[k_text]
+    return words, lines, kvs
+
+def new_index():
+    return {}, {}, {}
+
+def add_block(index, block, keys):
+    # Incremental form of index_blocks for blocks that arrive one at a time (e.g. from a
+    # streamed document). Only the fields the key/value lookup needs are kept.
+    words, lines, kvs = index
+    block_type = block[keys["block_type"]]
+    if block_type == "WORD":
+        words[block[keys["id"]]] = block[keys["text"]]
+    elif block_type == "KEY_VALUE_SET":
+        if keys["relationships"] in block:
+            kvs[block[keys["id"]]] = {
+                keys["entity_types"]: block[keys["entity_types"]],
+                keys["relationships"]: block[keys["relationships"]],
+                keys["confidence"]: block.get(keys["confidence"])
+            }
+    elif block_type == "LINE":
+        lines[block[keys["id"]]] = block[keys["text"]]
+
+def get_child_text(ids, words, lines):
+    # WORD children are space joined, a LINE child replaces whatever was collected before it.
+    # Returns None when a child can't be resolved (e.g. a SELECTION_ELEMENT).
+    try:
+        return " ".join([words[id] for id in ids]) if ids else None
+    except KeyError:
+        pass
+    parts = []
+    for id in ids:
+        if id in lines:
+            parts = [lines[id]]
+        elif id in words:
+            parts.append(words[id])
+        else:
+            return None
+    return " ".join(parts)
+
+def get_relations(block, keys):
+    # the last CHILD relationship wins, VALUE ids are collected in order
+    child_ids = None
+    value_ids = []
+    k_type, k_ids = keys["type"], keys["ids"]
+    for relation in block[keys["relationships"]]:
+        if relation[k_type] == "CHILD":
+            child_ids = relation[k_ids]
+        elif relation[k_type] == "VALUE":
+            value_ids.extend(relation[k_ids])
+    return child_ids, value_ids
+
+def get_value_text(value_ids, kvs, words, lines, keys):
+    if not value_ids:
+        return ""
+    # only the first VALUE block is used
+    value = kvs.get(value_ids[0])
+    if value is None:
+        return UNKNOWN
+    child_ids, _ = get_relations(value, keys)
+    if child_ids is None:
+        return ""
+    text = get_child_text(child_ids, words, lines)
+    if text is None:
+        return UNKNOWN
+    return text
+
+def key_values_from_index(index, keys):
+    # confidence is the KEY block's, None when the document has none (e.g. some human answers)
+    words, lines, kvs = index
+    k_entity_types, k_confidence = keys["entity_types"], keys["confidence"]
+    kv_list = []
+    for block in kvs.values():
+        if block[k_entity_types][0] != "KEY":
+            continue
+        child_ids, value_ids = get_relations(block, keys)
+        key = ""
+        if child_ids is not None:
+            key = get_child_text(child_ids, words, lines)
+            if key is None:
+                key = UNKNOWN
+        kv_list.append({
+            "value": get_value_text(value_ids, kvs, words, lines, keys),
+            "key": key,
+            "confidence": block.get(k_confidence)
+        })
+    return kv_list
+
+def extract_key_values(data):
+    keys = detect_keys(data)
+    return key_values_from_index(index_blocks(data, keys), keys)
@@ -0,0 +1,149 @@
+/*
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ */
+
+
+import org.apache.pdfbox.contentstream.PDFStreamEngine;
+import org.apache.pdfbox.contentstream.operator.Operator;
+import org.apache.pdfbox.contentstream.operator.state.Concatenate;
+import org.apache.pdfbox.contentstream.operator.state.Restore;
+import org.apache.pdfbox.contentstream.operator.state.Save;
+import org.apache.pdfbox.contentstream.operator.state.SetGraphicsStateParameters;
+import org.apache.pdfbox.contentstream.operator.state.SetMatrix;
+import org.apache.pdfbox.cos.COSBase;
+import org.apache.pdfbox.cos.COSName;
+import org.apache.pdfbox.io.IOUtils;
+import org.apache.pdfbox.pdmodel.PDPage;
+import org.apache.pdfbox.pdmodel.common.PDRectangle;
+import org.apache.pdfbox.pdmodel.graphics.PDXObject;
+import org.apache.pdfbox.pdmodel.graphics.image.PDImageXObject;
+import org.apache.pdfbox.util.Matrix;
+import java.io.*;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Set;
+
+// The image of a scanned page taken straight out of the PDF instead of rendering the page.
+// A page qualifies when its content is a single, unrotated image XObject covering the page
+// and nothing else (no text, vector drawing, forms, inline images or annotations). JPEGs in
+// gray or RGB are passed through byte for byte; other formats (CCITT, Flate, ...) are decoded
+// and re-encoded, bilevel images always as png. Anything else is left to the renderer.
+public class EmbeddedImage {
+    // share of the crop box the image has to cover
+    private static final double MIN_COVERAGE = 0.9;
+
+    private static final List<String> JPEG = Arrays.asList(
+        COSName.DCT_DECODE.getName(), COSName.DCT_DECODE_ABBREVIATION.getName());
+
+    // operators that put something other than the image on the page
+    private static final Set<String> MARKING_OPERATORS = new HashSet<String>(Arrays.asList(
+        "Tj", "TJ", "'", "\"", "BI", "sh", "S", "s", "f", "F", "f*", "B", "B*", "b", "b*"));
+
+    public final byte[] bytes;
+    public final String contentType;
+    // how the image was produced, for the logs
+    public final String path;
+
+    private EmbeddedImage(byte[] bytes, String contentType, String path) {
+        this.bytes = bytes;
+        this.contentType = contentType;
+        this.path = path;
+    }
+
+    // Finds the images drawn on a page and whether anything else is drawn with them.
+    private static class ImageFinder extends PDFStreamEngine {
+        private final double pageArea;
+        final List<PDImageXObject> images = new ArrayList<PDImageXObject>();
+        double coverage = 0;
+        boolean otherContent = false;
+
+        ImageFinder(PDPage page) {
+            PDRectangle box = page.getCropBox();
+            pageArea = Math.max(1.0, (double) box.getWidth() * box.getHeight());
+            addOperator(new Concatenate());
+            addOperator(new SetGraphicsStateParameters());
+            addOperator(new Save());
+            addOperator(new Restore());
+            addOperator(new SetMatrix());
+        }
+
+        @Override
+        protected void processOperator(Operator operator, List<COSBase> operands) throws IOException {
+            String name = operator.getName();
+            if (name.equals("Do")) {
+                PDXObject xobject = operands.isEmpty() || !(operands.get(0) instanceof COSName)
+                    ? null : getResources().getXObject((COSName) operands.get(0));
+                if (!(xobject instanceof PDImageXObject)) {
+                    otherContent = true;
+                    return;
+                }
+                // upright and unflipped, so the stored pixels are the page as it is seen
+                Matrix ctm = getGraphicsState().getCurrentTransformationMatrix();
+                if (ctm.getShearX() != 0 || ctm.getShearY() != 0 || ctm.getScaleX() <= 0 || ctm.getScaleY() <= 0) {
+                    otherContent = true;
+                    return;
+                }
+                images.add((PDImageXObject) xobject);
+                coverage = (double) ctm.getScaleX() * ctm.getScaleY() / pageArea;
+            } else if (MARKING_OPERATORS.contains(name)) {
+                otherContent = true;
+            } else {
+                super.processOperator(operator, operands);
+            }
+        }
+    }
+
+    private static boolean isPassThroughJpeg(PDImageXObject image, long maxBytes) throws IOException {
+        int components = image.getColorSpace().getNumberOfComponents();
+        return "jpg".equals(image.getSuffix())
+            && (components == 1 || components == 3)
+            && image.getDecode() == null
+            && image.getStream().getLength() <= maxBytes;
+    }
+
+    // the page's image, or null when the page has to be rendered
+    public static EmbeddedImage extract(PDPage page, ImageEncoding encoding) throws IOException {
+        if (page.getRotation() % 360 != 0 || !page.getAnnotations().isEmpty()) {
+            return null;
+        }
+        ImageFinder finder = new ImageFinder(page);
+        finder.processPage(page);
+        if (finder.otherContent || finder.images.size() != 1 || finder.coverage < MIN_COVERAGE) {
+            return null;
+        }
+
+        PDImageXObject image = finder.images.get(0);
+        if (image.isStencil() || image.getMask() != null || image.getSoftMask() != null
+                || Math.max(image.getWidth(), image.getHeight()) > encoding.maxPixelsSide) {
+            return null;
+        }
+
+        String suffix = image.getSuffix();
+        if (isPassThroughJpeg(image, encoding.maxBytes)) {
+            // decodes any filters applied on top of the jpeg and stops at DCTDecode
+            try (InputStream in = image.createInputStream(JPEG)) {
+                return new EmbeddedImage(IOUtils.toByteArray(in), "image/jpeg", "embedded jpeg passed through");
+            }
+        }
+        ImageEncoding target = image.getBitsPerComponent() == 1 ? encoding.withFormat("png") : encoding;
+        byte[] bytes = target.encodeWithinLimit(image.getImage());
+        return new EmbeddedImage(bytes, target.contentType(),
+            "embedded " + (suffix == null ? "image" : suffix) + " " + image.getBitsPerComponent() + " bit converted to " + target.format);
+    }
+}
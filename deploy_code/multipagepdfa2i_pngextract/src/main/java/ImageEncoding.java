@@ -0,0 +1,181 @@
+/*
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ */
+
+
+import org.apache.pdfbox.pdmodel.PDPage;
+import org.apache.pdfbox.pdmodel.common.PDRectangle;
+import org.apache.pdfbox.rendering.ImageType;
+import java.awt.Graphics2D;
+import java.awt.RenderingHints;
+import java.awt.image.BufferedImage;
+import java.io.*;
+import java.util.Iterator;
+import javax.imageio.IIOImage;
+import javax.imageio.ImageIO;
+import javax.imageio.ImageWriteParam;
+import javax.imageio.ImageWriter;
+import javax.imageio.stream.ImageOutputStream;
+
+// How page images are rendered and encoded, configured per deployment through the environment:
+//   image_color        rgb (default), gray or binary
+//   image_format       png (default) or jpeg
+//   jpeg_quality       0.0 - 1.0, default 0.85
+//   png_compression    0 - 9, default is the encoder's own
+//   render_dpi         default 300
+//   max_pixels_side    longest side of an image, default 10000 (Textract's limit)
+//   max_image_bytes    default 10485760 (Textract's synchronous limit)
+//   measure_savings    true to also encode the 300 DPI RGB PNG each page used to be, for the logs
+public class ImageEncoding {
+    public static final int BASELINE_DPI = 300;
+
+    public final String format;
+    public final ImageType imageType;
+    public final float jpegQuality;
+    public final int pngCompression;
+    public final float dpi;
+    public final int maxPixelsSide;
+    public final long maxBytes;
+    public final boolean measureSavings;
+
+    public ImageEncoding(String format, ImageType imageType, float jpegQuality, int pngCompression,
+                         float dpi, int maxPixelsSide, long maxBytes, boolean measureSavings) {
+        this.format = format;
+        this.imageType = imageType;
+        this.jpegQuality = jpegQuality;
+        this.pngCompression = pngCompression;
+        this.dpi = dpi;
+        this.maxPixelsSide = maxPixelsSide;
+        this.maxBytes = maxBytes;
+        this.measureSavings = measureSavings;
+    }
+
+    private static String getEnv(String name, String fallback) {
+        String value = System.getenv(name);
+        return value == null || value.isEmpty() ? fallback : value;
+    }
+
+    public static ImageEncoding fromEnvironment() {
+        String format = getEnv("image_format", "png").toLowerCase();
+        if (format.equals("jpg")) {
+            format = "jpeg";
+        }
+        if (!format.equals("png") && !format.equals("jpeg")) {
+            throw new IllegalArgumentException("image_format must be png or jpeg, not " + format);
+        }
+
+        String color = getEnv("image_color", "rgb").toLowerCase();
+        ImageType imageType;
+        if (color.equals("gray") || color.equals("grey")) {
+            imageType = ImageType.GRAY;
+        } else if (color.equals("binary") || color.equals("bilevel")) {
+            // jpeg has no bilevel mode, gray is the closest it can store
+            imageType = format.equals("jpeg") ? ImageType.GRAY : ImageType.BINARY;
+        } else if (color.equals("rgb")) {
+            imageType = ImageType.RGB;
+        } else {
+            throw new IllegalArgumentException("image_color must be rgb, gray or binary, not " + color);
+        }
+
+        return new ImageEncoding(
+            format,
+            imageType,
+            Float.parseFloat(getEnv("jpeg_quality", "0.85")),
+            Integer.parseInt(getEnv("png_compression", "-1")),
+            Float.parseFloat(getEnv("render_dpi", String.valueOf(BASELINE_DPI))),
+            Integer.parseInt(getEnv("max_pixels_side", "10000")),
+            Long.parseLong(getEnv("max_image_bytes", "10485760")),
+            Boolean.parseBoolean(getEnv("measure_savings", "false"))
+        );
+    }
+
+    // the same profile writing another format
+    public ImageEncoding withFormat(String format) {
+        return new ImageEncoding(format, imageType, jpegQuality, pngCompression, dpi, maxPixelsSide, maxBytes, measureSavings);
+    }
+
+    public String contentType() {
+        return format.equals("jpeg") ? "image/jpeg" : "image/png";
+    }
+
+    // the configured dpi, lowered when the page would come out larger than max_pixels_side
+    public float dpiFor(PDPage page) {
+        PDRectangle box = page.getCropBox();
+        float longestSide = Math.max(box.getWidth(), box.getHeight());
+        return Math.min(dpi, maxPixelsSide * 72f / Math.max(longestSide, 1f));
+    }
+
+    public byte[] encode(BufferedImage image) throws IOException {
+        Iterator<ImageWriter> writers = ImageIO.getImageWritersByFormatName(format);
+        if (!writers.hasNext()) {
+            throw new IOException("no image writer for " + format);
+        }
+        ImageWriter writer = writers.next();
+        ImageWriteParam param = writer.getDefaultWriteParam();
+        if (param.canWriteCompressed()) {
+            if (format.equals("jpeg")) {
+                param.setCompressionMode(ImageWriteParam.MODE_EXPLICIT);
+                param.setCompressionQuality(jpegQuality);
+            } else if (pngCompression >= 0) {
+                // the png writer maps quality q to deflate level 9 - 9q
+                param.setCompressionMode(ImageWriteParam.MODE_EXPLICIT);
+                param.setCompressionQuality(1f - Math.min(9, pngCompression) / 9f);
+            }
+        }
+        ByteArrayOutputStream baos = new ByteArrayOutputStream();
+        try (ImageOutputStream ios = ImageIO.createImageOutputStream(baos)) {
+            writer.setOutput(ios);
+            writer.write(null, new IIOImage(image, null, null), param);
+        } finally {
+            writer.dispose();
+        }
+        return baos.toByteArray();
+    }
+
+    public static BufferedImage scale(BufferedImage image, double factor) {
+        int width = Math.max(1, (int) Math.round(image.getWidth() * factor));
+        int height = Math.max(1, (int) Math.round(image.getHeight() * factor));
+        BufferedImage scaled = new BufferedImage(width, height, image.getType());
+        Graphics2D graphics = scaled.createGraphics();
+        try {
+            graphics.setRenderingHint(RenderingHints.KEY_INTERPOLATION, RenderingHints.VALUE_INTERPOLATION_BILINEAR);
+            graphics.drawImage(image, 0, 0, width, height, null);
+        } finally {
+            graphics.dispose();
+        }
+        return scaled;
+    }
+
+    // Encodes the image, scaling it down until it fits max_image_bytes (at most a few tries,
+    // the size shrinks roughly with the pixel count).
+    public byte[] encodeWithinLimit(BufferedImage image) throws IOException {
+        byte[] bytes = encode(image);
+        for (int attempt = 0; bytes.length > maxBytes && attempt < 4; ++attempt) {
+            image = scale(image, Math.sqrt((double) maxBytes / bytes.length) * 0.9);
+            bytes = encode(image);
+        }
+        if (bytes.length > maxBytes) {
+            throw new IOException("page image is still " + bytes.length + " bytes after scaling down");
+        }
+        return bytes;
+    }
+
+    public String describe() {
+        return imageType.name().toLowerCase() + " " + format
+            + (format.equals("jpeg") ? " q" + jpegQuality : (pngCompression >= 0 ? " level " + pngCompression : ""));
+    }
+}
@@ -23,36 +23,67 @@ import com.amazonaws.services.lambda.runtime.RequestHandler;
 import java.io.*; 
 import java.util.List;
 import java.util.Map;
-import java.util.ArrayList;
+import java.util.LinkedHashMap;
 import java.lang.Integer;
 import java.lang.String;
 import com.google.gson.*;
 
 public class Lambda implements RequestHandler<Map<String,String>, String[]> {
+    private static final Metrics metrics = new Metrics("pngextract");
 
     @Override
     public String[] handleRequest(Map<String,String> event, Context ctx) {
-        List<String> image_keys = new ArrayList<String>();
-        try {
-            String cur_id = event.get("id");
-            String cur_bucket = event.get("bucket");
-            String cur_key = event.get("key");
-
-            PdfFromS3Pdf s3Pdf = new PdfFromS3Pdf();
+        // failures are rethrown, so the Render_Map iteration and the execution fail instead of
+        // the chunk's pages silently missing
+        String cur_id = event.get("id");
+        String cur_bucket = event.get("bucket");
+        String cur_key = event.get("key");
 
-            image_keys = s3Pdf.run(cur_id, cur_bucket, cur_key);
-            
-            String[] return_arr = image_keys.toArray(new String[0]);
-            
-            // Gson gson = new Gson();
+        PdfFromS3Pdf s3Pdf = new PdfFromS3Pdf(metrics);
+        List<String> image_keys;
 
-            // return gson.toJson(image_keys);
-            return return_arr;
-        }
-        catch (Exception e) {
-            e.printStackTrace();
-            System.out.println(e.getMessage());
+        Map<String,Object> spanFields = new LinkedHashMap<String,Object>();
+        Map<String,Object> properties = new LinkedHashMap<String,Object>();
+        properties.put("id", cur_id);
+        long spanStart = 0;
+        long start = System.nanoTime();
+        try {
+            // a page range chunk from PageCount, or the whole document when there is none
+            if (event.get("first_page") != null && event.get("last_page") != null) {
+                int first_page = Integer.parseInt(String.valueOf(event.get("first_page")));
+                int last_page = Integer.parseInt(String.valueOf(event.get("last_page")));
+                spanFields.put("first_page", first_page);
+                spanFields.put("last_page", last_page);
+                spanStart = Spans.start("render", cur_id, spanFields);
+                image_keys = s3Pdf.run(cur_id, cur_bucket, cur_key, first_page, last_page);
+            } else {
+                spanStart = Spans.start("render", cur_id, spanFields);
+                image_keys = s3Pdf.run(cur_id, cur_bucket, cur_key);
+            }
+        } catch (IOException e) {
+            Spans.end("render", cur_id, spanStart, spanFields, e);
+            failed(properties);
+            throw new UncheckedIOException(e);
+        } catch (InterruptedException e) {
+            Spans.end("render", cur_id, spanStart, spanFields, e);
+            failed(properties);
+            Thread.currentThread().interrupt();
+            throw new RuntimeException(e);
+        } catch (RuntimeException e) {
+            Spans.end("render", cur_id, spanStart, spanFields, e);
+            failed(properties);
+            throw e;
         }
-        return null;
+        spanFields.put("pages", image_keys.size());
+        Spans.end("render", cur_id, spanStart, spanFields, null);
+        metrics.recordSince("chunk_time", start);
+        metrics.flush(properties);
+
+        return image_keys.toArray(new String[0]);
+    }
+
+    private static void failed(Map<String,Object> properties) {
+        metrics.add("chunks_failed", 1);
+        metrics.flush(properties);
     }
 }
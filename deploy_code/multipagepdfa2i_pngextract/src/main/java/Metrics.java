@@ -0,0 +1,128 @@
+/*
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ */
+
+import com.google.gson.Gson;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Map;
+
+// Per invocation metrics in CloudWatch Embedded Metric Format, the same log lines the python
+// lambdas write with metrics.py: timings keep every value (in milliseconds), counts and bytes
+// are one sum per invocation, and flush() prints them in the metrics_namespace namespace
+// (default multipagepdfa2i) with a "function" dimension. metrics=false in the environment
+// turns them off. Safe to use from the render and upload threads.
+public final class Metrics {
+    private static final Gson gson = new Gson();
+    private static final String DEFAULT_NAMESPACE = "multipagepdfa2i";
+    // most values per metric EMF accepts in one log line
+    private static final int MAX_VALUES = 100;
+
+    private final String functionName;
+    private final boolean enabled;
+    private final String namespace;
+    // name -> values, name -> total
+    private final Map<String,List<Double>> timings = new LinkedHashMap<String,List<Double>>();
+    private final Map<String,Long> counts = new LinkedHashMap<String,Long>();
+    private final Map<String,Long> bytes = new LinkedHashMap<String,Long>();
+
+    public Metrics(String functionName) {
+        String enabledValue = System.getenv("metrics");
+        String namespaceValue = System.getenv("metrics_namespace");
+        this.functionName = functionName;
+        this.enabled = enabledValue == null || !enabledValue.equalsIgnoreCase("false");
+        this.namespace = namespaceValue == null || namespaceValue.isEmpty() ? DEFAULT_NAMESPACE : namespaceValue;
+    }
+
+    public synchronized void add(String name, long value) {
+        if (enabled) {
+            counts.put(name, counts.getOrDefault(name, 0L) + value);
+        }
+    }
+
+    public synchronized void addBytes(String name, long value) {
+        if (enabled) {
+            bytes.put(name, bytes.getOrDefault(name, 0L) + value);
+        }
+    }
+
+    // startNanos from System.nanoTime()
+    public synchronized void recordSince(String name, long startNanos) {
+        if (enabled) {
+            timings.computeIfAbsent(name, key -> new ArrayList<Double>()).add((System.nanoTime() - startNanos) / 1e6);
+        }
+    }
+
+    // properties (e.g. the document id) are logged next to the metrics, not as dimensions
+    public void flush(Map<String,Object> properties) {
+        List<Object[]> metrics = new ArrayList<Object[]>();
+        synchronized (this) {
+            for (Map.Entry<String,List<Double>> entry : timings.entrySet()) {
+                metrics.add(new Object[] { entry.getKey(), "Milliseconds", entry.getValue() });
+            }
+            for (Map.Entry<String,Long> entry : counts.entrySet()) {
+                metrics.add(new Object[] { entry.getKey(), "Count", Collections.singletonList(entry.getValue()) });
+            }
+            for (Map.Entry<String,Long> entry : bytes.entrySet()) {
+                metrics.add(new Object[] { entry.getKey(), "Bytes", Collections.singletonList(entry.getValue()) });
+            }
+            timings.clear();
+            counts.clear();
+            bytes.clear();
+        }
+        if (metrics.isEmpty()) {
+            return;
+        }
+
+        // longer timing series continue on the next lines
+        long timestamp = System.currentTimeMillis();
+        int longest = 0;
+        for (Object[] metric : metrics) {
+            longest = Math.max(longest, ((List<?>) metric[2]).size());
+        }
+        for (int offset = 0; offset < longest; offset += MAX_VALUES) {
+            Map<String,Object> line = new LinkedHashMap<String,Object>(properties);
+            List<Map<String,String>> definitions = new ArrayList<Map<String,String>>();
+            Map<String,Object> values = new LinkedHashMap<String,Object>();
+            for (Object[] metric : metrics) {
+                List<?> series = (List<?>) metric[2];
+                if (series.size() <= offset) {
+                    continue;
+                }
+                Map<String,String> definition = new LinkedHashMap<String,String>();
+                definition.put("Name", (String) metric[0]);
+                definition.put("Unit", (String) metric[1]);
+                definitions.add(definition);
+                List<?> chunk = series.subList(offset, Math.min(series.size(), offset + MAX_VALUES));
+                values.put((String) metric[0], chunk.size() == 1 ? chunk.get(0) : chunk);
+            }
+            Map<String,Object> directive = new LinkedHashMap<String,Object>();
+            directive.put("Namespace", namespace);
+            directive.put("Dimensions", Collections.singletonList(Collections.singletonList("function")));
+            directive.put("Metrics", definitions);
+            Map<String,Object> aws = new LinkedHashMap<String,Object>();
+            aws.put("Timestamp", timestamp);
+            aws.put("CloudWatchMetrics", Collections.singletonList(directive));
+            line.put("_aws", aws);
+            line.put("function", functionName);
+            line.putAll(values);
+            System.out.println(gson.toJson(line));
+        }
+    }
+}
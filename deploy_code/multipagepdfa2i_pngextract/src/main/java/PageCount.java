@@ -0,0 +1,110 @@
+/*
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ */
+
+
+import com.amazonaws.services.lambda.runtime.Context;
+import com.amazonaws.services.lambda.runtime.RequestHandler;
+import com.amazonaws.services.s3.AmazonS3;
+import com.amazonaws.services.s3.AmazonS3ClientBuilder;
+import org.apache.pdfbox.pdmodel.PDDocument;
+import java.io.*;
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Map;
+
+// First step for a PDF: reads only the page count and splits the document into page range
+// chunks, each rendered by its own Lambda invocation (Render_Map in the state machine).
+// Returns
+// {
+//     "page_count": 120,
+//     "chunks": [ { "first_page": "0", "last_page": "49" }, ... ],
+//     "image_keys": [ "0", "1", ... ]
+// }
+// image_keys are the keys the chunks will write, for the Process_Map that follows.
+public class PageCount implements RequestHandler<Map<String,String>, Map<String,Object>> {
+    private static final AmazonS3 s3client = AmazonS3ClientBuilder.defaultClient();
+    private static final Metrics metrics = new Metrics("pagecount");
+
+    private static int getPagesPerChunk() {
+        String value = System.getenv("pages_per_chunk");
+        return value == null || value.isEmpty() ? 50 : Math.max(1, Integer.parseInt(value));
+    }
+
+    @Override
+    public Map<String,Object> handleRequest(Map<String,String> event, Context ctx) {
+        Map<String,Object> spanFields = new LinkedHashMap<String,Object>();
+        Map<String,Object> properties = new LinkedHashMap<String,Object>();
+        properties.put("id", event.get("id"));
+        long spanStart = Spans.start("pagecount", event.get("id"), spanFields);
+        try {
+            Map<String,Object> result = countPages(event);
+            spanFields.put("page_count", result.get("page_count"));
+            Spans.end("pagecount", event.get("id"), spanStart, spanFields, null);
+            return result;
+        } catch (RuntimeException e) {
+            Spans.end("pagecount", event.get("id"), spanStart, spanFields, e);
+            metrics.add("documents_failed", 1);
+            throw e;
+        } finally {
+            metrics.flush(properties);
+        }
+    }
+
+    private Map<String,Object> countPages(Map<String,String> event) {
+        long readStart = System.nanoTime();
+        try (PdfSource inputPdf = PdfSource.fromS3(s3client, event.get("bucket"), event.get("key"))) {
+            metrics.recordSince("s3_read_time", readStart);
+            metrics.addBytes("bytes_read", inputPdf.size());
+            return countPages(inputPdf);
+        } catch (IOException e) {
+            throw new UncheckedIOException(e);
+        }
+    }
+
+    private Map<String,Object> countPages(PdfSource inputPdf) throws IOException {
+        long parseStart = System.nanoTime();
+        try (PDDocument inputDocument = inputPdf.open()) {
+            int pageCount = inputDocument.getNumberOfPages();
+            metrics.recordSince("parse_time", parseStart);
+            metrics.add("pages", pageCount);
+            int pagesPerChunk = getPagesPerChunk();
+
+            List<Map<String,String>> chunks = new ArrayList<Map<String,String>>();
+            for (int first_page = 0; first_page < pageCount; first_page += pagesPerChunk) {
+                Map<String,String> chunk = new HashMap<String,String>();
+                chunk.put("first_page", String.valueOf(first_page));
+                chunk.put("last_page", String.valueOf(Math.min(pageCount, first_page + pagesPerChunk) - 1));
+                chunks.add(chunk);
+            }
+
+            List<String> image_keys = new ArrayList<String>();
+            for (int page = 0; page < pageCount; ++page) {
+                image_keys.add(String.valueOf(page));
+            }
+
+            Map<String,Object> result = new HashMap<String,Object>();
+            result.put("page_count", pageCount);
+            result.put("chunks", chunks);
+            result.put("image_keys", image_keys);
+            System.out.println(String.format("%d pages in %d chunks of %d", pageCount, chunks.size(), pagesPerChunk));
+            return result;
+        }
+    }
+}
@@ -17,67 +17,250 @@
  */
 
 
+import com.amazonaws.ClientConfiguration;
 import com.amazonaws.services.s3.AmazonS3;
 import com.amazonaws.services.s3.AmazonS3ClientBuilder;
-import com.amazonaws.services.s3.model.GetObjectRequest;
 import com.amazonaws.services.s3.model.ObjectMetadata;
 import com.amazonaws.services.s3.model.PutObjectRequest;
 import org.apache.pdfbox.pdmodel.PDDocument;
+import org.apache.pdfbox.pdmodel.common.PDRectangle;
 import org.apache.pdfbox.rendering.PDFRenderer;
 import java.awt.image.BufferedImage;
 import java.io.*;
 import java.util.ArrayList;
+import java.util.Collections;
 import java.util.List;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
+import java.util.concurrent.Semaphore;
 import java.util.concurrent.TimeUnit;
+import java.util.concurrent.atomic.AtomicInteger;
+import java.util.concurrent.atomic.AtomicLong;
 import javax.imageio.ImageIO;
 import java.lang.Integer;
 import java.lang.String;
 import com.google.gson.*;
 
 public class PdfFromS3Pdf {
+    // Rendering, PNG encoding and uploading overlap: render_threads pages are rendered at once
+    // (each thread with its own PDDocument, PDFBox documents aren't thread safe) and handed to
+    // upload_threads threads that encode and upload them. Rendered pages waiting for upload
+    // are bounded by in_flight_memory_mb.
+    private static final int RENDER_THREADS = getIntEnv("render_threads", Runtime.getRuntime().availableProcessors());
+    private static final int UPLOAD_THREADS = getIntEnv("upload_threads", 8);
+    private static final long IN_FLIGHT_MEMORY_BYTES = getIntEnv("in_flight_memory_mb", 1024) * 1024L * 1024L;
+    // scanned pages that are a single image are uploaded from the image itself (see EmbeddedImage),
+    // embedded_images=render renders every page
+    private static final boolean PASS_THROUGH_IMAGES = !"render".equals(System.getenv("embedded_images"));
+
+    // one client per container, shared by the upload threads
+    private static final AmazonS3 s3client = AmazonS3ClientBuilder.standard()
+        .withClientConfiguration(new ClientConfiguration().withMaxConnections(UPLOAD_THREADS + 2))
+        .build();
+
+    private final Metrics metrics;
+
+    public PdfFromS3Pdf(Metrics metrics) {
+        this.metrics = metrics;
+    }
+
+    private static int getIntEnv(String name, int fallback) {
+        String value = System.getenv(name);
+        if (value == null || value.isEmpty()) {
+            return fallback;
+        }
+        return Integer.parseInt(value);
+    }
+
     private void UploadToS3(String bucketName, String objectName, String contentType, byte[] bytes) {
-        AmazonS3 s3client = AmazonS3ClientBuilder.defaultClient();
         ByteArrayInputStream baInputStream = new ByteArrayInputStream(bytes);
         ObjectMetadata metadata = new ObjectMetadata();
         metadata.setContentLength(bytes.length);
         metadata.setContentType(contentType);
         PutObjectRequest putRequest = new PutObjectRequest(bucketName, objectName, baInputStream, metadata);
+        long uploadStart = System.nanoTime();
         s3client.putObject(putRequest);
+        metrics.recordSince("s3_write_time", uploadStart);
+        metrics.addBytes("bytes_written", bytes.length);
     }
 
 
-    private InputStream getPdfFromS3(String bucketName, String documentName) throws IOException {
+    private byte[] encodePng(BufferedImage image) throws IOException {
+        ByteArrayOutputStream baos = new ByteArrayOutputStream();
+        ImageIO.write( image, "png", baos );
+        baos.flush();
+        byte[] imageInByte = baos.toByteArray();
+        baos.close();
+        return imageInByte;
+    }
+
+    private static long usedHeapMb() {
+        Runtime runtime = Runtime.getRuntime();
+        return (runtime.totalMemory() - runtime.freeMemory()) / (1024L * 1024L);
+    }
 
-        AmazonS3 s3client = AmazonS3ClientBuilder.defaultClient();
-        com.amazonaws.services.s3.model.S3Object fullObject = s3client.getObject(new GetObjectRequest(bucketName, documentName));
-        InputStream in = fullObject.getObjectContent();
-        return in;
+    // pages rendered ahead of the uploads, from the size of the first rendered page
+    private int getMaxPagesInFlight(PDDocument document, ImageEncoding encoding, int firstPage) {
+        PDRectangle box = document.getPage(firstPage).getCropBox();
+        float dpi = encoding.dpiFor(document.getPage(firstPage));
+        long bytesPerPixel = encoding.imageType == org.apache.pdfbox.rendering.ImageType.RGB ? 4L : 1L;
+        long pageBytes = Math.max(1L, (long) (box.getWidth() / 72 * dpi) * (long) (box.getHeight() / 72 * dpi) * bytesPerPixel);
+        return (int) Math.max(1L, Math.min(RENDER_THREADS + UPLOAD_THREADS, IN_FLIGHT_MEMORY_BYTES / pageBytes));
     }
 
     public ArrayList<String> run(String cur_id, String cur_bucket, String cur_key) throws IOException, InterruptedException {
+        return run(cur_id, cur_bucket, cur_key, 0, Integer.MAX_VALUE);
+    }
+
+    // renders pages first_page to last_page (inclusive, zero based), clamped to the document
+    public ArrayList<String> run(String cur_id, String cur_bucket, String cur_key, int firstPage, int lastPage) throws IOException, InterruptedException {
         ArrayList<String> image_keys = new ArrayList<String>();
+        long start = System.nanoTime();
         
-        InputStream inputPdf = getPdfFromS3(cur_bucket, cur_key);
-
-        PDDocument inputDocument = PDDocument.load(inputPdf);
-        PDFRenderer pdfRenderer = new PDFRenderer(inputDocument);
-
-        for(int cur_page = 0; cur_page < inputDocument.getNumberOfPages(); ++cur_page) {
-            BufferedImage image = pdfRenderer.renderImageWithDPI(cur_page, 300, org.apache.pdfbox.rendering.ImageType.RGB);
-            String new_key = "wip/" + cur_id + "/" + String.valueOf(cur_page) + ".png";
-            
-            ByteArrayOutputStream baos = new ByteArrayOutputStream();
-            ImageIO.write( image, "png", baos );
-            baos.flush();
-            byte[] imageInByte = baos.toByteArray();
-            baos.close();
-            ByteArrayOutputStream os = new ByteArrayOutputStream();
-    
-            UploadToS3(cur_bucket, new_key, "application/png", imageInByte);
-
-            image_keys.add(String.valueOf(cur_page));
+        long readStart = System.nanoTime();
+        final PdfSource inputPdf = PdfSource.fromS3(s3client, cur_bucket, cur_key);
+        metrics.recordSince("s3_read_time", readStart);
+        metrics.addBytes("bytes_read", inputPdf.size());
+        final ImageEncoding encoding = ImageEncoding.fromEnvironment();
+
+        int endPage;
+        int maxPagesInFlight;
+        try (PDDocument inputDocument = inputPdf.open()) {
+            endPage = Math.min(inputDocument.getNumberOfPages(), lastPage == Integer.MAX_VALUE ? lastPage : lastPage + 1);
+            maxPagesInFlight = firstPage < endPage ? getMaxPagesInFlight(inputDocument, encoding, firstPage) : 1;
+        } catch (IOException | RuntimeException e) {
+            inputPdf.close();
+            throw e;
+        }
+
+        final List<PDDocument> opened = Collections.synchronizedList(new ArrayList<PDDocument>());
+        final ThreadLocal<PDDocument> documents = new ThreadLocal<PDDocument>() {
+            @Override
+            protected PDDocument initialValue() {
+                try {
+                    PDDocument document = inputPdf.open();
+                    opened.add(document);
+                    return document;
+                } catch (IOException e) {
+                    throw new UncheckedIOException(e);
+                }
+            }
+        };
+        final AtomicLong totalBytes = new AtomicLong();
+        final AtomicLong totalBaselineBytes = new AtomicLong();
+        final AtomicInteger embeddedPages = new AtomicInteger();
+        final Semaphore inFlight = new Semaphore(maxPagesInFlight);
+        final String bucket = cur_bucket;
+        final String id = cur_id;
+
+        ExecutorService renderPool = Executors.newFixedThreadPool(RENDER_THREADS);
+        final ExecutorService uploadPool = Executors.newFixedThreadPool(UPLOAD_THREADS);
+        List<Future<Future<String>>> pages = new ArrayList<Future<Future<String>>>();
+        try {
+            for (int page = firstPage; page < endPage; ++page) {
+                inFlight.acquire();
+                final int cur_page = page;
+                pages.add(renderPool.submit(() -> {
+                    boolean handedOff = false;
+                    try {
+                        PDDocument document = documents.get();
+                        PDFRenderer pdfRenderer = new PDFRenderer(document);
+                        EmbeddedImage embedded = null;
+                        if (PASS_THROUGH_IMAGES) {
+                            try {
+                                embedded = EmbeddedImage.extract(document.getPage(cur_page), encoding);
+                            } catch (IOException | RuntimeException e) {
+                                System.out.println(String.format("page %d: embedded image not usable (%s), rendering", cur_page, e));
+                            }
+                        }
+                        final EmbeddedImage pageImage = embedded;
+                        final String path = pageImage != null ? pageImage.path : "rendered";
+                        final float dpi = encoding.dpiFor(document.getPage(cur_page));
+                        BufferedImage rendered = null;
+                        if (pageImage == null) {
+                            long renderStart = System.nanoTime();
+                            rendered = pdfRenderer.renderImageWithDPI(cur_page, dpi, encoding.imageType);
+                            metrics.recordSince("render_time", renderStart);
+                        }
+                        final BufferedImage image = rendered;
+                        final long baselineBytes = encoding.measureSavings
+                            ? encodePng(pdfRenderer.renderImageWithDPI(cur_page, ImageEncoding.BASELINE_DPI, org.apache.pdfbox.rendering.ImageType.RGB)).length
+                            : -1L;
+                        Future<String> upload = uploadPool.submit(() -> {
+                            try {
+                                // keys keep the .png name the rest of the pipeline expects, the content type tells the real format
+                                String new_key = "wip/" + id + "/" + String.valueOf(cur_page) + ".png";
+                                byte[] bytes;
+                                String description;
+                                if (pageImage != null) {
+                                    bytes = pageImage.bytes;
+                                    UploadToS3(bucket, new_key, pageImage.contentType, bytes);
+                                    embeddedPages.incrementAndGet();
+                                    description = path;
+                                } else {
+                                    long encodeStart = System.nanoTime();
+                                    bytes = encoding.encodeWithinLimit(image);
+                                    metrics.recordSince("encode_time", encodeStart);
+                                    UploadToS3(bucket, new_key, encoding.contentType(), bytes);
+                                    description = String.format("%s %.0f dpi %s", path, dpi, encoding.describe());
+                                }
+                                totalBytes.addAndGet(bytes.length);
+                                if (baselineBytes >= 0) {
+                                    totalBaselineBytes.addAndGet(baselineBytes);
+                                    System.out.println(String.format("page %d: %s, %d bytes, baseline %d bytes, saved %d bytes, heap %d MB",
+                                        cur_page, description, bytes.length, baselineBytes, baselineBytes - bytes.length, usedHeapMb()));
+                                } else {
+                                    System.out.println(String.format("page %d: %s, %d bytes, heap %d MB",
+                                        cur_page, description, bytes.length, usedHeapMb()));
+                                }
+                                return String.valueOf(cur_page);
+                            } finally {
+                                inFlight.release();
+                            }
+                        });
+                        handedOff = true;
+                        return upload;
+                    } finally {
+                        if (!handedOff) {
+                            inFlight.release();
+                        }
+                    }
+                }));
+            }
+
+            // keys come back in page order whatever order the uploads finish in
+            for (Future<Future<String>> page : pages) {
+                image_keys.add(page.get().get());
+            }
+        } catch (ExecutionException e) {
+            throw new IOException("failed to convert " + cur_key, e.getCause());
+        } finally {
+            renderPool.shutdownNow();
+            uploadPool.shutdownNow();
+            renderPool.awaitTermination(1, TimeUnit.MINUTES);
+            uploadPool.awaitTermination(1, TimeUnit.MINUTES);
+            for (PDDocument document : opened) {
+                document.close();
+            }
+            inputPdf.close();
+        }
+
+        int pageCount = image_keys.size();
+        metrics.add("pages", pageCount);
+        metrics.add("embedded_pages", embeddedPages.get());
+        double seconds = (System.nanoTime() - start) / 1e9;
+        System.out.println(String.format("converted %d pages in %.1f s, %.2f pages/s (%d render, %d upload threads, %d pages in flight)",
+            pageCount, seconds, pageCount / Math.max(seconds, 1e-9), RENDER_THREADS, UPLOAD_THREADS, maxPagesInFlight));
+        System.out.println(String.format("%d pages taken from embedded images, %d rendered", embeddedPages.get(), pageCount - embeddedPages.get()));
+        if (encoding.measureSavings) {
+            System.out.println(String.format("%s: %d bytes, baseline %d bytes, saved %d bytes",
+                encoding.describe(), totalBytes.get(), totalBaselineBytes.get(), totalBaselineBytes.get() - totalBytes.get()));
+        } else {
+            System.out.println(String.format("%s: %d bytes", encoding.describe(), totalBytes.get()));
         }
         
         return image_keys;
     }
-}
\ No newline at end of file
+}
@@ -0,0 +1,101 @@
+/*
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ */
+
+
+import com.amazonaws.services.s3.AmazonS3;
+import com.amazonaws.services.s3.model.GetObjectRequest;
+import com.amazonaws.services.s3.model.S3Object;
+import com.amazonaws.util.IOUtils;
+import org.apache.pdfbox.cos.COSObject;
+import org.apache.pdfbox.io.MemoryUsageSetting;
+import org.apache.pdfbox.pdmodel.DefaultResourceCache;
+import org.apache.pdfbox.pdmodel.PDDocument;
+import org.apache.pdfbox.pdmodel.graphics.PDXObject;
+import java.io.*;
+
+// The PDF being rasterized, either held in the heap (pdf_load_mode=memory, the old behaviour)
+// or spooled to local temp storage (pdf_load_mode=disk, the default). On disk the documents
+// are opened with PDFBox's mixed memory setting, which keeps at most pdf_max_main_memory_mb
+// of each document's scratch data in the heap and the rest in temp files, so heap use no
+// longer grows with the size of the PDF.
+public class PdfSource implements Closeable {
+    private final byte[] bytes;
+    private final File file;
+    private final long maxMainMemoryBytes;
+
+    private PdfSource(byte[] bytes, File file, long maxMainMemoryBytes) {
+        this.bytes = bytes;
+        this.file = file;
+        this.maxMainMemoryBytes = maxMainMemoryBytes;
+    }
+
+    private static String getEnv(String name, String fallback) {
+        String value = System.getenv(name);
+        return value == null || value.isEmpty() ? fallback : value;
+    }
+
+    public static PdfSource fromS3(AmazonS3 s3client, String bucketName, String documentName) throws IOException {
+        long maxMainMemoryBytes = Long.parseLong(getEnv("pdf_max_main_memory_mb", "64")) * 1024L * 1024L;
+        if (getEnv("pdf_load_mode", "disk").equalsIgnoreCase("memory")) {
+            try (S3Object fullObject = s3client.getObject(new GetObjectRequest(bucketName, documentName));
+                 InputStream in = fullObject.getObjectContent()) {
+                return new PdfSource(IOUtils.toByteArray(in), null, maxMainMemoryBytes);
+            }
+        }
+        File file = File.createTempFile("multipagepdfa2i", ".pdf");
+        try {
+            // streams straight to the file, the object is never held in the heap
+            s3client.getObject(new GetObjectRequest(bucketName, documentName), file);
+        } catch (RuntimeException e) {
+            file.delete();
+            throw e;
+        }
+        return new PdfSource(null, file, maxMainMemoryBytes);
+    }
+
+    public PDDocument open() throws IOException {
+        PDDocument document;
+        if (file != null) {
+            document = PDDocument.load(file, MemoryUsageSetting.setupMixed(maxMainMemoryBytes));
+        } else {
+            document = PDDocument.load(bytes);
+        }
+        document.setResourceCache(new PageScopedResourceCache());
+        return document;
+    }
+
+    public long size() {
+        return file != null ? file.length() : bytes.length;
+    }
+
+    @Override
+    public void close() {
+        if (file != null) {
+            file.delete();
+        }
+    }
+
+    // Images are the bulk of a scanned page. The default cache keeps every decoded image
+    // XObject for the life of the document; not caching them lets each page's images go as
+    // soon as the page is rendered. Fonts and color spaces are still shared between pages.
+    private static class PageScopedResourceCache extends DefaultResourceCache {
+        @Override
+        public void put(COSObject indirect, PDXObject xobject) throws IOException {
+        }
+    }
+}
@@ -0,0 +1,69 @@
+/*
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+ */
+
+
+import com.google.gson.Gson;
+import java.util.LinkedHashMap;
+import java.util.Map;
+
+// Span records for the per-document trace, the same records the python lambdas log with
+// spans.py:
+// {"trace": "render", "event": "start", "id": "...", "ts": 1600000000.123, ...}
+// {"trace": "render", "event": "end", "id": "...", "ts": ..., "duration_ms": 5120, ...}
+// spans=false in the environment turns them off.
+public final class Spans {
+    private static final Gson gson = new Gson();
+
+    private Spans() {
+    }
+
+    private static boolean isEnabled() {
+        String value = System.getenv("spans");
+        return value == null || !value.equalsIgnoreCase("false");
+    }
+
+    private static void log(String name, String event, String id, long millis, Map<String,Object> fields) {
+        if (!isEnabled()) {
+            return;
+        }
+        Map<String,Object> record = new LinkedHashMap<String,Object>();
+        record.put("trace", name);
+        record.put("event", event);
+        record.put("id", id);
+        record.put("ts", millis / 1000.0);
+        record.putAll(fields);
+        System.out.println(gson.toJson(record));
+    }
+
+    // returns the start time to pass to end()
+    public static long start(String name, String id, Map<String,Object> fields) {
+        long now = System.currentTimeMillis();
+        log(name, "start", id, now, fields);
+        return now;
+    }
+
+    public static void end(String name, String id, long start, Map<String,Object> fields, Throwable error) {
+        long now = System.currentTimeMillis();
+        Map<String,Object> endFields = new LinkedHashMap<String,Object>(fields);
+        if (error != null) {
+            endFields.put("error", error.toString());
+        }
+        endFields.put("duration_ms", now - start);
+        log(name, "end", id, now, endFields);
+    }
+}
@@ -18,102 +18,128 @@
 
 
 import json
-import boto3
-import botocore
-
-def does_exsist(bucket, key):
-    s3 = boto3.resource('s3')
-    try:
-        s3.Object(bucket, key).load()
-    except botocore.exceptions.ClientError as e:
-        return False
-    else:
-        return True
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import clients
+import metrics
+from csv_fragments import OUTPUT_TYPES, FRAGMENT_SUFFIX, get_page_number, page_rows
+from s3_output import MIN_PART_SIZE
+
+METRICS = metrics.get("wrapup")
+
+def get_fetch_workers():
+    return int(os.environ.get("fetch_workers", "16"))
+
+def create_s3_client():
+    # one client shared by the fetch threads, sized so they don't queue for a connection
+    return clients.client('s3', max_pool_connections=get_fetch_workers())
 
 def write_data_to_bucket(payload, name, csv):
     dest = "wip/" + payload["id"] + "/csv/" + name.replace(".png", ".csv")
-    s3 = boto3.resource('s3')
+    s3 = clients.resource('s3')
     s3.Object(payload["bucket"], dest).put(Body=csv)
     return dest
 
-def get_data_from_bucket(bucket, key):
-    client = boto3.client('s3')
-    response = client.get_object(
-        Bucket=bucket,
-        Key=key
-    )
-    return json.load(response["Body"])
-
-def create_csv(kv_list, give_type):
-    output = ""
-    for item in kv_list:
-        output += item["key"].replace(",", "") + "," + item["value"].replace(",", "") + "," + give_type + "\n"
-    return output
-
-def curate_data(base_image_keys, payload):
-    data = ""
-    for base_key in base_image_keys:
-        page_number = base_key[base_key.rfind("/")+1:]
-        page_number = "page " + str(int(page_number[:page_number.find(".")]) + 1)
-        
-        data += page_number + ",-,-" +  "\n"
-
-        if does_exsist(payload["bucket"], base_key + "/ai/output.json"):
-            temp_data = get_data_from_bucket(payload["bucket"], base_key + "/ai/output.json")
-            data += create_csv(temp_data, "ai")
-        if does_exsist(payload["bucket"], base_key + "/human/output.json"):
-            temp_data = get_data_from_bucket(payload["bucket"], base_key + "/human/output.json")
-            data += create_csv(temp_data, "human")
+def get_data_from_bucket(client, bucket, key):
+    with METRICS.timer("s3_read_time"):
+        response = client.get_object(
+            Bucket=bucket,
+            Key=key
+        )
+        data = json.load(response["Body"])
+    METRICS.add_bytes("bytes_read", response["ContentLength"])
+    return data
 
+def get_bytes_from_bucket(client, bucket, key):
+    with METRICS.timer("s3_read_time"):
+        response = client.get_object(
+            Bucket=bucket,
+            Key=key
+        )
+        data = response["Body"].read()
+    METRICS.add_bytes("bytes_read", len(data))
     return data
 
-def get_base_image_keys(bucket, keys):
+def list_output_keys(client, bucket, id):
+    # base image key -> {"ai": item, "human": item, "csv": item} (listing items with Key and
+    # Size) for every output and csv fragment under wip/<id>/
+    outputs = {}
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix="wip/" + id + "/"):
+        for item in page.get("Contents", []):
+            if item["Key"].endswith(FRAGMENT_SUFFIX):
+                outputs.setdefault(item["Key"][:-len(FRAGMENT_SUFFIX)], {})["csv"] = item
+                continue
+            for give_type in OUTPUT_TYPES:
+                suffix = "/" + give_type + "/output.json"
+                if item["Key"].endswith(suffix):
+                    outputs.setdefault(item["Key"][:-len(suffix)], {})[give_type] = item
+    return outputs
+
+def get_base_image_keys(payload, image_keys):
     temp = []
-    for key in keys:
-        if "/human/output.json" in key:
-            temp.append(key[:key.rfind("/human/output.json")])
-        if "/ai/output.json" in key:
-            temp.append(key[:key.rfind("/ai/output.json")])
+    for item in image_keys:
+        if item == "single_image":
+            temp.append("wip/" + payload["id"] + "/0.png")
+        else:
+            temp.append("wip/" + payload["id"] + "/" + item + ".png")
     return list(dict.fromkeys(temp))
 
-def get_all_possible_files(event):
-    files = []
+def get_all_possible_files(client, event):
     payload = {}
 
     payload["bucket"] = event["bucket"]
     payload["id"] = event["id"]
     payload["key"] = event["key"]
 
-    for item in event["image_keys"]:
-        if item == "single_image":
-            base_key = "wip/" + payload["id"] + "/0.png"
-        else:
-            base_key = "wip/" + payload["id"] + "/" + item + ".png"
-
-        possible_ai_output_key = base_key + "/ai/output.json"
-        possible_human_output_key = base_key + "/human/output.json"
-
-        s3 = boto3.resource('s3')
-
-        try:
-            s3.Object(event["bucket"], possible_ai_output_key).load()
-            files.append(possible_ai_output_key)
-        except botocore.exceptions.ClientError as e:
-            pass
-
-        try:
-            s3.Object(event["bucket"], possible_human_output_key).load()
-            files.append(possible_human_output_key)
-        except botocore.exceptions.ClientError as e:
-            pass
-
-    return files, payload
-
-def gather_and_combine_data(event):
-    
-    keys, payload = get_all_possible_files(event)
-    base_image_keys = get_base_image_keys(payload["bucket"], keys)
-    base_image_keys.sort()
-    data = curate_data(base_image_keys, payload)
-    return data, payload
-
+    with METRICS.timer("s3_list_time"):
+        outputs = list_output_keys(client, payload["bucket"], payload["id"])
+    pages = []
+    for base_key in get_base_image_keys(payload, event["image_keys"]):
+        if base_key in outputs:
+            pages.append((base_key, outputs[base_key]))
+    pages.sort(key=lambda page: get_page_number(page[0]))
+    METRICS.add("pages", len(pages))
+
+    return pages, payload
+
+def fetch_page(client, bucket, page, with_outputs=False):
+    # (base key, kind, csv, outputs). kind and csv are ("copy", item) for a fragment big enough
+    # to be copied as a multipart part, ("csv", bytes) for other fragments and ("rows", rows)
+    # built from the json outputs of pages without one. outputs (give type -> kv_list) are
+    # only downloaded when needed, for pages without a fragment or when with_outputs is set.
+    base_key, items = page
+    outputs = None
+    if with_outputs or "csv" not in items:
+        outputs = {}
+        for give_type in OUTPUT_TYPES:
+            if give_type in items:
+                outputs[give_type] = get_data_from_bucket(client, bucket, items[give_type]["Key"])
+    if "csv" in items:
+        if items["csv"]["Size"] >= MIN_PART_SIZE:
+            return base_key, "copy", items["csv"], outputs
+        return base_key, "csv", get_bytes_from_bucket(client, bucket, items["csv"]["Key"]), outputs
+    return base_key, "rows", list(page_rows(base_key, outputs)), outputs
+
+def fetch_pages(client, bucket, pages, with_outputs=False):
+    # Pages come back in order no matter which fetch finishes first. At most two pages per
+    # worker are downloaded ahead of the consumer, which keeps memory flat for long documents.
+    workers = get_fetch_workers()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for page in pages:
+            pending.append(executor.submit(fetch_page, client, bucket, page, with_outputs))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def curate_data(client, pages, payload, with_outputs=False):
+    return fetch_pages(client, payload["bucket"], pages, with_outputs)
+
+def gather_and_combine_data(event, with_outputs=False):
+    # returns the pages lazily (see fetch_page), pages are fetched as they're consumed
+    client = create_s3_client()
+    pages, payload = get_all_possible_files(client, event)
+    return curate_data(client, pages, payload, with_outputs), payload
@@ -17,33 +17,105 @@
 #  */
 
 
+import csv
 import json
-import boto3
-import botocore
-from boto3.dynamodb.conditions import Key
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from gather_data import gather_and_combine_data
+from record_output import RECORD_WRITERS, get_output_formats, page_records
+from s3_output import S3MultipartWriter
+import clients
+import metrics
+import spans
 
-def write_to_s3(csv, payload, original_uplolad_key):
-    client = boto3.client('s3')
-    response = client.put_object(
-        Body = csv,
-        Bucket = payload["bucket"],
-        Key = "complete/" + original_uplolad_key + "-" + payload["id"] + "/output.csv"
+METRICS = metrics.get("wrapup")
+
+# most keys a single DeleteObjects request accepts
+DELETE_BATCH_SIZE = 1000
+
+def write_to_s3(pages, payload, original_uplolad_key, formats=()):
+    # Stitches the pages' csv fragments in page order, pages without one are serialized here.
+    # The records of each page also go to the outputs in `formats` as the pages stream by.
+    client = clients.client('s3')
+    prefix = "complete/" + original_uplolad_key + "-" + payload["id"] + "/output."
+    counts = {"copy": 0, "csv": 0, "rows": 0}
+    with ExitStack() as stack:
+        output = stack.enter_context(S3MultipartWriter(client, payload["bucket"], prefix + "csv", "text/csv"))
+        record_outputs = []
+        for name in formats:
+            writer_class = RECORD_WRITERS[name]
+            record_output = stack.enter_context(S3MultipartWriter(client, payload["bucket"], prefix + name, writer_class.content_type))
+            record_outputs.append((record_output, writer_class(record_output)))
+        writer = csv.writer(output, lineterminator="\n")
+        for base_key, kind, data, outputs in pages:
+            counts[kind] += 1
+            if kind == "copy":
+                output.copy_part(data["Key"], data["Size"])
+            elif kind == "csv":
+                output.write_bytes(data)
+            else:
+                writer.writerows(data)
+            for _, record_writer in record_outputs:
+                record_writer.write_records(page_records(payload["id"], base_key, outputs))
+        # the record writers finish their files before the outputs complete the uploads
+        for _, record_writer in record_outputs:
+            record_writer.close()
+    report = {"bytes": output.bytes_written, "fragments_copied": counts["copy"],
+        "fragments_appended": counts["csv"], "pages_serialized": counts["rows"]}
+    for name, (record_output, _) in zip(formats, record_outputs):
+        report[name + "_bytes"] = record_output.bytes_written
+    print("output:", json.dumps(report))
+    METRICS.add_bytes("bytes_written", sum(value for name, value in report.items() if name.endswith("bytes")))
+    METRICS.add("fragments_copied", counts["copy"])
+    METRICS.add("fragments_appended", counts["csv"])
+    METRICS.add("pages_serialized", counts["rows"])
+    return output.bytes_written
+
+def get_cleanup_workers():
+    return int(os.environ.get("cleanup_workers", "8"))
+
+def list_wip_objects(client, payload):
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=payload["bucket"], Prefix="wip/" + payload["id"] + "/"):
+        for item in page.get("Contents", []):
+            yield item
+
+def delete_batch(client, bucket, batch):
+    response = client.delete_objects(
+        Bucket=bucket,
+        Delete={
+            "Objects": [{"Key": item["Key"]} for item in batch],
+            "Quiet": True
+        }
     )
-    return response
+    # in quiet mode only the failures come back
+    failed = set(error["Key"] for error in response.get("Errors", []))
+    deleted = [item for item in batch if item["Key"] not in failed]
+    return len(deleted), sum(item["Size"] for item in deleted), len(failed)
 
 def clear_old_s3_data(payload):
-    client = boto3.client('s3')
-    response = client.list_objects_v2(
-        Bucket=payload["bucket"]
-    )
-    for item in response["Contents"]:
-        if payload["id"] in item["Key"]:
-            response = client.delete_object(
-                Bucket=payload["bucket"],
-                Key=item["Key"]
-            )
-    return "done"
+    client = clients.client('s3', max_pool_connections=get_cleanup_workers())
+    futures = []
+    with ThreadPoolExecutor(max_workers=get_cleanup_workers()) as executor:
+        batch = []
+        for item in list_wip_objects(client, payload):
+            batch.append(item)
+            if len(batch) == DELETE_BATCH_SIZE:
+                futures.append(executor.submit(delete_batch, client, payload["bucket"], batch))
+                batch = []
+        if batch:
+            futures.append(executor.submit(delete_batch, client, payload["bucket"], batch))
+
+    report = {"objects": 0, "bytes": 0, "failed": 0}
+    for future in futures:
+        objects, size, failed = future.result()
+        report["objects"] += objects
+        report["bytes"] += size
+        report["failed"] += failed
+    print("cleanup:", json.dumps(report))
+    METRICS.add("objects_deleted", report["objects"])
+    return report
 
 def lambda_handler(event, context):
     # Event looks like this:
@@ -57,13 +129,19 @@ def lambda_handler(event, context):
     #     ]
     # }
 
-    #gater all of the data into a CSV
-    data, payload = gather_and_combine_data(event)
-
-    #clean up old data
-    clear_old_s3_data(payload)
+    #gater all of the pages' csv fragments and stitch them into a CSV on s3
+    formats = get_output_formats()
+    try:
+        with spans.span("wrapup", event["id"], pages=len(event["image_keys"])):
+            pages, payload = gather_and_combine_data(event, with_outputs=bool(formats))
+            # pages are fetched as they're written, so this includes the s3 reads
+            with METRICS.timer("output_time"):
+                write_to_s3(pages, payload, payload["key"].replace("/", "-"), formats)
 
-    #output to s3
-    write_to_s3(data, payload, payload["key"].replace("/", "-"))
+            #clean up old data
+            with METRICS.timer("cleanup_time"):
+                payload["cleanup"] = clear_old_s3_data(payload)
+    finally:
+        METRICS.flush()
 
     return payload
@@ -0,0 +1,115 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Typed outputs next to output.csv: one record per key/value pair with the document id, page
+# (1 based), key, value, source ("ai" or "human") and confidence. Wrapup writes them as JSON
+# Lines and/or Parquet, chosen with output_formats, streaming like the csv: records go out
+# page by page (Parquet one row group at a time) through an S3MultipartWriter.
+#
+# Parquet needs pyarrow, which isn't part of the lambda runtime. It's imported when a parquet
+# output is asked for, install it into the layer (see README) to use it.
+
+import json
+import os
+from csv_fragments import OUTPUT_TYPES, get_page_number
+
+FIELDS = ["document_id", "page", "key", "value", "source", "confidence"]
+
+def get_output_formats():
+    # formats written next to the csv, e.g. "jsonl,parquet"
+    formats = [name.strip().lower() for name in os.environ.get("output_formats", "").split(",") if name.strip()]
+    for name in formats:
+        if name not in RECORD_WRITERS:
+            raise ValueError("output_formats may hold " + ", ".join(RECORD_WRITERS) + ", not " + name)
+    return formats
+
+def get_row_group_size():
+    return int(os.environ.get("parquet_row_group_size", "50000"))
+
+def page_records(document_id, base_key, outputs):
+    page = get_page_number(base_key) + 1
+    for give_type in OUTPUT_TYPES:
+        for item in outputs.get(give_type, []):
+            yield {
+                "document_id": document_id,
+                "page": page,
+                "key": item["key"],
+                "value": item["value"],
+                "source": give_type,
+                "confidence": item.get("confidence")
+            }
+
+class JsonLinesWriter:
+
+    content_type = "application/x-ndjson"
+
+    def __init__(self, output):
+        self.output = output
+
+    def write_records(self, records):
+        self.output.write("".join(json.dumps(record) + "\n" for record in records))
+
+    def close(self):
+        pass
+
+class ParquetWriter:
+    # records are buffered up to a row group, so memory stays bounded by the row group size
+
+    content_type = "application/vnd.apache.parquet"
+
+    def __init__(self, output, row_group_size=None):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ("document_id", pyarrow.string()),
+            ("page", pyarrow.int32()),
+            ("key", pyarrow.string()),
+            ("value", pyarrow.string()),
+            ("source", pyarrow.string()),
+            ("confidence", pyarrow.float64())
+        ])
+        self.row_group_size = row_group_size or get_row_group_size()
+        self.columns = {name: [] for name in FIELDS}
+        self.rows = 0
+        self.writer = pyarrow.parquet.ParquetWriter(output, self.schema, compression="snappy")
+
+    def write_records(self, records):
+        for record in records:
+            for name in FIELDS:
+                self.columns[name].append(record[name])
+            self.rows += 1
+            if self.rows >= self.row_group_size:
+                self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pyarrow.Table.from_pydict(self.columns, schema=self.schema))
+            self.columns = {name: [] for name in FIELDS}
+            self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+# output_formats name -> writer, the name is also the output's file extension
+RECORD_WRITERS = {
+    "jsonl": JsonLinesWriter,
+    "parquet": ParquetWriter
+}
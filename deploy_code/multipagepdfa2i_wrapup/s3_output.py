@@ -0,0 +1,146 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+import os
+
+# S3 rejects multipart parts smaller than this, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+def get_part_size():
+    return max(MIN_PART_SIZE, int(os.environ.get("output_part_size_mb", "8")) * 1024 * 1024)
+
+class S3MultipartWriter:
+    # File-like writer (text or bytes) that uploads to S3 one part at a time, so only a single
+    # part is ever held in memory. Output that never fills a part is written with one put_object.
+
+    def __init__(self, client, bucket, key, content_type, part_size=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size or get_part_size()
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+        self.closed = False
+
+    def write(self, data):
+        self.write_bytes(data.encode("utf-8") if isinstance(data, str) else data)
+        return len(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def write_bytes(self, data):
+        self.buffer += data
+        self.bytes_written += len(data)
+        if len(self.buffer) >= self.part_size:
+            self.upload_part()
+
+    def copy_part(self, source_key, size):
+        # Appends an object of the same bucket. S3 copies it server side as a part of its own
+        # when it and whatever is buffered ahead of it are both large enough to be parts;
+        # smaller objects are downloaded into the buffer.
+        if size < MIN_PART_SIZE or 0 < len(self.buffer) < MIN_PART_SIZE:
+            response = self.client.get_object(Bucket=self.bucket, Key=source_key)
+            self.write_bytes(response["Body"].read())
+            return
+        if self.buffer:
+            self.upload_part()
+        part_number = self.start_part()
+        response = self.client.upload_part_copy(
+            Bucket=self.bucket,
+            Key=self.key,
+            CopySource={"Bucket": self.bucket, "Key": source_key},
+            PartNumber=part_number,
+            UploadId=self.upload_id
+        )
+        self.parts.append({"ETag": response["CopyPartResult"]["ETag"], "PartNumber": part_number})
+        self.bytes_written += size
+
+    def start_part(self):
+        # the next part number, starting the multipart upload on the first part
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type
+            )
+            self.upload_id = response["UploadId"]
+        return len(self.parts) + 1
+
+    def upload_part(self):
+        part_number = self.start_part()
+        response = self.client.upload_part(
+            Body=bytes(self.buffer),
+            Bucket=self.bucket,
+            Key=self.key,
+            PartNumber=part_number,
+            UploadId=self.upload_id
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer = bytearray()
+
+    def close(self):
+        # safe to call again, e.g. after a parquet writer closed its sink
+        if self.closed:
+            return None
+        self.closed = True
+        if self.upload_id is None:
+            # nothing was uploaded as a part yet, the whole output is in the buffer
+            return self.client.put_object(
+                Body=bytes(self.buffer),
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type
+            )
+        if self.buffer:
+            self.upload_part()
+        return self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts}
+        )
+
+    def abort(self):
+        self.closed = True
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -22,6 +22,26 @@
 # ~ ENTER SAGEMAKER AUGMENTED AI WORKFLOW ARN HERE:
 SAGEMAKER_WORKFLOW_AUGMENTED_AI_ARN_EV = ""
 
+# Page scheduling. ANALYZEPDF_CONCURRENCY analyzepdf invocations with ANALYZEPDF_PAGE_WORKERS
+# threads each cap the pages analyzed at once across all documents. Each document has at most
+# PAGES_IN_FLIGHT_PER_DOCUMENT pages in the textract queue (pages in human review give their
+# slot back), and every finished page lets the document queue its next one behind the other
+# documents' pages, so documents take turns. Step Functions runs about 40 iterations of an
+# inline Map at once whatever its max_concurrency, so that is the largest window that holds:
+# a document alone uses 40 of the global cap, the rest is left to the other documents.
+# See benchmarks/bench_scheduling.py.
+ANALYZEPDF_CONCURRENCY = 10
+ANALYZEPDF_PAGE_WORKERS = 10
+PAGES_IN_FLIGHT_PER_DOCUMENT = 40
+
+# Failing pages. A page message received this many times goes to the textract dead letter
+# queue; analyzepdf fails the page's task on its last receive, so the execution fails (and can
+# be resumed) instead of waiting. The task timeouts are the backstop for messages that never
+# reach analyzepdf, the review wait outlasts the human review workflow's task lifetime.
+TEXTRACT_MAX_RECEIVE_COUNT = 5
+PAGE_TASK_TIMEOUT_HOURS = 12
+REVIEW_TASK_TIMEOUT_DAYS = 14
+
 # -------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------
@@ -44,45 +64,143 @@ from aws_cdk import (
 
 class Multipagepdfa2IStack(core.Stack):
 
-    def create_state_machine(self, services):
-
+    def create_render_map(self, services, map_id, task_id, items_path):
         task_pngextract = aws_stepfunctions_tasks.LambdaInvoke(
-            self, "PDF. Conver to PNGs",
+            self, task_id,
             lambda_function = services["lambda"]["pngextract"],
-            payload_response_only=True,
-            result_path = "$.image_keys"
+            payload_response_only=True
         )
 
-        task_wrapup = aws_stepfunctions_tasks.LambdaInvoke(
-            self, "Wrapup and Clean",
-            lambda_function = services["lambda"]["wrapup"]
-        )
+        # each chunk of pages is rendered by its own pngextract invocation
+        return aws_stepfunctions.Map(
+            self, map_id,
+            items_path = items_path,
+            result_path="DISCARD",
+            max_concurrency=20,
+            parameters = {
+                "id.$": "$.id",
+                "bucket.$": "$.bucket",
+                "key.$": "$.key",
+                "first_page.$": "$$.Map.Item.Value.first_page",
+                "last_page.$": "$$.Map.Item.Value.last_page"
+            }
+        ).iterator(task_pngextract)
+
+    def create_process_map(self, services, map_id, task_id, items_path, item_parameters):
+        # item_parameters are the page's fields taken from the map item, sent on to analyzepdf
+        message_body = {
+            "token": aws_stepfunctions.Context.task_token,
+            "id.$": "$.id",
+            "bucket.$": "$.bucket",
+            "key.$": "$.key"
+        }
+        parameters = {
+            "id.$": "$.id",
+            "bucket.$": "$.bucket",
+            "key.$": "$.key"
+        }
+        for name, path in item_parameters.items():
+            message_body[name + ".$"] = "$." + name
+            parameters[name + ".$"] = path
 
         iterate_sqs_to_textract = aws_stepfunctions_tasks.SqsSendMessage(
-            self, "Perform Textract and A2I",
+            self, task_id,
             queue=services["textract_sqs"], 
+            message_body = aws_stepfunctions.TaskInput.from_object(message_body),
+            delay= None,
+            integration_pattern=aws_stepfunctions.ServiceIntegrationPattern.WAIT_FOR_TASK_TOKEN,
+            timeout=core.Duration.hours(PAGE_TASK_TIMEOUT_HOURS)
+        )
+
+        # each page answers {"wip_key": "", "review": true | false}, for Review_Map
+        return aws_stepfunctions.Map(
+            self, map_id,
+            items_path = items_path,
+            result_path="$.reviews",
+            max_concurrency=PAGES_IN_FLIGHT_PER_DOCUMENT,
+            parameters = parameters
+        ).iterator(iterate_sqs_to_textract)
+
+    def create_review_map(self, services):
+        # Pages in human review left Process_Map (and the document's window of pages in flight)
+        # once analyzed, here each of them waits for humancomplete, as many as Step Functions
+        # runs at once. Only those pages are iterated, the others would add history events
+        # (25,000 per execution at most) for nothing.
+        wait_for_review = aws_stepfunctions_tasks.SqsSendMessage(
+            self, "Wait for human review",
+            queue=services["textract_sqs"],
             message_body = aws_stepfunctions.TaskInput.from_object({
                 "token": aws_stepfunctions.Context.task_token,
                 "id.$": "$.id",
                 "bucket.$": "$.bucket",
                 "key.$": "$.key",
-                "wip_key.$": "$.wip_key"
+                "wip_key.$": "$.wip_key",
+                "stage": "await_human"
             }),
             delay= None,
-            integration_pattern=aws_stepfunctions.ServiceIntegrationPattern.WAIT_FOR_TASK_TOKEN
+            integration_pattern=aws_stepfunctions.ServiceIntegrationPattern.WAIT_FOR_TASK_TOKEN,
+            timeout=core.Duration.days(REVIEW_TASK_TIMEOUT_DAYS)
+        )
+
+        reviews_pass = aws_stepfunctions.Pass(
+            self,
+            "Collect pages in human review",
+            input_path="$.reviews[?(@.review == true)]",
+            result_path="$.reviews"
         )
 
-        process_map = aws_stepfunctions.Map(
-            self, "Process_Map",
-            items_path = "$.image_keys",
+        review_map = aws_stepfunctions.Map(
+            self, "Review_Map",
+            items_path = "$.reviews",
             result_path="DISCARD",
             parameters = {
                 "id.$": "$.id",
                 "bucket.$": "$.bucket",
                 "key.$": "$.key",
-                "wip_key.$": "$$.Map.Item.Value"
+                "wip_key.$": "$$.Map.Item.Value.wip_key"
             }
-        ).iterator(iterate_sqs_to_textract)
+        ).iterator(wait_for_review)
+
+        # states chained after this one follow Review_Map
+        return aws_stepfunctions.Chain.start(reviews_pass).next(review_map)
+
+    def create_state_machine(self, services):
+
+        task_pagecount = aws_stepfunctions_tasks.LambdaInvoke(
+            self, "PDF. Count pages",
+            lambda_function = services["lambda"]["pagecount"],
+            payload_response_only=True,
+            result_path = "$.pages"
+        )
+
+        render_map = self.create_render_map(services, "Render_Map", "PDF. Conver to PNGs", "$.pages.chunks")
+
+        pages_pass = aws_stepfunctions.Pass(
+            self,
+            "PDF. Collect page keys.",
+            input_path="$.pages.image_keys",
+            result_path="$.image_keys"
+        )
+
+        task_wrapup = aws_stepfunctions_tasks.LambdaInvoke(
+            self, "Wrapup and Clean",
+            lambda_function = services["lambda"]["wrapup"]
+        )
+
+        process_map = self.create_process_map(
+            services, "Process_Map", "Perform Textract and A2I", "$.image_keys",
+            {"wip_key": "$$.Map.Item.Value"}
+        )
+
+        review_map = self.create_review_map(services)
+
+        # resuming a failed document (kickoff's resume.py): only the missing chunks are rendered
+        # and only the remaining pages processed, $.image_keys already lists all of the pages
+        resume_render_map = self.create_render_map(services, "Resume. Render_Map", "Resume. Convert missing PNGs", "$.resume.chunks")
+        resume_process_map = self.create_process_map(
+            services, "Resume. Process_Map", "Resume. Perform Textract and A2I", "$.resume.pages",
+            {"wip_key": "$$.Map.Item.Value.wip_key", "stage": "$$.Map.Item.Value.stage"}
+        )
         
         choice_pass = aws_stepfunctions.Pass(
             self,
@@ -91,8 +209,77 @@ class Multipagepdfa2IStack(core.Stack):
             result_path="$.image_keys"
         )
 
+        # native PDF mode: the whole PDF goes to asynchronous textract, no pages, no human review
+        task_analyzedoc_start = aws_stepfunctions_tasks.LambdaInvoke(
+            self, "PDF. Start document analysis",
+            lambda_function = services["lambda"]["analyzedoc"],
+            payload_response_only=True,
+            payload = aws_stepfunctions.TaskInput.from_object({
+                "action": "start",
+                "id.$": "$.id",
+                "execution.$": "$$.Execution.Name",
+                "bucket.$": "$.bucket",
+                "key.$": "$.key"
+            }),
+            result_path = "$.analysis"
+        )
+
+        analyzedoc_wait = aws_stepfunctions.Wait(
+            self, "PDF. Wait for document analysis",
+            time=aws_stepfunctions.WaitTime.duration(core.Duration.seconds(15))
+        )
+
+        task_analyzedoc_check = aws_stepfunctions_tasks.LambdaInvoke(
+            self, "PDF. Check document analysis",
+            lambda_function = services["lambda"]["analyzedoc"],
+            payload_response_only=True,
+            payload = aws_stepfunctions.TaskInput.from_object({
+                "action": "check",
+                "job_id.$": "$.analysis.job_id",
+                "id.$": "$.id"
+            }),
+            result_path = "$.analysis"
+        )
+
+        task_analyzedoc_collect = aws_stepfunctions_tasks.LambdaInvoke(
+            self, "PDF. Collect document analysis",
+            lambda_function = services["lambda"]["analyzedoc"],
+            payload_response_only=True,
+            payload = aws_stepfunctions.TaskInput.from_object({
+                "action": "collect",
+                "job_id.$": "$.analysis.job_id",
+                "id.$": "$.id",
+                "bucket.$": "$.bucket"
+            }),
+            result_path = "$.image_keys"
+        )
+
+        analyzedoc_status_choice = aws_stepfunctions.Choice(self, "Document analysis done?")
+        analyzedoc_status_choice.when(aws_stepfunctions.Condition.string_equals("$.analysis.status", "IN_PROGRESS"), analyzedoc_wait)
+        analyzedoc_status_choice.when(aws_stepfunctions.Condition.string_equals("$.analysis.status", "SUCCEEDED"), task_analyzedoc_collect)
+        analyzedoc_status_choice.when(aws_stepfunctions.Condition.string_equals("$.analysis.status", "PARTIAL_SUCCESS"), task_analyzedoc_collect)
+        analyzedoc_status_choice.otherwise(aws_stepfunctions.Fail(self, "Document analysis failed"))
+
+        task_analyzedoc_start.next(analyzedoc_wait).next(task_analyzedoc_check).next(analyzedoc_status_choice)
+        task_analyzedoc_collect.next(task_wrapup)
+
+        process_map.next(review_map).next(task_wrapup)
+        resume_render_map.next(resume_process_map).next(review_map)
+        task_pagecount.next(render_map).next(pages_pass).next(process_map)
+        choice_pass.next(process_map)
+
+        # textract_mode is set by kickoff, async sends PDFs to the native PDF mode, resume is a
+        # failed document started again
         pdf_or_image_choice = aws_stepfunctions.Choice(self, "PDF or Image?")
-        pdf_or_image_choice.when(aws_stepfunctions.Condition.string_equals("$.extension", "pdf"), task_pngextract)
+        pdf_or_image_choice.when(aws_stepfunctions.Condition.string_equals("$.textract_mode", "resume"), resume_render_map)
+        pdf_or_image_choice.when(
+            aws_stepfunctions.Condition.and_(
+                aws_stepfunctions.Condition.string_equals("$.extension", "pdf"),
+                aws_stepfunctions.Condition.string_equals("$.textract_mode", "async")
+            ),
+            task_analyzedoc_start
+        )
+        pdf_or_image_choice.when(aws_stepfunctions.Condition.string_equals("$.extension", "pdf"), task_pagecount)
         pdf_or_image_choice.when(aws_stepfunctions.Condition.string_equals("$.extension", "png"), choice_pass)
         pdf_or_image_choice.when(aws_stepfunctions.Condition.string_equals("$.extension", "jpg"), choice_pass)
 
@@ -101,7 +288,7 @@ class Multipagepdfa2IStack(core.Stack):
             scope = self, 
             id = "multipagepdfa2i_stepfunction",
             state_machine_name = "multipagepdfa2i_stepfunction",
-            definition=pdf_or_image_choice.afterwards().next(process_map).next(task_wrapup)
+            definition=pdf_or_image_choice
         )
 
         return multipagepdfa2i_sf
@@ -121,10 +308,24 @@ class Multipagepdfa2IStack(core.Stack):
             removal_policy=core.RemovalPolicy.DESTROY
         )
 
+    def create_coordination_table(self):
+        # small shared state between concurrent invocations, e.g. the learned textract rate
+        return aws_dynamodb.Table(
+            self, "multia2ipdf_coordination",
+            table_name="multia2ipdf_coordination",
+            partition_key=aws_dynamodb.Attribute(
+                name="pk",
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=core.RemovalPolicy.DESTROY
+        )
+
     def create_iam_role_for_lambdas(self):
         lam_roles = {}
         
-        names = ["kickoff", "pngextract", "analyzepdf", "humancomplete", "wrapup"]
+        names = ["kickoff", "pngextract", "analyzepdf", "analyzedoc", "humancomplete", "wrapup"]
 
         for name in names:
             lam_roles[name] = aws_iam.Role(
@@ -137,7 +338,9 @@ class Multipagepdfa2IStack(core.Stack):
         # invokes another lambda function - client.invoke
         # lists all step functions, used to look for the state machine arn - list_state_machines
         # invokes a step function - start_execution
-        # puts item into dynamodb - put_item
+        # puts item into dynamodb - put_item, claims identical content in the coordination table
+        # resuming a document - describe / list executions, pagecount invoke, wip listing, output
+        # check, callback query
         lam_roles["kickoff"].add_to_policy(
             statement=aws_iam.PolicyStatement(
                 resources=['*'],
@@ -145,7 +348,13 @@ class Multipagepdfa2IStack(core.Stack):
                     's3:Read',
                     's3:PutObject',
                     'lambda:InvokeFunction',
+                    's3:ListBucket',
                     'states:StartExecution',
+                    'states:DescribeExecution',
+                    'states:ListExecutions',
+                    's3:GetObject',
+                    'dynamodb:PutItem',
+                    'dynamodb:Query',
                     'sts:AssumeRole',
                     'sqs:DeleteMessage',
                     'sqs:ReceiveMessage',
@@ -174,6 +383,8 @@ class Multipagepdfa2IStack(core.Stack):
         # !!!! analyzepdf lambda function
         # step functions - sendtask success
         # dynmodb - put item
+        # dynamodb - get / update item, shared textract rate and result cache
+        # dynamodb - query / delete item, moves a resumed page's human review to the new token
         # s3 put object
         # textract analyze document
         # s3 object
@@ -187,7 +398,12 @@ class Multipagepdfa2IStack(core.Stack):
                     's3:GetObject',
                     'lambda:InvokeFunction',
                     'states:SendTaskSuccess',
+                    'states:SendTaskFailure',
                     'dynamodb:PutItem',
+                    'dynamodb:GetItem',
+                    'dynamodb:UpdateItem',
+                    'dynamodb:Query',
+                    'dynamodb:DeleteItem',
                     'textract:AnalyzeDocument',
                     'sqs:DeleteMessage',
                     'sqs:ReceiveMessage',
@@ -199,11 +415,33 @@ class Multipagepdfa2IStack(core.Stack):
                 ]
             )
         )
+        # !!!! analyzedoc lambda function
+        # textract start / get document analysis, textract reads the pdf with this role
+        # s3 get object / put object
+        # dynamodb - get / update item, shared textract rate
+        lam_roles["analyzedoc"].add_to_policy(
+            statement=aws_iam.PolicyStatement(
+                resources=['*'],
+                actions=[
+                    's3:GetObject',
+                    's3:PutObject',
+                    'textract:StartDocumentAnalysis',
+                    'textract:GetDocumentAnalysis',
+                    'dynamodb:GetItem',
+                    'dynamodb:UpdateItem',
+                    'sts:AssumeRole',
+                    "logs:CreateLogGroup",
+                    "logs:CreateLogStream",
+                    "logs:PutLogEvents"
+                ]
+            )
+        )
         # !!!! humancomplete lambda function
         # step functions send task success
         # s3 put_object
         # s3 Object
         # dynamodb table query
+        # dynamodb update item, result cache
 
         lam_roles["humancomplete"].add_to_policy(
             statement=aws_iam.PolicyStatement(
@@ -214,6 +452,7 @@ class Multipagepdfa2IStack(core.Stack):
                     's3:GetObject',
                     'states:SendTaskSuccess',
                     'dynamodb:Query',
+                    'dynamodb:UpdateItem',
                     'sts:AssumeRole',
                     "logs:CreateLogGroup",
                     "logs:CreateLogStream",
@@ -222,7 +461,7 @@ class Multipagepdfa2IStack(core.Stack):
             )
         )
         # !!!! wrapup lambda function
-        # s3 put object
+        # s3 put object / multipart upload
         # s3 list object v2
         # s3 delete object
         # dynamodb query
@@ -233,6 +472,7 @@ class Multipagepdfa2IStack(core.Stack):
                     's3:Object',
                     's3:GetObject',
                     's3:PutObject',
+                    's3:AbortMultipartUpload',
                     's3:DeleteObject',
                     's3:ListBucket',
                     'sts:AssumeRole',
@@ -245,19 +485,77 @@ class Multipagepdfa2IStack(core.Stack):
 
         return lam_roles
 
+    def create_shared_layer(self):
+        # code shared by the python lambdas, lands in /opt/python
+        return aws_lambda.LayerVersion(
+            scope=self,
+            id="multipagepdfa2i_layer",
+            layer_version_name="multipagepdfa2i_layer",
+            code=aws_lambda.Code.from_asset("./deploy_code/multipagepdfa2i_layer/"),
+            compatible_runtimes=[aws_lambda.Runtime.PYTHON_3_8]
+        )
+
     def create_lambda_functions(self, services):
         lambda_functions = {}
-        
+
+        # the rasterizer jar is built from source at synth time, in the lambda java build image
+        # (needs Docker), and shared by pngextract and pagecount
+        pngextract_code = aws_lambda.Code.from_asset(
+            "./deploy_code/multipagepdfa2i_pngextract",
+            exclude=["target", "multipagepdfa2i_pngextract.jar"],
+            bundling=core.BundlingOptions(
+                image=aws_lambda.Runtime.JAVA_11.bundling_docker_image,
+                command=["bash", "-c", " && ".join([
+                    "cp -r /asset-input /tmp/build",
+                    "cd /tmp/build",
+                    "mvn -q -Dmaven.repo.local=/tmp/.m2 package",
+                    "mkdir -p /asset-output/lib",
+                    "cp multipagepdfa2i_pngextract.jar /asset-output/lib/"
+                ])]
+            )
+        )
+
         lambda_functions["pngextract"] = aws_lambda.Function(
             scope=self,
             id="multipagepdfa2i_pngextract",
             function_name="multipagepdfa2i_pngextract",
-            code=aws_lambda.Code.from_asset("./deploy_code/multipagepdfa2i_pngextract/multipagepdfa2i_pngextract.jar"),
+            code=pngextract_code,
             handler="Lambda::handleRequest",
             runtime=aws_lambda.Runtime.JAVA_11,
             timeout=core.Duration.minutes(15),
             memory_size=3000,
-            role=services["lam_roles"]["pngextract"]
+            role=services["lam_roles"]["pngextract"],
+            environment={
+                # render_threads defaults to the number of cpus
+                "upload_threads": "8",
+                "in_flight_memory_mb": "1024",
+                # page image encoding profile: image_color rgb | gray | binary, image_format png | jpeg,
+                # jpeg_quality, png_compression, measure_savings (see ImageEncoding.java)
+                "image_color": "rgb",
+                "image_format": "png",
+                # passthrough uploads scanned pages from their embedded image, render renders every page
+                "embedded_images": "passthrough",
+                # spool the PDF to /tmp and keep at most this much of each open document in the heap
+                "pdf_load_mode": "disk",
+                "pdf_max_main_memory_mb": "64"
+            }
+        )
+
+        lambda_functions["pagecount"] = aws_lambda.Function(
+            scope=self,
+            id="multipagepdfa2i_pagecount",
+            function_name="multipagepdfa2i_pagecount",
+            code=pngextract_code,
+            handler="PageCount::handleRequest",
+            runtime=aws_lambda.Runtime.JAVA_11,
+            timeout=core.Duration.minutes(5),
+            memory_size=1024,
+            role=services["lam_roles"]["pngextract"],
+            environment={
+                "pages_per_chunk": "50",
+                "pdf_load_mode": "disk",
+                "pdf_max_main_memory_mb": "64"
+            }
         )
 
         lambda_functions["analyzepdf"] = aws_lambda.Function(
@@ -270,9 +568,41 @@ class Multipagepdfa2IStack(core.Stack):
                 timeout=core.Duration.minutes(3),
                 memory_size=3000,
                 role=services["lam_roles"]["analyzepdf"],
+                layers=[services["layer"]],
+                reserved_concurrent_executions=ANALYZEPDF_CONCURRENCY,
                 environment= {
                     "sqs_url": services["textract_sqs"].queue_url,
-                    "human_workflow_arn": SAGEMAKER_WORKFLOW_AUGMENTED_AI_ARN_EV
+                    # the page's task is failed on its last receive before the dead letter queue
+                    "max_receive_count": str(TEXTRACT_MAX_RECEIVE_COUNT),
+                    "human_workflow_arn": SAGEMAKER_WORKFLOW_AUGMENTED_AI_ARN_EV,
+                    "page_workers": str(ANALYZEPDF_PAGE_WORKERS),
+                    # adaptive textract rate limit, learned rate shared through the coordination table
+                    "textract_tps": "5",
+                    "textract_max_tps": "50",
+                    "coordination_table": services["coordination_table"].table_name,
+                    # content addressed cache of page results, skips textract for pages seen before
+                    "result_cache": "true",
+                    "result_cache_ttl_days": "30",
+                    "result_cache_entries": "256"
+                }
+        )
+
+        lambda_functions["analyzedoc"] = aws_lambda.Function(
+                scope=self,
+                id="multipagepdfa2i_analyzedoc",
+                function_name="multipagepdfa2i_analyzedoc",
+                code=aws_lambda.Code.from_asset("./deploy_code/multipagepdfa2i_analyzedoc/"),
+                handler="lambda_function.lambda_handler",
+                runtime=aws_lambda.Runtime.PYTHON_3_8,
+                timeout=core.Duration.minutes(15),
+                memory_size=3000,
+                role=services["lam_roles"]["analyzedoc"],
+                layers=[services["layer"]],
+                environment= {
+                    "write_workers": "16",
+                    "textract_get_tps": "5",
+                    "textract_get_max_tps": "10",
+                    "coordination_table": services["coordination_table"].table_name
                 }
         )
 
@@ -288,9 +618,24 @@ class Multipagepdfa2IStack(core.Stack):
                 runtime=aws_lambda.Runtime.PYTHON_3_8,
                 timeout=core.Duration.minutes(15),
                 memory_size=3000,
-                role=services["lam_roles"][name]
+                role=services["lam_roles"][name],
+                layers=[services["layer"]]
             )
 
+        # parse the A2I output incrementally instead of loading it whole
+        lambda_functions["humancomplete"].add_environment("stream_human_output", "true")
+        # adds reviewed answers to the result cache
+        lambda_functions["humancomplete"].add_environment("result_cache", "true")
+        lambda_functions["humancomplete"].add_environment("coordination_table", services["coordination_table"].table_name)
+        # number of page results wrapup downloads at once
+        lambda_functions["wrapup"].add_environment("fetch_workers", "16")
+        # number of DeleteObjects requests wrapup runs at once
+        lambda_functions["wrapup"].add_environment("cleanup_workers", "8")
+        # typed outputs next to the csv: "jsonl", "parquet" (needs pyarrow in the layer) or both, comma separated.
+        # Off by default, they make wrapup read every page's json outputs instead of stitching the csv fragments
+        lambda_functions["wrapup"].add_environment("output_formats", "")
+        lambda_functions["wrapup"].add_environment("parquet_row_group_size", "50000")
+
         return lambda_functions
 
     def create_events(self, services):
@@ -307,17 +652,19 @@ class Multipagepdfa2IStack(core.Stack):
                 aws_s3.NotificationKeyFilter(prefix="uploads/", suffix=extension)
             )    
         
+        # kickoff starts the executions of a batch concurrently and only leaves failed messages on the queue
         services["lambda"]["kickoff"].add_event_source(
             aws_lambda_event_sources.SqsEventSource(
                 services["sf_sqs"], 
-                batch_size=1
+                batch_size=10
             )
         )
         
+        # analyzepdf runs the pages of a batch concurrently, page_workers wide
         services["lambda"]["analyzepdf"].add_event_source(
             aws_lambda_event_sources.SqsEventSource(
                 services["textract_sqs"], 
-                batch_size=1
+                batch_size=10
             )
         )
 
@@ -339,6 +686,7 @@ class Multipagepdfa2IStack(core.Stack):
         # S3 bucket
         services["main_s3_bucket"] = aws_s3.Bucket(self, "multipagepdfa2i", removal_policy=core.RemovalPolicy.DESTROY)
         self.configure_dynamo_table("multia2ipdf_callback", "jobid", "callback_token")
+        services["coordination_table"] = self.create_coordination_table()
 
         services["sf_sqs"] = aws_sqs.Queue(
             self, "multipagepdfa2i_sf_sqs",
@@ -346,14 +694,30 @@ class Multipagepdfa2IStack(core.Stack):
             visibility_timeout=core.Duration.minutes(5)
         )
 
+        # pages analyzepdf keeps failing on (e.g. a missing page image) end up here instead of
+        # coming back forever, their executions fail
+        services["textract_dlq"] = aws_sqs.Queue(
+            self, "multipagepdfa2i_textract_dlq",
+            queue_name = "multipagepdfa2i_textract_dlq",
+            retention_period=core.Duration.days(14)
+        )
+
         services["textract_sqs"] = aws_sqs.Queue(
             self, "multipagepdfa2i_textract_sqs",
             queue_name = "multipagepdfa2i_textract_sqs",
-            visibility_timeout=core.Duration.minutes(3)
+            # six times analyzepdf's timeout, as AWS advises for lambda event sources: a batch
+            # slowed down by the rate limiter or the poller's throttled retries isn't received
+            # again while it is still running
+            visibility_timeout=core.Duration.minutes(18),
+            dead_letter_queue=aws_sqs.DeadLetterQueue(
+                max_receive_count=TEXTRACT_MAX_RECEIVE_COUNT,
+                queue=services["textract_dlq"]
+            )
         )
         
 
         services["lam_roles"] = self.create_iam_role_for_lambdas()
+        services["layer"] = self.create_shared_layer()
         services["lambda"] = self.create_lambda_functions(services)
 
         services["sf"] = self.create_state_machine(services)
@@ -369,9 +733,22 @@ class Multipagepdfa2IStack(core.Stack):
                 timeout=core.Duration.minutes(5),
                 memory_size=3000,
                 role=services["lam_roles"]["kickoff"],
+                layers=[services["layer"]],
                 environment= {
                     "sqs_url": services["sf_sqs"].queue_url,
-                    "state_machine_arn": services["sf"].state_machine_arn
+                    "state_machine_arn": services["sf"].state_machine_arn,
+                    "start_workers": "10",
+                    # pages: one png and AnalyzeDocument call per page (with human review),
+                    # async: pdfs go whole to asynchronous textract document analysis
+                    "textract_mode": "pages",
+                    # execution names come from the object (bucket, key, etag), so duplicate events
+                    # start nothing; above 0, identical content under another key is skipped for
+                    # this many seconds after the first upload
+                    "coordination_table": services["coordination_table"].table_name,
+                    "inflight_window_seconds": "0",
+                    # resuming a failed document counts its pages and chunks them like pagecount
+                    "pagecount_function": services["lambda"]["pagecount"].function_name,
+                    "pages_per_chunk": "50"
                 }
         )
 
@@ -0,0 +1,280 @@
+# /*
+#  * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#  * SPDX-License-Identifier: MIT-0
+#  *
+#  * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  * software and associated documentation files (the "Software"), to deal in the Software
+#  * without restriction, including without limitation the rights to use, copy, modify,
+#  * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  * permit persons to whom the Software is furnished to do so.
+#  *
+#  * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#  */
+
+
+# Rebuilds each document's timeline from the span records the lambdas log (spans.py,
+# Spans.java) and reports where the time went:
+#
+# - per document: the critical path from upload to the end of wrapup (time queued for
+#   kickoff, rasterizing, the page that finished last with its time queued in SQS, analysis,
+#   wait for the human review and humancomplete, then wrapup), the gaps between them
+#   (state machine transitions), and the pages that waited on humans
+# - per stage: p50/p95/p99 over all documents and pages
+#
+# Input is log text with one record per line, e.g. the lambdas' log groups exported with
+#   aws logs filter-log-events --log-group-name /aws/lambda/<function> --filter-pattern '"trace"' \
+#       --start-time <ms> --query 'events[].message' --output text
+# Anything before the record on a line (timestamps, request ids) is ignored.
+#
+#   python tools/trace_report.py [--id <document id>] [--top 10] [--json] [log files ...]
+
+import argparse
+import json
+import sys
+from collections import defaultdict, deque
+
+STAGES = [
+    "kickoff_queue", "kickoff", "pagecount", "render_chunk", "rasterize", "native_pdf",
+    "page_queue", "page_analysis", "human_wait", "human_review", "humancomplete",
+    "wrapup_wait", "wrapup", "end_to_end"
+]
+
+def read_records(lines):
+    decoder = json.JSONDecoder()
+    for line in lines:
+        position = line.find('{"trace"')
+        if position < 0:
+            continue
+        try:
+            record, _ = decoder.raw_decode(line, position)
+        except ValueError:
+            continue
+        if record.get("id") and record.get("event") in ("start", "end"):
+            yield record
+
+def span_key(record):
+    return (record["trace"], record["id"], record.get("page"), record.get("first_page"), record.get("action"))
+
+def build_spans(records):
+    # id -> spans, {"name", "page", "start", "end", "fields"}; end is None for spans that never
+    # ended (the lambda timed out or its log is missing). Fields of both records are merged.
+    starts = defaultdict(deque)
+    documents = defaultdict(list)
+    for record in sorted(records, key=lambda record: (record["ts"], record["event"] == "start")):
+        fields = {k: v for k, v in record.items() if k not in ("trace", "event", "id", "page", "ts")}
+        if record["event"] == "start":
+            span = {"name": record["trace"], "page": record.get("page"), "start": record["ts"], "end": None, "fields": fields}
+            starts[span_key(record)].append(span)
+            documents[record["id"]].append(span)
+            continue
+        waiting = starts[span_key(record)]
+        if waiting:
+            span = waiting.popleft()
+        else:
+            # the start record is missing, the duration tells when it started
+            span = {"name": record["trace"], "page": record.get("page"), "start": record["ts"] - fields.get("duration_ms", 0) / 1000, "fields": {}}
+            documents[record["id"]].append(span)
+        span["end"] = record["ts"]
+        span["fields"].update(fields)
+    return documents
+
+def last_of(spans, name, page=None):
+    # the last attempt that ended without an error, else the last attempt
+    found = [span for span in spans if span["name"] == name and (page is None or span["page"] == page)]
+    done = [span for span in found if span["end"] is not None and "error" not in span["fields"]]
+    return (done or found or [None])[-1]
+
+def between(start, end):
+    if start is None or end is None:
+        return None
+    return end - start
+
+def page_timeline(spans, page):
+    analysis = last_of(spans, "page", page)
+    timeline = {
+        "page": page,
+        "attempts": sum(1 for span in spans if span["name"] == "page" and span["page"] == page),
+        "sent": analysis["fields"].get("sent"),
+        "analysis_start": analysis["start"],
+        "analysis_end": analysis["end"],
+        "outcome": analysis["fields"].get("outcome"),
+        "done": analysis["end"]
+    }
+    if timeline["outcome"] == "human_review":
+        human = last_of(spans, "humancomplete", page)
+        timeline["done"] = None
+        if human is not None:
+            timeline["human_start"] = human["start"]
+            timeline["human_end"] = human["end"]
+            timeline["human_review"] = between(human["fields"].get("loop_created"), human["fields"].get("loop_completed"))
+            timeline["done"] = human["end"]
+    return timeline
+
+def document_timeline(id, spans):
+    # a duplicate event finds the execution already started, its kickoff isn't the document's
+    kickoff = last_of([span for span in spans if not span["fields"].get("duplicate")], "kickoff")
+    wrapup = last_of(spans, "wrapup")
+    pagecount = last_of(spans, "pagecount")
+    renders = [span for span in spans if span["name"] == "render"]
+    native = [span for span in spans if span["name"] == "analyzedoc"]
+    pages = sorted(set(span["page"] for span in spans if span["name"] == "page"))
+    page_timelines = [page_timeline(spans, page) for page in pages]
+
+    first = min(span["start"] for span in spans)
+    uploaded = kickoff["fields"].get("uploaded") if kickoff else None
+    start = uploaded or (kickoff["fields"].get("sent") if kickoff else None) or first
+    end = wrapup["end"] if wrapup else None
+    document = {
+        "id": id,
+        "key": kickoff["fields"].get("key") if kickoff else None,
+        "start": start,
+        "end": end,
+        "end_to_end": between(start, end),
+        "complete": end is not None,
+        "pages": len(page_timelines) or sum(span["fields"].get("pages", 0) for span in native if span["fields"].get("action") == "collect"),
+        "human_pages": [timeline["page"] for timeline in page_timelines if timeline["outcome"] == "human_review"],
+        "retried_pages": [timeline["page"] for timeline in page_timelines if timeline["attempts"] > 1],
+        "unfinished_pages": [timeline["page"] for timeline in page_timelines if timeline["done"] is None],
+        "stages": defaultdict(list),
+        "critical_path": []
+    }
+    stages = document["stages"]
+    path = document["critical_path"]
+
+    def step(name, step_start, step_end, **fields):
+        if step_start is None:
+            return
+        path.append(dict({"step": name, "start": step_start, "end": step_end, "seconds": between(step_start, step_end)}, **fields))
+
+    if kickoff:
+        stages["kickoff_queue"].append(between(start, kickoff["start"]))
+        stages["kickoff"].append(between(kickoff["start"], kickoff["end"]))
+        step("queued for kickoff", start, kickoff["start"])
+        step("kickoff", kickoff["start"], kickoff["end"])
+    if pagecount:
+        stages["pagecount"].append(between(pagecount["start"], pagecount["end"]))
+        step("pagecount", pagecount["start"], pagecount["end"])
+    if renders:
+        stages["render_chunk"].extend(between(span["start"], span["end"]) for span in renders)
+        render_start = min(span["start"] for span in renders)
+        render_ends = [span["end"] for span in renders]
+        render_end = None if None in render_ends else max(render_ends)
+        stages["rasterize"].append(between(pagecount["start"] if pagecount else render_start, render_end))
+        step("render (%d chunks)" % len(renders), render_start, render_end)
+    if native:
+        native_end = last_of(native, "analyzedoc")["end"]
+        stages["native_pdf"].append(between(native[0]["start"], native_end))
+        step("native pdf analysis (%d calls)" % len(native), native[0]["start"], native_end)
+
+    for timeline in page_timelines:
+        stages["page_queue"].append(between(timeline["sent"], timeline["analysis_start"]))
+        stages["page_analysis"].append(between(timeline["analysis_start"], timeline["analysis_end"]))
+        if timeline["outcome"] == "human_review":
+            stages["human_wait"].append(between(timeline["analysis_end"], timeline.get("human_start")))
+            stages["human_review"].append(timeline.get("human_review"))
+            stages["humancomplete"].append(between(timeline.get("human_start"), timeline.get("human_end")))
+
+    # the page that finished last holds up wrapup, pages that never finished first
+    if page_timelines:
+        critical = max(page_timelines, key=lambda timeline: (timeline["done"] is None, timeline["done"] or 0))
+        document["critical_page"] = critical["page"]
+        step("page %d queued in sqs" % critical["page"], critical["sent"], critical["analysis_start"])
+        step("page %d analysis (%s)" % (critical["page"], critical["outcome"]), critical["analysis_start"], critical["analysis_end"], attempts=critical["attempts"])
+        if critical["outcome"] == "human_review":
+            step("page %d waiting on human review" % critical["page"], critical["analysis_end"], critical.get("human_start"))
+            step("page %d humancomplete" % critical["page"], critical.get("human_start"), critical.get("human_end"))
+        if wrapup:
+            stages["wrapup_wait"].append(between(critical["done"], wrapup["start"]))
+    if wrapup:
+        stages["wrapup"].append(between(wrapup["start"], wrapup["end"]))
+        step("wrapup", wrapup["start"], wrapup["end"])
+    if document["complete"]:
+        stages["end_to_end"].append(document["end_to_end"])
+
+    # the time between steps is state machine transitions and lambda starts
+    previous_end = None
+    for entry in path:
+        entry["gap_before"] = between(previous_end, entry["start"])
+        previous_end = entry["end"] if entry["end"] is not None else previous_end
+    document["human_wait"] = sum(between(timeline["analysis_end"], timeline.get("human_start")) or 0
+        for timeline in page_timelines if timeline["outcome"] == "human_review")
+    return document
+
+def percentiles(values):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return {"count": 0}
+    pick = lambda share: round(values[min(len(values) - 1, int(len(values) * share))], 3)
+    return {"count": len(values), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 3)}
+
+def aggregate(documents):
+    stages = defaultdict(list)
+    for document in documents:
+        for name, values in document["stages"].items():
+            stages[name].extend(values)
+    return {name: percentiles(stages[name]) for name in STAGES if name in stages}
+
+def seconds(value):
+    return "-" if value is None else "%.1fs" % value
+
+def print_document(document):
+    print("%s %s: %s end to end, %d pages, %d human reviewed%s" % (
+        document["id"], document["key"] or "", seconds(document["end_to_end"]), document["pages"],
+        len(document["human_pages"]), "" if document["complete"] else ", NOT COMPLETE"))
+    for entry in document["critical_path"]:
+        if entry["gap_before"] and entry["gap_before"] > 0.05:
+            print("    %9s  (transition)" % seconds(entry["gap_before"]))
+        print("    %9s  %s%s" % (seconds(entry["seconds"]), entry["step"], "" if entry["end"] is not None else ", never ended"))
+    if document["human_pages"]:
+        print("    %.1fs waiting on humans over pages %s" % (document["human_wait"], document["human_pages"]))
+    if document["retried_pages"]:
+        print("    retried pages %s" % document["retried_pages"])
+    if document["unfinished_pages"]:
+        print("    unfinished pages %s" % document["unfinished_pages"])
+
+def print_stages(stages):
+    print("%-14s %7s %9s %9s %9s %9s" % ("stage", "count", "p50 s", "p95 s", "p99 s", "max s"))
+    for name, stats in stages.items():
+        if not stats["count"]:
+            continue
+        print("%-14s %7d %9.3f %9.3f %9.3f %9.3f" % (name, stats["count"], stats["p50"], stats["p95"], stats["p99"], stats["max"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-document critical path and stage latencies from the span logs.")
+    parser.add_argument("files", nargs="*", help="log files, standard input when none")
+    parser.add_argument("--id", help="only this document")
+    parser.add_argument("--top", type=int, default=10, help="documents to show, slowest first")
+    parser.add_argument("--json", action="store_true", help="print the timelines and stages as JSON")
+    args = parser.parse_args()
+
+    records = []
+    for path in args.files or ["-"]:
+        if path == "-":
+            records.extend(read_records(sys.stdin))
+        else:
+            with open(path, errors="replace") as f:
+                records.extend(read_records(f))
+
+    spans = build_spans(records)
+    if args.id:
+        spans = {args.id: spans.get(args.id, [])} if args.id in spans else {}
+    documents = [document_timeline(id, document_spans) for id, document_spans in spans.items()]
+    # unfinished documents first, then the slowest
+    documents.sort(key=lambda document: (document["complete"], -(document["end_to_end"] or 0)))
+    stages = aggregate(documents)
+
+    if args.json:
+        print(json.dumps({"documents": documents, "stages": stages}, indent=2))
+        return
+    for document in documents[:args.top]:
+        print_document(document)
+        print()
+    print_stages(stages)
+
+if __name__ == "__main__":
+    main()